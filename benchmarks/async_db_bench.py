@@ -0,0 +1,82 @@
+"""
+Sync vs async database path of the screen-results endpoint under concurrent load.
+
+    DB_ASYNC_URL=... python benchmarks/async_db_bench.py --concurrency 10 50 100 200 --target-ms 200
+
+The sync path runs get_screened_stocks through Starlette's thread pool, as FastAPI does
+for a sync endpoint (40 threads by default); the async path awaits get_screened_stocks_async
+on an AsyncSession. For each concurrency level the benchmark reports throughput and
+latency percentiles, then the highest level whose p95 stays within the latency target.
+Uses the database configured in config.DB_CONFIG.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from database.async_db import async_session, dispose_async_engine
+from services.screen_results import get_screened_stocks_async
+from services.stock_analyzer import get_screened_stocks
+
+
+async def sync_request():
+    await run_in_threadpool(get_screened_stocks)
+
+
+async def async_request():
+    async with async_session() as db:
+        await get_screened_stocks_async(db)
+
+
+async def load(request, concurrency: int, duration: float) -> dict:
+    """`concurrency` clients issue requests back to back for `duration` seconds."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--target-ms", type=float, default=200.0, help="p95 latency target")
+    args = parser.parse_args()
+
+    for name, request in (("sync", sync_request), ("async", async_request)):
+        await request()  # 建立连接池，不计入结果
+        best = None
+        for concurrency in args.concurrency:
+            stats = await load(request, concurrency, args.duration)
+            print(f"{name:>5} c={concurrency:<4} {stats['rps']:8.1f} req/s  "
+                  f"p50 {stats['p50']:7.1f} ms  p95 {stats['p95']:7.1f} ms  p99 {stats['p99']:7.1f} ms")
+            if stats["p95"] <= args.target_ms:
+                best = concurrency
+        print(f"{name:>5}: highest concurrency with p95 <= {args.target_ms:.0f} ms: {best}")
+    await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
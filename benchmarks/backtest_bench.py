@@ -0,0 +1,89 @@
+"""
+Benchmark for the vectorized backtest: every trading day of the history is screened in one pass.
+
+    python benchmarks/backtest_bench.py --symbols 5000 --days 1250 --workers 1 --max-mb 1024
+
+1250 business days is about five years. Forward returns of a sample of trades are
+checked against a plain per-trade lookup in the long DataFrame, on --setups planted
+setups (see benchmarks.synthetic.plant_setups). Reports the peak memory allocated by
+the backtest (the matrix itself excluded) and the process's maximum RSS before and
+after it (generating the synthetic history has its own peak), and exits
+with status 1 when the peak exceeds --max-mb. With --workers > 1 the screening
+processes' memory is not included.
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+from benchmarks.synthetic import make_history, plant_setups
+from services.backtest import DEFAULT_HORIZONS, backtest_matrix
+from services.indicator_state import REBUILD_DAYS
+from services.screening_engine import pivot_fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=1250)
+    parser.add_argument("--workers", type=int, default=1, help="screening processes, 0 for every available core")
+    parser.add_argument("--entry", choices=("close", "next_open"), default="close")
+    parser.add_argument("--chunk-days", type=int, help="dates screened at a time, defaults to SCREEN_CONFIG")
+    parser.add_argument("--setups", type=int, default=200, help="symbols with a planted setup")
+    parser.add_argument("--max-mb", type=float, help="peak allocation allowed for the backtest")
+    args = parser.parse_args()
+
+    df = make_history(args.symbols, args.days)
+    plant_setups(df, args.setups)
+    started = time.perf_counter()
+    matrix = pivot_fields(df)
+    pivoted = time.perf_counter()
+    # Linux 上 ru_maxrss 的单位为 KB；生成合成数据本身的峰值也计入其中
+    rss_before_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    tracemalloc.start()
+    result = backtest_matrix(matrix, first_row=REBUILD_DAYS - 1, entry=args.entry, workers=args.workers,
+                             chunk_rows=args.chunk_days)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    finished = time.perf_counter()
+    rss_after_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    matrix_mb = sum(values.nbytes for values in matrix.fields.values()) / 2 ** 20
+
+    print(f"{args.symbols} symbols x {args.days} days: pivot {pivoted - started:.2f} s, "
+          f"screen + returns {finished - pivoted:.2f} s")
+    print(f"memory: backtest peak {peak_mb:.0f} MB over a {matrix_mb:.0f} MB matrix, "
+          f"process max RSS {rss_before_mb:.0f} MB before the backtest, {rss_after_mb:.0f} MB after")
+    print(f"{len(result.trades)} signals on {result.signal_days} of {result.trading_days} trading days")
+    for row in result.summary:
+        print(row)
+
+    failed = False
+    if args.entry == "close" and len(result.trades):
+        closes = df.set_index(["symbol", "trade_date"])["close"]
+        dates = np.array(sorted(df["trade_date"].unique()))
+        horizon = DEFAULT_HORIZONS[0]
+        mismatches = 0
+        for trade in result.trades.head(200).itertuples():
+            i = np.searchsorted(dates, trade.signal_date.date())
+            if i + horizon >= len(dates):
+                continue
+            expected = closes[(trade.symbol, dates[i + horizon])] / closes[(trade.symbol, dates[i])] - 1
+            mismatches += not np.isclose(expected, getattr(trade, f"return_{horizon}"))
+        print(f"forward return mismatches in a sample of trades: {mismatches}")
+        failed |= mismatches > 0
+
+    if args.max_mb is not None and peak_mb > args.max_mb:
+        print(f"FAIL: backtest peak {peak_mb:.0f} MB exceeds {args.max_mb:.0f} MB")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
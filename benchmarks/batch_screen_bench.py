@@ -0,0 +1,91 @@
+"""
+Benchmark for the batch screen (evaluate_strategies) at the limits the API accepts.
+
+    python benchmarks/batch_screen_bench.py --symbols 5000 --max-mb 256
+
+Runs SCREEN_CONFIG['max_strategies'] strategies with zhanhe windows up to
+SCREEN_CONFIG['max_zhanhe_window'], once with a few shared thresholds and once with a
+distinct threshold per strategy (the worst case), and reports time and the peak memory
+allocated by the evaluation. A sample of strategies is checked against rolling_count.
+Exits with status 1 when the peak exceeds --max-mb or a result differs.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+import config
+from benchmarks.synthetic import make_history
+from services.screening_engine import StrategyParams, compute_indicators, evaluate_strategies, pivot_fields, rolling_count
+
+
+def scenarios(rng) -> dict:
+    n = config.SCREEN_CONFIG["max_strategies"]
+    max_window = config.SCREEN_CONFIG["max_zhanhe_window"]
+    return {
+        "defaults": [StrategyParams() for _ in range(n)],
+        "shared thresholds": [
+            StrategyParams(zhanhe_max=float(rng.choice([2.0, 3.0, 5.0, 8.0])),
+                           zhanhe_window=int(rng.integers(1, max_window + 1)), zhanhe_days=int(rng.integers(1, 20)))
+            for _ in range(n)
+        ],
+        "distinct thresholds": [
+            StrategyParams(zhanhe_max=float(rng.uniform(1, 20)), zhanhe_window=max_window,
+                           zhanhe_days=int(rng.integers(1, max_window + 1)))
+            for _ in range(n)
+        ],
+    }
+
+
+def zhanhe_mismatches(indicators: dict, strategies: list, selected: np.ndarray, sample: int = 20) -> int:
+    """Compares the zhanhe condition of a sample of strategies with rolling_count; only meaningful for strategies whose other conditions are all off."""
+    mismatches = 0
+    for i in range(min(sample, len(strategies))):
+        s = strategies[i]
+        expected = rolling_count(indicators["zhanhe"] < s.zhanhe_max, s.zhanhe_window)[-1] >= s.zhanhe_days
+        mismatches += not np.array_equal(expected, selected[i])
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--max-mb", type=float, default=256, help="peak allocation allowed for one evaluation")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    strategies = scenarios(rng)
+    days = max(s.lookback for group in strategies.values() for s in group) + 1
+    matrix = pivot_fields(make_history(args.symbols, days))
+    indicators = compute_indicators(matrix.fields["close"])
+
+    failed = False
+    for name, group in strategies.items():
+        tracemalloc.start()
+        started = time.perf_counter()
+        selected = evaluate_strategies(matrix.fields, indicators, group)
+        elapsed = time.perf_counter() - started
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        failed |= peak_mb > args.max_mb
+        print(f"{name:<20} {len(group)} strategies x {args.symbols} symbols: {elapsed * 1000:8.1f} ms, "
+              f"peak {peak_mb:6.1f} MB, {int(selected.sum())} hits")
+
+    # 只保留粘合度条件，其余条件设为恒成立，逐个与 rolling_count 对照
+    loose = dict(rise_min=-np.inf, volume_ratio=0.0, turnover_min=-np.inf, turnover_max=np.inf,
+                 require_break_ma=False, require_golden_cross=False)
+    sample = [StrategyParams(**{**s.__dict__, **loose}) for s in strategies["shared thresholds"][:20]]
+    with np.errstate(invalid="ignore"):
+        mismatches = zhanhe_mismatches(indicators, sample, evaluate_strategies(matrix.fields, indicators, sample))
+    print(f"zhanhe count mismatches in a sample of strategies: {mismatches}")
+    sys.exit(1 if failed or mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
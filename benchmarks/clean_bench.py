@@ -0,0 +1,123 @@
+"""
+clean_stock_data micro-benchmark: the current single-pass cleaner against the legacy column-by-column one.
+
+    python benchmarks/clean_bench.py --rows 5000 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_history
+from helpers.data_cleaner import CLEAN_SCHEMA, FLOAT32_DECIMALS, NUMERIC_COLUMNS, clean_stock_data, translate_chinese_columns
+
+# Number of decimals each column is stored with in stock_data
+SCALES = {c: FLOAT32_DECIMALS.get(c, 2) for c in NUMERIC_COLUMNS}
+
+
+def legacy_clean_stock_data(df):
+    """The implementation before the rewrite, kept as the reference (minus its per-step INFO logging)."""
+    df = translate_chinese_columns(df)
+    df_cleaned = df.copy()
+    numeric_cols = df_cleaned.select_dtypes(include=np.number).columns
+    df_cleaned[numeric_cols] = df_cleaned[numeric_cols].fillna(0)
+    if 'name' in df_cleaned.columns:
+        df_cleaned['name'] = df_cleaned['name'].fillna('未知')
+    for col in NUMERIC_COLUMNS:
+        if col in df_cleaned.columns:
+            df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce')
+            df_cleaned[col] = df_cleaned[col].fillna(0)
+    df_cleaned['symbol'] = df_cleaned['symbol'].astype(str).str.strip()
+    if 'name' in df_cleaned.columns:
+        df_cleaned['name'] = df_cleaned['name'].str.strip()
+    df_cleaned = df_cleaned.drop_duplicates()
+    if 'close' in df_cleaned.columns:
+        df_cleaned = df_cleaned[df_cleaned['close'] >= 0]
+    columns_to_keep = list(CLEAN_SCHEMA)
+    if 'trade_date' in df_cleaned.columns:
+        columns_to_keep.append('trade_date')
+    return df_cleaned.reindex(columns=columns_to_keep)
+
+
+def make_raw(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A backfill-sized frame with AkShare's Chinese headers, some missing values and a few '-' placeholders."""
+    days = max(rows // 5000, 1)
+    history = make_history(min(rows, 5000), days, seed=seed).head(rows)
+    rng = np.random.default_rng(seed)
+    close = history["close"].to_numpy()
+    raw = pd.DataFrame({
+        "序号": np.arange(rows),
+        "代码": history["symbol"].to_numpy(),
+        "名称": history["name"].to_numpy(),
+        "日期": history["trade_date"].to_numpy(),
+        "最新价": close,
+        "涨跌幅": rng.uniform(-10, 10, rows).round(3),
+        "涨跌额": (close * 0.01).round(2),
+        "成交量": history["volume"].to_numpy().astype(np.float64),
+        "成交额": (close * history["volume"].to_numpy()).round(2),
+        "振幅": rng.uniform(0, 20, rows).round(3),
+        "最高": (close * 1.02).round(2),
+        "最低": (close * 0.98).round(2),
+        "今开": history["open"].to_numpy(),
+        "昨收": history["yesterday_close"].to_numpy(),
+        "换手率": history["turnover_ratio"].to_numpy(),
+        "市盈率-动态": rng.uniform(-500, 5000, rows).round(2),
+        "市净率": rng.uniform(0, 50, rows).round(2),
+        "总市值": rng.uniform(1e9, 2e12, rows).round(2),
+        "流通市值": rng.uniform(1e9, 2e12, rows).round(2),
+        "涨速": rng.uniform(-2, 2, rows).round(3),
+        "5分钟涨跌": rng.uniform(-2, 2, rows).round(3),
+        "60日涨跌幅": rng.uniform(-80, 300, rows).round(2),
+        "年初至今涨跌幅": rng.uniform(-80, 300, rows).round(2),
+    })
+    raw.loc[raw.sample(frac=0.01, random_state=seed).index, "市盈率-动态"] = np.nan
+    raw["市净率"] = raw["市净率"].astype(object)
+    raw.loc[raw.sample(frac=0.01, random_state=seed + 1).index, "市净率"] = "-"
+    return raw
+
+
+def check(expected: pd.DataFrame, actual: pd.DataFrame):
+    assert list(expected.columns) == list(actual.columns), "columns differ"
+    assert expected.index.equals(actual.index), "rows differ"
+    for column in expected.columns:
+        if column in SCALES:
+            a = np.round(expected[column].to_numpy(dtype=np.float64), SCALES[column])
+            b = np.round(actual[column].to_numpy(dtype=np.float64), SCALES[column])
+            assert np.array_equal(a, b, equal_nan=True), f"{column} differs"
+        else:
+            assert (expected[column].to_numpy() == actual[column].to_numpy()).all(), f"{column} differs"
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        raw = make_raw(rows)
+        check(legacy_clean_stock_data(raw), clean_stock_data(raw))
+        legacy = best_of(lambda: legacy_clean_stock_data(raw), args.repeat)
+        current = best_of(lambda: clean_stock_data(raw), args.repeat)
+        memory = clean_stock_data(raw).memory_usage(deep=False).sum() / legacy_clean_stock_data(raw).memory_usage(deep=False).sum()
+        print(f"{rows:>8} rows  legacy {legacy * 1000:8.1f} ms  current {current * 1000:8.1f} ms  "
+              f"speedup {legacy / current:5.1f}x  memory {memory:.0%} of legacy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Checks the query plans of the hot stock_data queries, so an index or schema change that
+turns one of them into a table scan fails loudly instead of slowing down production.
+
+    python benchmarks/explain_hot_queries.py            # database configured in config.DB_CONFIG
+    python benchmarks/explain_hot_queries.py --sqlite   # in-memory schema built from the models
+
+Every query runs under EXPLAIN (EXPLAIN QUERY PLAN on SQLite) and must use the expected
+index; queries marked covering must be answered from the index alone. On a partitioned
+MySQL table the date-bounded queries must also prune partitions. Exits with status 1 on
+any regression.
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import func, select
+
+from models.stock_model import StockData
+
+# 主键在计划中的名称因数据库而异，用这个占位名表示
+PRIMARY = "PRIMARY"
+
+
+@dataclass
+class HotQuery:
+    name: str
+    statement: object
+    # 表名 -> (期望的索引, 是否应为覆盖索引)
+    expected: dict = field(default_factory=dict)
+    date_bounded: bool = False
+
+
+def hot_queries(trade_date: date) -> list:
+    """The statements the screen, the backtest and the history endpoints run on every request or refresh."""
+    from services.history_loader import history_select
+    from services.history_query import history_statement, parse_fields
+    from services.screen_results import screened_stocks_statement
+
+    start_date = trade_date - timedelta(days=180)
+    return [
+        HotQuery(
+            "screen window (load_history)",
+            history_select(start_date, trade_date),
+            {"stock_data": ("idx_stock_date_screen", True)},
+            date_bounded=True,
+        ),
+        HotQuery(
+            "latest trade date",
+            select(func.max(StockData.trade_date)),
+            {"stock_data": ("idx_stock_date_screen", True)},
+        ),
+        HotQuery(
+            "window start (distinct dates)",
+            select(StockData.trade_date).where(StockData.trade_date <= trade_date).distinct()
+            .order_by(StockData.trade_date.desc()).limit(120),
+            {"stock_data": ("idx_stock_date_screen", True)},
+        ),
+        HotQuery(
+            "market page of one day (/api/stocks)",
+            history_statement(parse_fields("open,close,volume"), start_date=trade_date, end_date=trade_date, limit=100),
+            {"stock_data": ("idx_stock_date_screen", True)},
+            date_bounded=True,
+        ),
+        HotQuery(
+            "symbol history (/api/stocks/{symbol}/history)",
+            history_statement(symbols=["600000"], start_date=start_date, end_date=trade_date, limit=100),
+            {"stock_data": (PRIMARY, False)},
+            date_bounded=True,
+        ),
+        HotQuery(
+            "screen results (/api/stocks/screened)",
+            screened_stocks_statement(trade_date),
+            {"stock_indicators": ("idx_indicator_date_selected", False), "stock_data": (PRIMARY, False)},
+        ),
+    ]
+
+
+def _explain_mysql(connection, sql: str) -> dict:
+    """:return: table -> EXPLAIN row."""
+    return {row["table"]: row for row in connection.exec_driver_sql(f"EXPLAIN {sql}").mappings()}
+
+
+def check_mysql(connection, query: HotQuery, sql: str, partitioned: bool) -> list:
+    rows = _explain_mysql(connection, sql)
+    problems = []
+    for table, (index, covering) in query.expected.items():
+        row = rows.get(table)
+        if row is None:
+            # MIN/MAX 直接从索引端点读取时 MySQL 不再访问表
+            if any("optimized away" in (r["Extra"] or "") for r in rows.values()):
+                continue
+            problems.append(f"{table} missing from the plan")
+            continue
+        if row["type"] == "ALL":
+            problems.append(f"{table}: full table scan")
+        if row["key"] != index:
+            problems.append(f"{table}: uses {row['key']}, expected {index}")
+        if covering and "Using index" not in (row["Extra"] or ""):
+            problems.append(f"{table}: not covered by {index} ({row['Extra']})")
+        if partitioned and query.date_bounded and table == "stock_data" and row.get("partitions"):
+            if len(row["partitions"].split(",")) >= partitioned:
+                problems.append(f"{table}: reads all {partitioned} partitions")
+    return problems
+
+
+def check_sqlite(connection, query: HotQuery, sql: str) -> list:
+    details = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    problems = []
+    for table, (index, covering) in query.expected.items():
+        steps = [d for d in details if d.split(" ")[1:2] == [table]]
+        if not steps:
+            problems.append(f"{table} missing from the plan")
+            continue
+        names = (f"sqlite_autoindex_{table}_1", "PRIMARY KEY") if index == PRIMARY else (index,)
+        if not any(f"INDEX {n}" in d or n == "PRIMARY KEY" and n in d for d in steps for n in names):
+            problems.append(f"{table}: {'; '.join(steps)}, expected {index}")
+        elif covering and not any("COVERING INDEX" in d for d in steps):
+            problems.append(f"{table}: not covered by {index} ({'; '.join(steps)})")
+    return problems
+
+
+def run(engine, trade_date: date) -> int:
+    """Prints one line per query; :return: the number of failing queries."""
+    from database.migrations import partitions
+
+    failures = 0
+    with engine.connect() as connection:
+        partitioned = len(partitions(connection))
+        for query in hot_queries(trade_date):
+            sql = str(query.statement.compile(connection, compile_kwargs={"literal_binds": True}))
+            if connection.dialect.name == "mysql":
+                problems = check_mysql(connection, query, sql, partitioned)
+            else:
+                problems = check_sqlite(connection, query, sql)
+            failures += bool(problems)
+            print(f"{'FAIL' if problems else 'ok  '}  {query.name}")
+            for problem in problems:
+                print(f"        {problem}")
+    return failures
+
+
+def sqlite_engine():
+    """In-memory SQLite database with the schema of the models."""
+    from sqlalchemy import create_engine
+
+    import database
+    import models.stock_model  # noqa: F401
+
+    engine = create_engine("sqlite://")
+    database.Base.metadata.create_all(engine)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", action="store_true", help="Check against an in-memory SQLite schema")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(), help="Trade date of the queries")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        engine = sqlite_engine()
+    else:
+        from database import engine
+    failures = run(engine, args.date)
+    print(f"{failures} of {len(hot_queries(args.date))} hot queries regressed." if failures else "All hot queries use their indexes.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Start-up import cost of the entry points, from `python -X importtime`, checked against a budget.
+
+    python benchmarks/import_time.py                      # main against its default budget
+    python benchmarks/import_time.py --module services.scheduler_service   # what worker.py loads on start
+    python benchmarks/import_time.py --top 20
+    python benchmarks/import_time.py --ready              # start main's app and time /api/health/ready
+
+--ready runs the application's lifespan (database init, warmup) in-process through
+Starlette's TestClient and polls the readiness endpoint, so it needs the configured
+database. It reports the time from interpreter start-up to ready and the warmup steps,
+and checks the forbidden modules once the instance is ready: in the default worker mode
+warmup must not pull in the collection stack either.
+
+Exits with status 1 when the import time exceeds the budget or a forbidden module is imported,
+so it can run as a CI step.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default budget (milliseconds of cumulative import time) and modules that must not be imported, per entry point
+BUDGETS = {
+    "main": (1000, ["akshare", "pandas", "services.data_collector", "services.scheduler_service"]),
+    # worker.py defers its imports to main(); this is the stack it loads when it starts
+    "services.scheduler_service": (3000, []),
+}
+
+# Budget (milliseconds from interpreter start to /api/health/ready returning 200) and modules
+# that must not be loaded by then, with the scheduler in the worker (SCHEDULER_IN_API=false)
+READY_BUDGET = (5000, ["akshare", "pandas", "services.data_collector", "services.scheduler_service"])
+
+READY_PREFIX = "READY "
+
+READY_SCRIPT = f"READY_PREFIX = {READY_PREFIX!r}" + """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from starlette.testclient import TestClient
+# 测试客户端本身的导入时间不计入
+offset = time.perf_counter() - imported
+with TestClient(main.app) as client:
+    while client.get("/api/health/ready").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter() - offset
+    # 应用日志也写到 stdout，结果加前缀以便识别
+    print(READY_PREFIX + json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "ready_ms": (ready - started) * 1000,
+        "status": client.get("/api/health/ready").json(),
+        "modules": sorted(sys.modules),
+    }))
+"""
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+def measure(module: str) -> list:
+    """
+    Imports `module` in a fresh interpreter with -X importtime.
+
+    :return: [(name, self_us, cumulative_us, depth), ...] in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure_ready() -> dict:
+    """
+    Starts main's app in a fresh interpreter and polls /api/health/ready until it returns 200.
+
+    :return: import_ms, ready_ms, the readiness status and the loaded modules.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", READY_SCRIPT],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"starting main failed:\n{result.stderr[-2000:]}")
+    line = next(line for line in reversed(result.stdout.splitlines()) if line.startswith(READY_PREFIX))
+    return json.loads(line[len(READY_PREFIX):])
+
+
+def check_ready(args) -> bool:
+    """Reports the best of `args.runs` start-ups; :return: True when within budget."""
+    budget = args.budget_ms if args.budget_ms is not None else READY_BUDGET[0]
+    forbidden = READY_BUDGET[1] if args.forbid is None else args.forbid
+    runs = [measure_ready() for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["ready_ms"])
+
+    print(f"main: imported in {best['import_ms']:.1f} ms, ready in {best['ready_ms']:.1f} ms (best of {args.runs})")
+    for step in best["status"]["steps"]:
+        print(f"  warmup {step['name']:<10} {step['status']:<8} {step['seconds']}s {step['detail']}")
+    loaded = [m for m in forbidden if m in best["modules"]]
+    failed = False
+    if loaded:
+        print(f"FAIL: forbidden modules loaded by the time the instance is ready: {', '.join(loaded)}")
+        failed = True
+    if best["ready_ms"] > budget:
+        print(f"FAIL: {best['ready_ms']:.1f} ms to ready exceeds the budget of {budget:.0f} ms")
+        failed = True
+    if not failed:
+        print(f"OK: ready within the budget of {budget:.0f} ms")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Entry point module to import.")
+    parser.add_argument("--budget-ms", type=float, help="Import time budget, defaults to BUDGETS[module].")
+    parser.add_argument("--forbid", nargs="*", help="Modules that must not be imported, defaults to BUDGETS[module].")
+    parser.add_argument("--runs", type=int, default=3, help="Imports to measure; the fastest run is reported.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest top-level dependencies to list.")
+    parser.add_argument("--ready", action="store_true", help="Measure the time until main's app is ready.")
+    args = parser.parse_args()
+
+    if args.ready:
+        sys.exit(0 if check_ready(args) else 1)
+
+    default_budget, default_forbidden = BUDGETS.get(args.module, (None, []))
+    budget = args.budget_ms if args.budget_ms is not None else default_budget
+    forbidden = default_forbidden if args.forbid is None else args.forbid
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    rows = min(runs, key=lambda r: sum(c for _, _, c, depth in r if depth == 0))
+    total_ms = sum(c for _, _, c, depth in rows if depth == 0) / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms ({len(rows)} modules, best of {args.runs})")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    # Direct dependencies of the entry point and of its top-level packages
+    for name, self_us, cumulative_us, _ in sorted((r for r in rows if r[3] <= 1), key=lambda r: -r[2])[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    imported = {name for name, _, _, _ in rows}
+    loaded = [m for m in forbidden if m in imported]
+    failed = False
+    if loaded:
+        print(f"FAIL: forbidden modules imported: {', '.join(loaded)}")
+        failed = True
+    if budget is not None and total_ms > budget:
+        print(f"FAIL: {total_ms:.1f} ms exceeds the budget of {budget:.0f} ms")
+        failed = True
+    if not failed:
+        print(f"OK: within the budget of {budget:.0f} ms" if budget is not None else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Ingest benchmark against a local SQLite stand-in for MySQL.
+
+    python benchmarks/ingest_bench.py --rows 5000 --batch-sizes 1000 5000 20000
+
+Without --url the SQLite file lives in a temporary directory that is removed afterwards.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.synthetic import make_history
+from database import Base
+from database.bulk_loader import bulk_insert_frame
+from models.stock_model import StockData
+
+
+def make_frame(rows: int):
+    days = max(rows // 5000, 1)
+    df = make_history(min(rows, 5000), days).head(rows)
+    for column in ("change_percent", "change_amount", "turnover_value", "amplitude", "high", "low",
+                   "pe_ttm", "pb", "market_value", "circulation_market_value"):
+        df[column] = df["close"]
+    return df
+
+
+def run(engine_url: str, df, label: str, load):
+    engine = create_engine(engine_url)
+    Base.metadata.drop_all(engine, tables=[StockData.__table__])
+    Base.metadata.create_all(engine, tables=[StockData.__table__])
+    with Session(engine) as db:
+        started = time.perf_counter()
+        load(db)
+        db.commit()
+        seconds = time.perf_counter() - started
+    engine.dispose()
+    print(f"{label:<32} {len(df) / seconds:>12,.0f} rows/s  ({seconds:.3f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--url", help="any SQLAlchemy URL, defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+
+    def mappings(db):
+        data = [{str(k): v for k, v in record.items()} for record in df.to_dict(orient="records")]
+        db.bulk_insert_mappings(StockData.__mapper__, data)
+
+    with tempfile.TemporaryDirectory(prefix="ingest_bench_") as workdir:
+        url = args.url or f"sqlite:///{os.path.join(workdir, 'bench_ingest.sqlite')}"
+        run(url, df, "bulk_insert_mappings (old)", mappings)
+        for batch_size in args.batch_sizes:
+            run(url, df, f"bulk_insert_frame batch={batch_size}",
+                lambda db: bulk_insert_frame(db.connection(), StockData.__table__, df, batch_size=batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Scaling of the sharded process-pool screen from 1 to N processes.
+
+    python benchmarks/parallel_screen_bench.py --symbols 5000 --days 500 --workers 1 2 4 8
+
+Each process count gets its own warmed-up pool, so the timings exclude process start-up.
+--setups symbols get a planted setup (see benchmarks.synthetic.plant_setups), so there are
+hits to compare: every result must contain them and equal the single-process one, otherwise
+the bench exits with status 1.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+from benchmarks.synthetic import make_history, plant_setups
+from services.parallel_screen import available_cores, get_pool, parallel_screen_hits
+from services.screening_engine import pivot_fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=500, help="500 business days is about two years")
+    parser.add_argument("--workers", type=int, nargs="+", help="process counts, defaults to 1, 2, 4 ... available cores")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--setups", type=int, default=200, help="symbols with a planted setup")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    workers = args.workers or sorted({1, *[2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores], cores})
+    df = make_history(args.symbols, args.days)
+    planted = plant_setups(df, args.setups)
+    matrix = pivot_fields(df)
+    expected = {(np.searchsorted(matrix.dates, np.datetime64(d, "D")), np.searchsorted(matrix.symbols, s))
+                for s, d in planted.items()}
+    print(f"{args.symbols} symbols x {args.days} days, {len(planted)} planted setups, {cores} available cores")
+
+    baseline = None
+    serial_hits = None
+    failed = False
+    for n in workers:
+        if n > 1:
+            get_pool(n).submit(int).result()  # 启动进程池，不计入耗时
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            hits = parallel_screen_hits(matrix, n)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        if serial_hits is None:
+            baseline, serial_hits = best, hits
+        identical = all(np.array_equal(a, b) for a, b in zip(hits[:2], serial_hits[:2])) and all(
+            np.array_equal(hits[2][k], serial_hits[2][k], equal_nan=True) for k in hits[2]
+        )
+        found = len(hits[0]) > 0 and expected <= set(zip(hits[0].tolist(), hits[1].tolist()))
+        failed |= not (identical and found)
+        print(f"{n:>3} processes: best {best * 1000:8.1f} ms, speedup {baseline / best:5.2f}x, "
+              f"{len(hits[0])} hits, planted found: {found}, identical: {identical}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark for the matrix screening engine: pivoting the long stock_data frame and screening every day
+(what the backtest and the cube screen run).
+
+    python benchmarks/screen_engine_bench.py --symbols 5000 --days 250 --check
+
+--setups symbols get a planted setup (see benchmarks.synthetic.plant_setups), so the screen
+has hits; --check requires them and exits with status 1 on any difference from the reference.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_history, plant_setups
+from services.parallel_screen import parallel_screen_hits
+from services.screening_engine import CONDITION_COLUMNS, pivot_fields, screen_matrix
+
+
+def reference_conditions(df: pd.DataFrame) -> pd.DataFrame:
+    """Plain pandas implementation of the TDX conditions, grouped per symbol. Used only to check results."""
+    frames = []
+    for _, g in df.sort_values(["symbol", "trade_date"]).groupby("symbol", sort=False):
+        g = g.copy()
+        for w in (5, 10, 20, 30, 60, 120):
+            # pandas accumulates float error; rounding restores exact ties such as open == ma10
+            g[f"ma{w}"] = g["close"].rolling(w).mean().round(8)
+        mas = g[["ma5", "ma10", "ma20", "ma30", "ma60"]]
+        g["zhanhe"] = (mas.max(axis=1) / mas.min(axis=1) - 1) * 100
+        g["zhanhe_less_3"] = (g["zhanhe"] < 3).rolling(15).sum() >= 10
+        g["rise_5"] = (g["close"] - g["yesterday_close"]) / g["yesterday_close"] > 0.05
+        g["vol_up"] = g["volume"] > g["volume"].shift(1) * 1.5
+        up2 = (g["close"] > g["ma5"]) & (g["close"] > g["ma10"]) & ((g["open"] < g["ma5"]) | (g["open"] < g["ma10"]))
+        up3 = (g["close"] > g["ma5"]) & (g["close"] > g["ma10"]) & (g["close"] > g["ma20"]) & ((g["open"] < g["ma5"]) | (g["open"] < g["ma10"]) | (g["open"] < g["ma20"]))
+        up4 = up3 & (g["close"] > g["ma30"]) | ((g["close"] > g["ma5"]) & (g["close"] > g["ma10"]) & (g["close"] > g["ma20"]) & (g["close"] > g["ma30"]) & (g["open"] < g["ma30"]))
+        g["break_ma"] = up2 | up3 | up4
+        g["turnover_ratio_condition"] = (g["turnover_ratio"] >= 2) & (g["turnover_ratio"] <= 5)
+        g["golden_cross"] = (g["ma60"] > g["ma120"]) & (g["ma60"].shift(1) <= g["ma120"].shift(1))
+        frames.append(g)
+    return pd.concat(frames)
+
+
+def check(df: pd.DataFrame, hits: set, planted: dict) -> bool:
+    """
+    Compares every condition of the engine with the pandas reference, cell by cell, and
+    checks that the screen found every planted setup. :return: True when everything matches.
+    """
+    matrix = pivot_fields(df)
+    _, conditions, _ = screen_matrix(matrix)
+    expected = reference_conditions(df)
+    ok = True
+    for name in CONDITION_COLUMNS:
+        reference = pivot_fields(expected.assign(flag=expected[name].astype(float)), fields=("flag",)).fields["flag"] == 1
+        identical = np.array_equal(conditions[name], reference)
+        ok &= identical
+        print(f"{name:<26} hits {int(conditions[name].sum()):>8}  identical: {identical}")
+    found = sum((symbol, np.datetime64(trade_date, "D")) in hits for symbol, trade_date in planted.items())
+    print(f"planted setups found: {found} of {len(planted)}")
+    return ok and len(hits) > 0 and found == len(planted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="compare hits with the per-symbol pandas reference")
+    parser.add_argument("--setups", type=int, default=200, help="symbols with a planted setup")
+    args = parser.parse_args()
+
+    df = make_history(args.symbols, args.days)
+    planted = plant_setups(df, args.setups)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        matrix = pivot_fields(df)
+        date_pos, symbol_pos, _ = parallel_screen_hits(matrix)
+        timings.append(time.perf_counter() - started)
+    hits = set(zip(matrix.symbols[symbol_pos], matrix.dates[date_pos]))
+    print(f"{args.symbols} symbols x {args.days} days: {len(hits)} hits, "
+          f"best {min(timings) * 1000:.1f} ms, median {np.median(timings) * 1000:.1f} ms")
+
+    if args.check and not check(df, hits, planted):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+def make_history(n_symbols: int = 5000, n_days: int = 250, seed: int = 0, start: str = "2024-01-02") -> pd.DataFrame:
+    """
+    Generates a random-walk stock_data style frame with one row per (symbol, trade_date).
+
+    :param n_symbols: Number of symbols.
+    :param n_days: Number of consecutive business days.
+    :param seed: RNG seed, so runs are reproducible.
+    :param start: First trade date.
+    :return: Long DataFrame with the columns used by the screen.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days).date
+    symbols = np.array([f"{600000 + i:06d}" for i in range(n_symbols)])
+
+    returns = rng.normal(0.0005, 0.02, size=(n_days, n_symbols))
+    close = 10 * np.exp(np.cumsum(returns, axis=0))
+    yesterday_close = np.vstack([close[:1] / (1 + returns[:1]), close[:-1]])
+    open_ = yesterday_close * (1 + rng.normal(0, 0.01, size=close.shape))
+    volume = rng.integers(10_000, 5_000_000, size=close.shape)
+    turnover_ratio = rng.uniform(0.1, 8.0, size=close.shape)
+
+    return pd.DataFrame(
+        {
+            "symbol": np.tile(symbols, n_days),
+            "trade_date": np.repeat(dates, n_symbols),
+            "name": np.tile(symbols, n_days),
+            "open": open_.ravel().round(2),
+            "close": close.ravel().round(2),
+            "yesterday_close": yesterday_close.ravel().round(2),
+            "volume": volume.ravel(),
+            "turnover_ratio": turnover_ratio.ravel().round(3),
+        }
+    )
+
+
+# 完整的选股形态至少需要的交易日数：MA120 及其前一日
+SETUP_MIN_DAY = 130
+
+
+def plant_setups(df: pd.DataFrame, n_symbols: int = 200, seed: int = 0) -> dict:
+    """
+    Rewrites the bars of `n_symbols` random symbols in place so that every screen condition
+    holds on one day: a flat close of 10.00 (all MAs equal, zhanhe 0) that jumps to 10.60
+    (+6%, open below every MA, MA60 crossing MA120) on 1.6x the volume, turnover 3%.
+    A random walk almost never meets all conditions at once, so without planted setups
+    a screen bench would only compare empty results.
+
+    :param df: Frame from make_history, with at least SETUP_MIN_DAY + 1 trade dates.
+    :param n_symbols: Symbols to rewrite.
+    :param seed: RNG seed.
+    :return: {symbol: trade_date of its setup}; the screen must report these (symbol, date) pairs.
+    """
+    dates = np.sort(df["trade_date"].unique())
+    if len(dates) <= SETUP_MIN_DAY:
+        raise ValueError(f"plant_setups needs more than {SETUP_MIN_DAY} trade dates, got {len(dates)}")
+    rng = np.random.default_rng(seed)
+    symbols = rng.choice(df["symbol"].unique(), min(n_symbols, df["symbol"].nunique()), replace=False)
+    jump_days = dict(zip(symbols, rng.integers(SETUP_MIN_DAY, len(dates), size=len(symbols))))
+
+    day = np.searchsorted(dates, df["trade_date"].to_numpy())
+    jump = df["symbol"].map(jump_days).to_numpy(dtype=float)
+    planted = ~np.isnan(jump)
+    day, jump = day[planted], jump[planted]
+    yesterday_close = np.where(day > jump, 10.6, 10.0)
+    df.loc[planted, "close"] = np.where(day >= jump, 10.6, 10.0)
+    df.loc[planted, "yesterday_close"] = yesterday_close
+    df.loc[planted, "open"] = yesterday_close
+    df.loc[planted, "volume"] = np.where(day == jump, 1_600_000, 1_000_000)
+    df.loc[planted, "turnover_ratio"] = 3.0
+    return {symbol: dates[d] for symbol, d in jump_days.items()}
@@ -6,7 +6,30 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 3306)),
     'user': os.getenv('DB_USER', 'root'),
     'password': os.getenv('DB_PASSWORD', '123456'),
-    'database': os.getenv('DB_NAME', 'stock_monitor')
+    'database': os.getenv('DB_NAME', 'stock_monitor'),
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),  # 常驻连接数
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),  # 高峰时可额外建立的连接数
+    'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),  # 等待空闲连接的秒数，超时抛出异常
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),  # 连接使用多少秒后重建，需小于 MySQL 的 wait_timeout
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',  # 取出连接前先检测，避免使用已被服务端断开的连接
+    'async_driver': os.getenv('DB_ASYNC_DRIVER', 'aiomysql'),  # 只读接口使用的异步驱动：aiomysql 或 asyncmy
+    'async_url': os.getenv('DB_ASYNC_URL', ''),  # 可选，完整的异步连接串，例如本地测试用 sqlite+aiosqlite:///stock.db
+}
+
+# 入库配置
+INGEST_CONFIG = {
+    'mode': os.getenv('INGEST_MODE', 'executemany'),  # executemany 或 load_data (LOAD DATA LOCAL INFILE)
+    'batch_size': int(os.getenv('INGEST_BATCH_SIZE', 5000)),  # 每批写入的行数
+}
+
+# 历史数据回补配置
+BACKFILL_CONFIG = {
+    'max_workers': int(os.getenv('BACKFILL_MAX_WORKERS', 8)),  # 并发请求的线程数
+    'requests_per_second': float(os.getenv('BACKFILL_RPS', 5)),  # 所有线程合计的请求速率上限
+    'max_retries': int(os.getenv('BACKFILL_MAX_RETRIES', 3)),  # 单只股票的最大尝试次数
+    'retry_backoff': float(os.getenv('BACKFILL_RETRY_BACKOFF', 1.0)),  # 首次重试前等待的秒数，之后逐次翻倍
+    'chunk_size': int(os.getenv('BACKFILL_CHUNK_SIZE', 200)),  # 每批入库并记录检查点的股票数
+    'checkpoint_dir': os.getenv('BACKFILL_CHECKPOINT_DIR', 'data/backfill'),  # 检查点文件目录
 }
 
 # AkShare 配置
@@ -16,5 +39,56 @@ AKSHARE_CONFIG = {
 
 # 定时任务配置
 SCHEDULER_CONFIG = {
-    'timezone': 'Asia/Shanghai'
-}
\ No newline at end of file
+    'timezone': 'Asia/Shanghai',
+    'run_in_api': os.getenv('SCHEDULER_IN_API', 'false').lower() == 'true',  # 是否在 API 进程中运行定时任务，默认由 worker.py 运行
+    'lock_name': os.getenv('SCHEDULER_LOCK_NAME', 'stock_monitor_scheduler'),  # 保证只有一个进程运行定时任务的数据库锁名
+    'lock_retry': float(os.getenv('SCHEDULER_LOCK_RETRY', 15)),  # 未持有锁时重试、持有锁时检查锁的间隔 (秒)
+    'trading_sessions': [('09:30', '11:30'), ('13:00', '15:00')],  # 连续竞价时段 (交易所时区)
+    'intraday_enabled': os.getenv('INTRADAY_ENABLED', 'false').lower() == 'true',  # 是否开启盘中轮询
+    'intraday_interval': int(os.getenv('INTRADAY_INTERVAL', 60)),  # 盘中轮询间隔 (秒)
+    'intraday_ring_size': int(os.getenv('INTRADAY_RING_SIZE', 64)),  # 每只股票在内存中保留的最近快照数
+    'backfill_poll_interval': int(os.getenv('BACKFILL_POLL_INTERVAL', 10)),  # worker 检查 API 提交的回补任务的间隔 (秒)
+}
+
+# 实时推送配置
+STREAM_CONFIG = {
+    'queue_size': int(os.getenv('STREAM_QUEUE_SIZE', 100)),  # 每个订阅者最多积压的事件数，超出时丢弃最旧的事件
+    'heartbeat': float(os.getenv('STREAM_HEARTBEAT', 15)),  # 无事件时发送心跳的间隔 (秒)
+    'relay_interval': float(os.getenv('STREAM_RELAY_INTERVAL', 1.0)),  # API 进程读取 worker 推送事件的间隔 (秒)
+    'retained_events': int(os.getenv('STREAM_RETAINED_EVENTS', 1000)),  # stream_events 表保留的事件数
+    'listener_heartbeat': float(os.getenv('STREAM_LISTENER_HEARTBEAT', 5)),  # API 进程上报订阅者数量的间隔 (秒)，超过 3 倍未上报视为离线
+    'prune_interval': float(os.getenv('STREAM_PRUNE_INTERVAL', 60)),  # worker 清理 stream_events 旧事件及离线 API 进程记录的间隔 (秒)
+}
+
+# 行情缓存配置
+CACHE_CONFIG = {
+    'today_ttl': float(os.getenv('TODAY_CACHE_TTL', 30)),  # 交易时段内 /stocks/today 缓存的有效秒数，收盘后不过期
+    'max_entries': 5,  # 缓存保留的交易日数
+    'calendar_check_interval': float(os.getenv('CALENDAR_CHECK_INTERVAL', 300)),  # 检查交易日历表是否被其它进程更新的间隔 (秒)
+}
+
+# 选股计算配置
+SCREEN_CONFIG = {
+    'workers': int(os.getenv('SCREEN_WORKERS', 1)),  # 按股票分片并行选股的进程数，1 为单进程，0 为使用全部可用核心
+    'min_shard_symbols': int(os.getenv('SCREEN_MIN_SHARD_SYMBOLS', 250)),  # 每个分片至少包含的股票数，股票较少时不并行
+    'rule_cache_ttl': float(os.getenv('SCREEN_RULE_CACHE_TTL', 300)),  # 公式选股复用已加载历史及中间结果的秒数
+    'max_strategies': int(os.getenv('SCREEN_MAX_STRATEGIES', 1000)),  # 批量选股一次请求的策略数上限
+    'max_zhanhe_window': int(os.getenv('SCREEN_MAX_ZHANHE_WINDOW', 250)),  # 批量选股粘合度计数窗口上限 (交易日)
+    'max_rule_lookback': int(os.getenv('SCREEN_MAX_RULE_LOOKBACK', 500)),  # 一条选股公式最多需要的历史交易日数
+    'backtest_chunk_days': int(os.getenv('SCREEN_BACKTEST_CHUNK_DAYS', 250)),  # 回测分段选股时每段的交易日数，限制中间矩阵的内存
+}
+
+# 启动预热配置
+WARMUP_CONFIG = {
+    'enabled': os.getenv('WARMUP_ENABLED', 'true').lower() == 'true',  # 关闭时启动后立即就绪
+    'steps': [s for s in os.getenv('WARMUP_STEPS', 'calendar,snapshot,screen').split(',') if s],  # 按顺序执行的预热步骤
+    'step_timeout': float(os.getenv('WARMUP_STEP_TIMEOUT', 120)),  # 单个步骤的超时秒数，超时后继续下一步
+}
+
+# 本地存储配置
+STORAGE_CONFIG = {
+    'snapshot_dir': os.getenv('SNAPSHOT_DIR', 'data/snapshots'),  # 每日行情快照目录
+    'live_snapshot_dir': os.getenv('LIVE_SNAPSHOT_DIR', 'data/live'),  # worker 写入的盘中最新行情，供 API 进程读取
+    'cube_dir': os.getenv('CUBE_DIR', 'data/cube'),  # 历史数据立方体目录
+    'cube_symbol_capacity': int(os.getenv('CUBE_SYMBOL_CAPACITY', 8192)),  # 立方体预留的股票列数
+}
@@ -8,12 +8,25 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 # Import config after updating sys.path
 import config
+from database.pool_metrics import InstrumentedQueuePool, pool_metrics
 
 # Database connection string
 SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{config.DB_CONFIG['user']}:{config.DB_CONFIG['password']}@{config.DB_CONFIG['host']}:{config.DB_CONFIG['port']}/{config.DB_CONFIG['database']}"
 
 # Create database engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# LOAD DATA LOCAL INFILE has to be enabled on the client connection as well
+connect_args = {"local_infile": True} if config.INGEST_CONFIG["mode"] == "load_data" else {}
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
+    poolclass=InstrumentedQueuePool,
+    pool_size=config.DB_CONFIG["pool_size"],
+    max_overflow=config.DB_CONFIG["max_overflow"],
+    pool_timeout=config.DB_CONFIG["pool_timeout"],
+    pool_recycle=config.DB_CONFIG["pool_recycle"],
+    pool_pre_ping=config.DB_CONFIG["pool_pre_ping"],
+)
+pool_metrics.attach(engine)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -36,6 +49,9 @@ def get_db():
 
 def init_db():
     """Initialize the database, creating all tables"""
+    # 表在导入模型时注册到 Base 上
+    import models.stock_model  # noqa: F401
+
     Base.metadata.create_all(bind=engine)
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdvisoryLock:
+    """
+    Named MySQL advisory lock (GET_LOCK) held on a dedicated connection.
+
+    MySQL releases the lock when the connection that took it closes, so a crashed
+    holder never leaves it behind. The connection is owned by this object; use it
+    from one thread. On databases without named locks (SQLite in tests) acquire()
+    always succeeds, which is only safe for a single process.
+    """
+
+    def __init__(self, name: str, engine=None):
+        """
+        :param name: Lock name, shared by every process competing for it.
+        :param engine: SQLAlchemy engine, defaults to database.engine.
+        """
+        self.name = name
+        self._engine = engine
+        self._connection = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from database import engine
+
+            return engine
+        return self._engine
+
+    @property
+    def supported(self) -> bool:
+        return self.engine.dialect.name == "mysql"
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """
+        :param timeout: Seconds to wait for the lock.
+        :return: True if this object now holds the lock.
+        """
+        if not self.supported:
+            logger.warning(f"{self.engine.dialect.name} has no named locks, assuming {self.name} is held.")
+            return True
+        self._close()
+        # autocommit: the connection stays open as long as the lock is held and must not sit in a transaction
+        self._connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = self._scalar("SELECT GET_LOCK(:name, :timeout)", timeout=timeout) == 1
+        except Exception:
+            self._close()
+            raise
+        if not acquired:
+            self._close()
+        return acquired
+
+    def held(self) -> bool:
+        """Whether the lock is still held by this connection; False once the connection has been lost."""
+        if not self.supported:
+            return True
+        if self._connection is None:
+            return False
+        try:
+            return self._scalar("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()") == 1
+        except Exception as e:
+            logger.error(f"Lost the connection holding lock {self.name}: {e}")
+            self._close()
+            return False
+
+    def release(self):
+        if self._connection is None:
+            return
+        try:
+            self._scalar("SELECT RELEASE_LOCK(:name)")
+        except Exception as e:
+            logger.warning(f"Failed to release lock {self.name}: {e}")
+        finally:
+            self._close()
+
+    def _scalar(self, sql: str, **params) -> Optional[int]:
+        from sqlalchemy import text
+
+        return self._connection.execute(text(sql), {"name": self.name, **params}).scalar()
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
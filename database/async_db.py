@@ -0,0 +1,67 @@
+import logging
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_session_factory = None
+_lock = threading.Lock()
+
+
+def async_database_url() -> str:
+    """DB_CONFIG['async_url'] if set (e.g. sqlite+aiosqlite:///stock.db for local runs), else MySQL via the async driver."""
+    if config.DB_CONFIG["async_url"]:
+        return config.DB_CONFIG["async_url"]
+    return (
+        f"mysql+{config.DB_CONFIG['async_driver']}://{config.DB_CONFIG['user']}:{config.DB_CONFIG['password']}"
+        f"@{config.DB_CONFIG['host']}:{config.DB_CONFIG['port']}/{config.DB_CONFIG['database']}"
+    )
+
+
+def get_async_engine():
+    """
+    Async engine shared by the read endpoints, created on first use so the driver
+    is only imported by processes that serve them.
+    """
+    global _engine, _session_factory
+    with _lock:
+        if _engine is None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+            url = async_database_url()
+            pool_args = {}
+            if not url.startswith("sqlite"):
+                pool_args = {
+                    key: config.DB_CONFIG[key]
+                    for key in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping")
+                }
+            _engine = create_async_engine(url, **pool_args)
+            _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+            logger.info(f"Created the async database engine ({_engine.dialect.name}+{_engine.dialect.driver}).")
+        return _engine
+
+
+def async_session():
+    """New AsyncSession; use as `async with async_session() as db:`."""
+    get_async_engine()
+    return _session_factory()
+
+
+async def get_async_db():
+    """
+    获取异步数据库会话，与 get_db 并存，供只读接口使用
+    :return: AsyncSession
+    """
+    async with async_session() as db:
+        yield db
+
+
+async def dispose_async_engine():
+    """Closes the pooled connections of the async engine, if it was created."""
+    global _engine, _session_factory
+    with _lock:
+        engine, _engine, _session_factory = _engine, None, None
+    if engine is not None:
+        await engine.dispose()
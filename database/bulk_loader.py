@@ -0,0 +1,210 @@
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, Numeric, select
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Longest IN (...) list diff_frame sends for a non-date key column
+IN_LIST_LIMIT = 1000
+
+_PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+def _column_values(series: pd.Series, column) -> np.ndarray:
+    """
+    Converts one DataFrame column to an object array of plain Python values for the driver.
+    Floats are rounded to the DECIMAL scale of the target column and NaN becomes None;
+    timestamps become dates for DATE columns and datetimes otherwise.
+    """
+    values = series.to_numpy()
+    if values.dtype.kind == "M":
+        if isinstance(column.type, Date):
+            return series.dt.date.astype(object).where(series.notna(), None).to_numpy()
+        # datetime64[us] converts to datetime.datetime objects, NaT to None
+        return values.astype("datetime64[us]").astype(object)
+    if values.dtype.kind == "f":
+        scale = column.type.scale if isinstance(column.type, Numeric) else None
+        missing = np.isnan(values)
+        if scale is not None:
+            values = np.round(values.astype(np.float64), scale)
+        out = values.astype(np.float64).astype(object)
+        out[missing] = None
+        return out
+    if values.dtype.kind in "iub":
+        return values.astype(object)
+    out = values.astype(object)
+    out[pd.isna(out)] = None
+    return out
+
+
+def _insert_sql(connection, table, columns) -> str:
+    style = connection.dialect.paramstyle
+    placeholders = ", ".join([_PLACEHOLDERS[style]] * len(columns))
+    prepare = connection.dialect.identifier_preparer
+    names = ", ".join(prepare.quote(c) for c in columns)
+    return f"INSERT INTO {prepare.format_table(table)} ({names}) VALUES ({placeholders})"
+
+
+def iter_batches(df: pd.DataFrame, table, columns, batch_size: int):
+    """
+    Yields lists of row tuples. Columns are converted to driver values once, rows are built per batch.
+
+    :param df: Frame to load.
+    :param table: Target SQLAlchemy Table, used for column scales.
+    :param columns: Column names to load, in order.
+    :param batch_size: Rows per batch.
+    """
+    prepared = [_column_values(df[c], table.c[c]) for c in columns]
+    for start in range(0, len(df), batch_size):
+        yield list(zip(*(values[start:start + batch_size] for values in prepared)))
+
+
+def _load_data_infile(cursor, table, columns, rows, prepare):
+    """Writes one batch as tab-separated text and loads it with LOAD DATA LOCAL INFILE (MySQL only)."""
+    # PyMySQL streams LOCAL INFILE from a path, so the batch is spooled to a private temp file
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", delete=False) as fh:
+        for row in rows:
+            fh.write("\t".join(
+                "\\N" if v is None else str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+                for v in row
+            ))
+            fh.write("\n")
+    try:
+        names = ", ".join(prepare.quote(c) for c in columns)
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {prepare.format_table(table)} "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({names})",
+            (fh.name,),
+        )
+    finally:
+        os.unlink(fh.name)
+
+
+def _execute_batches(connection, table, df, columns, sql, batch_size, mode="executemany"):
+    prepare = connection.dialect.identifier_preparer
+    cursor = connection.connection.cursor()
+    try:
+        for rows in iter_batches(df, table, columns, batch_size):
+            if mode == "load_data":
+                _load_data_infile(cursor, table, columns, rows, prepare)
+            else:
+                cursor.executemany(sql, rows)
+    finally:
+        cursor.close()
+
+
+def _report(table, rows, started, action) -> dict:
+    seconds = time.perf_counter() - started
+    stats = {"rows": rows, "seconds": round(seconds, 4), "rows_per_sec": round(rows / seconds) if seconds else None}
+    logger.info(f"Bulk {action} {rows} rows into {table.name} in {seconds:.3f}s ({stats['rows_per_sec']} rows/s).")
+    return stats
+
+
+def bulk_insert_frame(connection, table, df: pd.DataFrame, batch_size: int = DEFAULT_BATCH_SIZE, mode: str = "executemany") -> dict:
+    """
+    Inserts a DataFrame into `table` through the raw DB-API cursor of `connection`.
+
+    Works with any SQLAlchemy connection (MySQL in production, SQLite for offline
+    benchmarks) and runs inside the connection's current transaction.
+
+    :param connection: SQLAlchemy Connection, e.g. `session.connection()`.
+    :param table: Target SQLAlchemy Table.
+    :param df: Frame whose columns are a subset of the table's columns; other columns are ignored.
+    :param batch_size: Rows per executemany call / LOAD DATA buffer.
+    :param mode: "executemany", or "load_data" for LOAD DATA LOCAL INFILE on MySQL
+                 (needs local_infile enabled on both client and server).
+    :return: {"rows": ..., "seconds": ..., "rows_per_sec": ...}
+    """
+    columns = [c for c in df.columns if c in table.c]
+    started = time.perf_counter()
+    if mode == "load_data" and connection.dialect.name != "mysql":
+        logger.warning(f"LOAD DATA is not supported on {connection.dialect.name}, using executemany.")
+        mode = "executemany"
+
+    _execute_batches(connection, table, df, columns, _insert_sql(connection, table, columns), batch_size, mode)
+    return _report(table, len(df), started, "loaded")
+
+
+def _upsert_sql(connection, table, columns, key_columns) -> str:
+    prepare = connection.dialect.identifier_preparer
+    sql = _insert_sql(connection, table, columns)
+    updates = [c for c in columns if c not in key_columns]
+    # Columns maintained by the ORM on update (update_time) are not set by raw SQL, so touch them here
+    touched = [c.name for c in table.c if c.onupdate is not None and c.name not in columns]
+
+    if connection.dialect.name == "mysql":
+        assignments = [f"{prepare.quote(c)} = VALUES({prepare.quote(c)})" for c in updates]
+        assignments += [f"{prepare.quote(c)} = CURRENT_TIMESTAMP" for c in touched]
+        return f"{sql} ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+
+    # SQLite / PostgreSQL
+    assignments = [f"{prepare.quote(c)} = excluded.{prepare.quote(c)}" for c in updates]
+    assignments += [f"{prepare.quote(c)} = CURRENT_TIMESTAMP" for c in touched]
+    keys = ", ".join(prepare.quote(c) for c in key_columns)
+    return f"{sql} ON CONFLICT ({keys}) DO UPDATE SET {', '.join(assignments)}"
+
+
+def bulk_upsert_frame(connection, table, df: pd.DataFrame, key_columns, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Inserts or updates rows of `df` on the unique key `key_columns`
+    (INSERT ... ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT ... DO UPDATE elsewhere).
+
+    :param connection: SQLAlchemy Connection, e.g. `session.connection()`.
+    :param table: Target SQLAlchemy Table.
+    :param df: Frame whose columns are a subset of the table's columns.
+    :param key_columns: Columns of the primary / unique key.
+    :param batch_size: Rows per executemany call.
+    :return: {"rows": ..., "seconds": ..., "rows_per_sec": ...}
+    """
+    columns = [c for c in df.columns if c in table.c]
+    started = time.perf_counter()
+    _execute_batches(connection, table, df, columns, _upsert_sql(connection, table, columns, key_columns), batch_size)
+    return _report(table, len(df), started, "upserted")
+
+
+def diff_frame(connection, table, df: pd.DataFrame, key_columns) -> tuple:
+    """
+    Compares incoming rows with the rows already stored under the same keys.
+
+    Floats are compared after rounding to the DECIMAL scale of their column, so
+    values that would be stored identically count as unchanged.
+
+    :param connection: SQLAlchemy Connection.
+    :param table: Target SQLAlchemy Table.
+    :param df: Incoming rows; must contain every key column.
+    :param key_columns: Columns of the primary / unique key.
+    :return: (new, changed) boolean arrays aligned with df.
+    """
+    value_columns = [c for c in df.columns if c in table.c and c not in key_columns]
+    # Only rows sharing the key values can overlap; the last key (e.g. trade_date) is always
+    # filtered on, the others only while their IN list stays short
+    query = select(*[table.c[c] for c in list(key_columns) + value_columns])
+    for i, key in enumerate(key_columns):
+        values = pd.unique(df[key]).tolist()
+        if i == len(key_columns) - 1 or len(values) <= IN_LIST_LIMIT:
+            query = query.where(table.c[key].in_(values))
+    existing = pd.DataFrame(connection.execute(query).all(), columns=list(key_columns) + value_columns)
+    merged = df[list(key_columns) + value_columns].merge(
+        existing, on=list(key_columns), how="left", suffixes=("", "__old"), indicator=True
+    )
+    new = (merged["_merge"] == "left_only").to_numpy()
+
+    changed = np.zeros(len(df), dtype=bool)
+    for c in value_columns:
+        incoming, stored = merged[c], merged[f"{c}__old"]
+        if incoming.dtype.kind in "fi" or isinstance(table.c[c].type, Numeric):
+            a = incoming.to_numpy(dtype=np.float64, na_value=np.nan)
+            b = stored.to_numpy(dtype=np.float64, na_value=np.nan)
+            scale = getattr(table.c[c].type, "scale", None)
+            if scale is not None:
+                a, b = np.round(a, scale), np.round(b, scale)
+            differs = ~((a == b) | (np.isnan(a) & np.isnan(b)))
+        else:
+            differs = ~((incoming == stored) | (incoming.isna() & stored.isna())).to_numpy()
+        changed |= differs
+    return new, changed & ~new
@@ -1,15 +1,33 @@
 # +++ new_file: database_utils.py
 from contextlib import contextmanager
+from contextvars import ContextVar
 from database import SessionLocal
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 当前工作单元的会话，同一线程 (或协程) 内嵌套的 db_session_scope 共用它
+_current_session = ContextVar("current_session", default=None)
+
 
 @contextmanager
-def db_session_scope():
-    """Provide a transactional scope around a series of operations."""
+def db_session_scope(join: bool = True):
+    """
+    Provide a transactional scope around a series of operations.
+
+    Scopes nested in the same thread or asyncio task join the outermost one: they get
+    its session and leave commit, rollback and close to it, so a unit of work holds a
+    single pooled connection and sees its own uncommitted rows.
+
+    :param join: False always opens an independent session that commits on its own.
+    """
+    current = _current_session.get()
+    if join and current is not None:
+        yield current
+        return
+
     db = SessionLocal()
+    token = _current_session.set(db)
     try:
         yield db
         db.commit()
@@ -18,4 +36,5 @@ def db_session_scope():
         logger.error(f"Database transaction failed: {e}")
         raise
     finally:
+        _current_session.reset(token)
         db.close()
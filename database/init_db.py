@@ -8,6 +8,9 @@ from database import engine, Base
 
 def init_db():
     """Initialize the database, creating all tables"""
+    # 表在导入模型时注册到 Base 上
+    import models.stock_model  # noqa: F401
+
     Base.metadata.create_all(bind=engine)
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Index and partition maintenance of stock_data, for databases created before the model changed.
+
+    python database/migrations.py                     # covering index, drop the duplicate unique key
+    python database/migrations.py --partition 2015    # also partition by trade_date, one partition per year
+
+Every step checks the current schema first, so the script can be re-run safely.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from database import engine
+from models.stock_model import StockData
+
+logger = logging.getLogger(__name__)
+
+TABLE = StockData.__tablename__
+SCREEN_INDEX = next(i for i in StockData.__table__.indexes if i.name == "idx_stock_date_screen")
+# 旧模型上与主键重复的唯一索引
+DUPLICATE_INDEX = "idx_symbol_trade_date"
+# 分区表最后一个分区，收纳尚未建分区的日期
+MAX_PARTITION = "pmax"
+
+
+def _index_names(connection) -> set:
+    inspector = inspect(connection)
+    names = {i["name"] for i in inspector.get_indexes(TABLE)}
+    return names | {c["name"] for c in inspector.get_unique_constraints(TABLE)}
+
+
+def migrate_indexes(connection) -> list:
+    """
+    Adds idx_stock_date_screen and drops the unique key that duplicated the primary key.
+    On MySQL both changes run as one online ALTER TABLE (no table copy, reads and writes continue).
+
+    :return: The statements that were executed.
+    """
+    existing = _index_names(connection)
+    changes = []
+    if SCREEN_INDEX.name not in existing:
+        changes.append(f"ADD INDEX {SCREEN_INDEX.name} ({', '.join(c.name for c in SCREEN_INDEX.columns)})")
+    if DUPLICATE_INDEX in existing:
+        changes.append(f"DROP INDEX {DUPLICATE_INDEX}")
+    if not changes:
+        logger.info(f"Indexes of {TABLE} are up to date.")
+        return []
+
+    if connection.dialect.name == "mysql":
+        statements = [f"ALTER TABLE {TABLE} {', '.join(changes)}, ALGORITHM=INPLACE, LOCK=NONE"]
+    else:
+        statements = [str(CreateIndex(SCREEN_INDEX).compile(connection))] if SCREEN_INDEX.name not in existing else []
+        if DUPLICATE_INDEX in existing:
+            # SQLite 的唯一约束属于表定义，需要重建表才能删除
+            logger.warning(f"{DUPLICATE_INDEX} is part of the {connection.dialect.name} table definition; left in place.")
+
+    for statement in statements:
+        logger.info(f"Executing: {statement}")
+        connection.execute(text(statement))
+    return statements
+
+
+def _partition_clause(name: str, year: int) -> str:
+    return f"PARTITION {name} VALUES LESS THAN ('{year + 1}-01-01')"
+
+
+def partitions(connection) -> list:
+    """:return: Partition names of stock_data in order, empty when it is not partitioned (or not on MySQL)."""
+    if connection.dialect.name != "mysql":
+        return []
+    rows = connection.execute(text(
+        "SELECT partition_name FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL "
+        "ORDER BY partition_ordinal_position"
+    ), {"table": TABLE}).scalars().all()
+    return list(rows)
+
+
+def partition_by_year(connection, first_year: int, last_year: int = None) -> bool:
+    """
+    Range-partitions stock_data by trade_date, one partition per calendar year plus pmax.
+    Date-bounded queries then only read the partitions of their range, and old years can be
+    archived with ALTER TABLE ... DROP PARTITION instead of a long DELETE.
+
+    The table is rebuilt (copied), so run it outside trading hours. The partition column has
+    to be part of every unique key; the primary key (symbol, trade_date) satisfies that.
+
+    :param first_year: First year with its own partition; earlier rows go to it as well.
+    :param last_year: Last year with its own partition, defaults to next year.
+    :return: False when the table is already partitioned or the database is not MySQL.
+    """
+    if connection.dialect.name != "mysql":
+        logger.warning(f"Partitioning is only supported on MySQL, not {connection.dialect.name}.")
+        return False
+    if partitions(connection):
+        logger.info(f"{TABLE} is already partitioned.")
+        return False
+    last_year = last_year or date.today().year + 1
+    clauses = [_partition_clause(f"p{year}", year) for year in range(first_year, last_year + 1)]
+    clauses.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    statement = f"ALTER TABLE {TABLE} PARTITION BY RANGE COLUMNS(trade_date) ({', '.join(clauses)})"
+    logger.info(f"Partitioning {TABLE} from {first_year} to {last_year}.")
+    connection.execute(text(statement))
+    return True
+
+
+def ensure_partitions(connection, through_year: int = None) -> list:
+    """
+    Splits pmax so every year up to `through_year` has its own partition. pmax normally
+    holds no rows yet, which makes the reorganization instant. The scheduler leader runs it
+    when it takes over and daily after that (SchedulerService._maintain_partitions).
+
+    :param through_year: Defaults to next year.
+    :return: Names of the partitions that were added.
+    """
+    names = partitions(connection)
+    if MAX_PARTITION not in names:
+        return []
+    through_year = through_year or date.today().year + 1
+    years = [int(n[1:]) for n in names if n != MAX_PARTITION and n[1:].isdigit()]
+    next_year = max(years) + 1 if years else date.today().year
+    added = [f"p{year}" for year in range(next_year, through_year + 1)]
+    if not added:
+        return []
+    clauses = [_partition_clause(name, int(name[1:])) for name in added]
+    clauses.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    connection.execute(text(
+        f"ALTER TABLE {TABLE} REORGANIZE PARTITION {MAX_PARTITION} INTO ({', '.join(clauses)})"
+    ))
+    logger.info(f"Added partitions {', '.join(added)} to {TABLE}.")
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partition", type=int, metavar="FIRST_YEAR",
+                        help="Range-partition stock_data by trade_date from this year on (MySQL)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    with engine.begin() as connection:
+        migrate_indexes(connection)
+    with engine.begin() as connection:
+        if args.partition:
+            partition_by_year(connection, args.partition)
+        ensure_partitions(connection)
+
+
+if __name__ == "__main__":
+    main()
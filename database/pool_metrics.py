@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+import config
+
+
+class PoolMetrics:
+    """Counters and recent checkout wait times of the engine's connection pool."""
+
+    def __init__(self, window: int = 1000):
+        """
+        :param window: Number of recent checkouts the wait percentiles are computed from.
+        """
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.wait_total += seconds
+                self._waits.append(seconds)
+            self.wait_max = max(self.wait_max, seconds)
+
+    def attach(self, engine):
+        """Counts new and invalidated DBAPI connections of `engine`."""
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(engine, "invalidate")
+        def _on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidated += 1
+
+    def snapshot(self, pool) -> dict:
+        """
+        :param pool: The engine's pool; occupancy is only reported for QueuePool.
+        :return: Occupancy, counters and checkout wait in milliseconds (mean, p50, p95, max).
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "pool": type(pool).__name__,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidated": self.invalidated,
+                "wait_ms": {
+                    "mean": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    "p50": round(waits[len(waits) // 2] * 1000, 3) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                },
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                # 负数表示还有尚未建立的常驻连接
+                overflow=pool.overflow(),
+                # 创建连接池时使用的配置值 (QueuePool 没有公开的访问方法)
+                max_overflow=config.DB_CONFIG["max_overflow"],
+            )
+        return stats
+
+
+# 进程内共享的连接池统计
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free (or new) connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
@@ -1,9 +1,43 @@
+import time
 import pandas as pd
 import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 清洗后的列及类型
+# 价格、涨跌额和百分比列使用 float32：在 |值| < 131072 (2 位小数) / 16384 (3 位小数) 时，
+# 按数据库 DECIMAL 精度四舍五入后可无损还原；市值、成交额、市盈率、市净率范围不定，保留 float64
+CLEAN_SCHEMA = {
+    'symbol': 'object',
+    'name': 'object',
+    'close': 'float32',
+    'change_percent': 'float32',
+    'change_amount': 'float32',
+    'volume': 'int64',
+    'turnover_value': 'float64',
+    'amplitude': 'float32',
+    'high': 'float32',
+    'low': 'float32',
+    'open': 'float32',
+    'yesterday_close': 'float32',
+    'turnover_ratio': 'float32',
+    'pe_ttm': 'float64',
+    'pb': 'float64',
+    'market_value': 'float64',
+    'circulation_market_value': 'float64',
+    'rise_speed': 'float32',
+    'five_minute_change': 'float32',
+    'sixty_day_change_percent': 'float32',
+    'year_to_date_change_percent': 'float32',
+}
+NUMERIC_COLUMNS = [c for c, dtype in CLEAN_SCHEMA.items() if dtype != 'object']
+# float32 列在数据库中的小数位数，用于还原精度
+FLOAT32_DECIMALS = {
+    c: 3 if c in ('change_percent', 'amplitude', 'turnover_ratio', 'rise_speed', 'five_minute_change') else 2
+    for c, dtype in CLEAN_SCHEMA.items() if dtype == 'float32'
+}
+
 # 新增函数：将中文字段名转换为英文字段名
 def translate_chinese_columns(df):
     """
@@ -33,79 +67,97 @@ def translate_chinese_columns(df):
         '涨速': 'rise_speed',
         '5分钟涨跌': 'five_minute_change',
         '60日涨跌幅': 'sixty_day_change_percent',
-        '年初至今涨跌幅': 'year_to_date_change_percent'
+        '年初至今涨跌幅': 'year_to_date_change_percent',
+        # 历史日线 (stock_zh_a_hist) 的字段
+        '日期': 'trade_date',
+        '股票代码': 'symbol',
+        '开盘': 'open',
+        '收盘': 'close',
     }
     try:
-        logger.info("开始转换中文字段名为英文字段名")
-        df = df.rename(columns=chinese_to_english)
-        logger.info("中文字段名转换完成")
-        return df
+        return df.rename(columns=chinese_to_english, copy=False)
     except Exception as e:
         logger.error(f"字段名转换失败: {e}")
         raise
 
+def _strip_text(series, fill=None):
+    """
+    去除文本两端空白；回补数据中同一股票重复出现，只处理去重后的值再按编码展开
+    :param series: 文本列
+    :param fill: 缺失值的填充值，为 None 时缺失值按 str 转换 (与 astype(str) 一致)
+    :return: object 类型的 ndarray
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=fill is not None)
+    stripped = pd.Index(uniques).astype(str).str.strip().to_numpy(dtype=object)
+    if fill is None:
+        return stripped[codes]
+    return np.append(stripped, fill)[codes]
+
+
 def clean_stock_data(df):
     """
     清洗股票数据 DataFrame
-    :param df: 原始股票数据 DataFrame
-    :return: 清洗后的 DataFrame
+    数值列作为一个整体一次性转换为 CLEAN_SCHEMA 中的紧凑类型，只在最后构造一次结果，不产生中间副本
+    :param df: 原始股票数据 DataFrame (中文或英文字段名)
+    :return: 清洗后的 DataFrame，列顺序与 CLEAN_SCHEMA 一致，存在 trade_date 时附在最后
     """
     try:
-        logger.info("开始清洗股票数据")
-        # 新增：在数据清洗之前，将中文字段名转换为英文字段名
+        started = time.perf_counter()
         df = translate_chinese_columns(df)
-        
-        # 创建原始数据的副本以避免修改原始数据
-        logger.info("创建原始数据副本")
-        df_cleaned = df.copy()
-        
-        # 1. 处理缺失值 (NaN)
-        logger.info("开始处理缺失值")
-        numeric_cols = df_cleaned.select_dtypes(include=np.number).columns
-        df_cleaned[numeric_cols] = df_cleaned[numeric_cols].fillna(0)
-        
-        # 填充文本列的缺失值为 '未知'
-        if 'name' in df_cleaned.columns:
-            df_cleaned['name'] = df_cleaned['name'].fillna('未知')
-        
-        # 2. 数据类型转换
-        logger.info("开始数据类型转换")
-        cols_to_numeric = ['close', 'change_percent', 'change_amount', 'volume', 'turnover_value', 'amplitude', 'high', 'low', 
-                          'open', 'yesterday_close', 'turnover_ratio', 'pe_ttm', 'pb', 'market_value', 'circulation_market_value', 
-                          'rise_speed', 'five_minute_change', 'sixty_day_change_percent', 'year_to_date_change_percent']
-        
-        for col in cols_to_numeric:
-            if col in df_cleaned.columns:
-                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce')
-                df_cleaned[col] = df_cleaned[col].fillna(0)  # 再次填充转换失败的 NaN
-        
-        # 3. 处理 'symbol' 列 (确保是字符串)
-        logger.info("处理 'symbol' 列")
-        df_cleaned['symbol'] = df_cleaned['symbol'].astype(str).str.strip()
-        
-        # 4. 清理文本数据 (例如移除空白字符)
-        if 'name' in df_cleaned.columns:
-            logger.info("清理文本数据")
-            df_cleaned['name'] = df_cleaned['name'].str.strip()
-        
-        # 5. 处理重复数据
-        logger.info("处理重复数据")
-        df_cleaned = df_cleaned.drop_duplicates()
-        
-        # 6. 处理异常值 (根据您的业务逻辑判断)
-        logger.info("处理异常值")
-        if 'close' in df_cleaned.columns:
-            df_cleaned = df_cleaned[df_cleaned['close'] >= 0]
-        
-        # 7. 选择需要的列 (如果 CSV 文件包含不需要的列)
-        logger.info("选择需要的列")
-        columns_to_keep = ['symbol', 'name', 'close', 'change_percent', 'change_amount', 'volume', 'turnover_value', 
-                          'amplitude', 'high', 'low', 'open', 'yesterday_close', 'turnover_ratio', 'pe_ttm', 'pb', 
-                          'market_value', 'circulation_market_value', 'rise_speed', 'five_minute_change', 'sixty_day_change_percent', 'year_to_date_change_percent']
-        df_cleaned = df_cleaned[columns_to_keep]
-        
-        logger.info("股票数据清洗完成")
+        rows = len(df)
+
+        # 1. 数值列：写入同一块 float64 数组 (只对非数值类型的列做 to_numeric)，再一次性把缺失值填 0
+        present = [c for c in NUMERIC_COLUMNS if c in df.columns]
+        values = np.empty((len(present), rows), dtype=np.float64)
+        for i, column in enumerate(present):
+            series = df[column]
+            if not pd.api.types.is_numeric_dtype(series.dtype):
+                series = pd.to_numeric(series, errors='coerce')
+            values[i] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        values[np.isnan(values)] = 0
+
+        # 2. 文本列：symbol 统一为去空白的字符串，name 缺失时为 '未知'
+        symbol = _strip_text(df['symbol'])
+        if 'name' in df.columns:
+            name = _strip_text(df['name'], fill='未知')
+        else:
+            name = np.full(rows, np.nan, dtype=object)
+
+        # 3. 去重 (同一股票同一交易日只保留第一条) 并剔除收盘价为负的异常值
+        keys = [symbol, df['trade_date'].to_numpy()] if 'trade_date' in df.columns else [symbol]
+        keep = ~pd.MultiIndex.from_arrays(keys).duplicated() if len(keys) > 1 else ~pd.Index(symbol).duplicated()
+        if 'close' in present:
+            keep &= values[present.index('close')] >= 0
+
+        # 4. 按 CLEAN_SCHEMA 构造结果，数据源未提供的列为 NaN
+        columns = {'symbol': symbol[keep], 'name': name[keep]}
+        for column in NUMERIC_COLUMNS:
+            dtype = CLEAN_SCHEMA[column]
+            if column in present:
+                columns[column] = values[present.index(column), keep].astype(dtype)
+            else:
+                columns[column] = np.full(int(keep.sum()), np.nan)
+        if 'trade_date' in df.columns:
+            columns['trade_date'] = df['trade_date'].to_numpy()[keep]
+        df_cleaned = pd.DataFrame(columns, index=df.index[keep], copy=False)
+
+        logger.debug(
+            f"清洗股票数据: {rows} 行 -> {len(df_cleaned)} 行, 耗时 {time.perf_counter() - started:.3f}s"
+        )
         return df_cleaned
     except Exception as e:
         logger.error(f"数据清洗失败: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def restore_precision(df):
+    """
+    将 float32 列转换回 float64 并按数据库精度四舍五入，用于 JSON 输出等需要精确小数的场景
+    :param df: clean_stock_data 的输出 (或其快照)
+    :return: 转换后的 DataFrame，其余列不变
+    """
+    columns = {
+        c: np.round(df[c].to_numpy(dtype=np.float64), decimals)
+        for c, decimals in FLOAT32_DECIMALS.items()
+        if c in df.columns and df[c].dtype == np.float32
+    }
+    return df.assign(**columns) if columns else df
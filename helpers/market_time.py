@@ -0,0 +1,73 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import config
+
+
+def market_tz() -> ZoneInfo:
+    return ZoneInfo(config.SCHEDULER_CONFIG['timezone'])
+
+
+def market_now() -> datetime:
+    """Current time in the exchange time zone (SCHEDULER_CONFIG['timezone'])."""
+    return datetime.now(market_tz())
+
+
+def trading_sessions() -> list:
+    """:return: [(start, end), ...] as datetime.time, from SCHEDULER_CONFIG['trading_sessions']."""
+    return [
+        (time.fromisoformat(start), time.fromisoformat(end))
+        for start, end in config.SCHEDULER_CONFIG['trading_sessions']
+    ]
+
+
+def in_trading_session(moment: Optional[datetime] = None) -> bool:
+    """
+    Whether `moment` falls inside a continuous trading session on a weekday.
+    Holidays are not checked here; combine with the trading calendar where it matters.
+
+    :param moment: Aware or exchange-local naive datetime, defaults to now.
+    """
+    moment = _local(moment)
+    if moment.weekday() >= 5:
+        return False
+    now = moment.time()
+    return any(start <= now < end for start, end in trading_sessions())
+
+
+def next_session_start(moment: Optional[datetime] = None) -> datetime:
+    """
+    Start of the next trading session strictly after `moment` (weekdays only, holidays not checked).
+
+    :param moment: Aware or exchange-local naive datetime, defaults to now.
+    :return: Aware datetime in the exchange time zone.
+    """
+    moment = _local(moment)
+    day = moment.date()
+    for offset in range(8):
+        candidate_day = day + timedelta(days=offset)
+        if candidate_day.weekday() >= 5:
+            continue
+        for start, _ in trading_sessions():
+            candidate = datetime.combine(candidate_day, start, tzinfo=market_tz())
+            if candidate > moment.replace(tzinfo=market_tz()):
+                return candidate
+    raise ValueError("No trading session configured.")
+
+
+def is_final(trade_date: date, moment: Optional[datetime] = None) -> bool:
+    """
+    Whether the market data of `trade_date` can no longer change at `moment`:
+    the day is in the past, or today's last session has closed.
+    """
+    moment = _local(moment)
+    if trade_date < moment.date():
+        return True
+    return trade_date == moment.date() and moment.time() >= trading_sessions()[-1][1]
+
+
+def _local(moment: Optional[datetime]) -> datetime:
+    if moment is None:
+        return market_now()
+    return moment.astimezone(market_tz()) if moment.tzinfo else moment
@@ -0,0 +1,260 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import config
+from helpers.data_cleaner import CLEAN_SCHEMA, clean_stock_data
+
+logger = logging.getLogger(__name__)
+
+# 快照的列及其固定类型，与 clean_stock_data 的输出一致；文本列使用定长字符串
+SNAPSHOT_SCHEMA = {
+    column: {'symbol': '<U10', 'name': '<U50'}.get(column, dtype) for column, dtype in CLEAN_SCHEMA.items()
+}
+
+META_FILE = 'meta.json'
+# 指向当日当前数据目录 (代) 的文件，与 services.history_cube 相同：新数据写入新的一代后原子替换指针，
+# 读者在任何时刻都能读到一份完整的快照
+POINTER_FILE = 'CURRENT'
+GENERATION_PREFIX = 'gen-'
+CSV_CACHE_PATTERN = re.compile(r'^stock_data_(\d{8})(\.csv)?$')
+
+
+def snapshot_path(trade_date: date, base_dir: Optional[str] = None) -> Path:
+    """
+    Directory that holds the snapshot of one trade date.
+
+    :param trade_date: Trade date of the snapshot.
+    :param base_dir: Snapshot root, defaults to STORAGE_CONFIG['snapshot_dir'].
+    :return: Path of the per-day directory.
+    """
+    return Path(base_dir or config.STORAGE_CONFIG['snapshot_dir']) / trade_date.strftime('%Y%m%d')
+
+
+def has_snapshot(trade_date: date, base_dir: Optional[str] = None) -> bool:
+    return _data_dir(trade_date, base_dir) is not None
+
+
+def _data_dir(trade_date: date, base_dir: Optional[str] = None) -> Optional[Path]:
+    """Generation directory holding the day's files, None if there is no snapshot."""
+    day_dir = snapshot_path(trade_date, base_dir)
+    try:
+        return day_dir / (day_dir / POINTER_FILE).read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        # 引入分代目录之前的布局：文件直接位于日期目录中
+        return day_dir if (day_dir / META_FILE).exists() else None
+
+
+def _new_generation_name(day_dir: Path) -> str:
+    numbers = [
+        int(p.name[len(GENERATION_PREFIX):].split('.')[0])
+        for p in day_dir.glob(f'{GENERATION_PREFIX}*')
+        if p.name[len(GENERATION_PREFIX):].split('.')[0].isdigit()
+    ]
+    return f'{GENERATION_PREFIX}{max(numbers, default=0) + 1:06d}'
+
+
+def _remove_stale_generations(day_dir: Path, keep: set):
+    """Deletes generation directories (and files of the single-directory layout) not in `keep`."""
+    for child in day_dir.glob(f'{GENERATION_PREFIX}*'):
+        if child.is_dir() and child not in keep and '.tmp-' not in child.name:
+            shutil.rmtree(child, ignore_errors=True)
+    if day_dir not in keep:
+        for name in [META_FILE] + [f'{column}.npy' for column in SNAPSHOT_SCHEMA]:
+            (day_dir / name).unlink(missing_ok=True)
+
+
+def _to_schema(df: pd.DataFrame, column: str, dtype: str) -> np.ndarray:
+    """Converts one cleaned column to its snapshot dtype; missing columns become NaN, 0 or ''."""
+    if column not in df.columns:
+        if dtype.startswith('<U'):
+            return np.full(len(df), '', dtype=dtype)
+        return np.zeros(len(df), dtype=dtype) if dtype == 'int64' else np.full(len(df), np.nan, dtype=dtype)
+    series = df[column]
+    if dtype.startswith('<U'):
+        return series.fillna('').astype(str).to_numpy(dtype=dtype)
+    if dtype == 'int64':
+        return series.fillna(0).to_numpy(dtype=np.int64)
+    return series.to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def write_snapshot(df: pd.DataFrame, trade_date: date, base_dir: Optional[str] = None) -> Path:
+    """
+    Writes a cleaned (English-named) day of stock data as one .npy file per column.
+
+    The files go to a new generation directory inside the day's directory, which the
+    CURRENT pointer is then atomically switched to, so readers always find either the
+    previous or the new complete snapshot. The previous generation is kept for readers
+    still opening its files; older ones are removed.
+
+    :param df: Output of clean_stock_data.
+    :param trade_date: Trade date of the data.
+    :param base_dir: Snapshot root, defaults to STORAGE_CONFIG['snapshot_dir'].
+    :return: Path of the day's directory.
+    """
+    day_dir = snapshot_path(trade_date, base_dir)
+    day_dir.mkdir(parents=True, exist_ok=True)
+    previous = _data_dir(trade_date, base_dir)
+    generation = day_dir / _new_generation_name(day_dir)
+    tmp = generation.with_name(f'{generation.name}.tmp-{os.getpid()}')
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir()
+
+    for column, dtype in SNAPSHOT_SCHEMA.items():
+        np.save(tmp / f'{column}.npy', _to_schema(df, column, dtype), allow_pickle=False)
+    meta = {
+        'trade_date': trade_date.strftime('%Y-%m-%d'),
+        'rows': len(df),
+        'columns': SNAPSHOT_SCHEMA,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    (tmp / META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, generation)
+
+    pointer = day_dir / f'{POINTER_FILE}.tmp-{os.getpid()}'
+    pointer.write_text(generation.name, encoding='utf-8')
+    os.replace(pointer, day_dir / POINTER_FILE)
+    _remove_stale_generations(day_dir, keep={generation, previous})
+    logger.info(f'Saved snapshot of {len(df)} rows to {generation}')
+    return day_dir
+
+
+def read_columns(trade_date: date, columns=None, base_dir: Optional[str] = None) -> Optional[dict]:
+    """
+    Memory-maps the requested columns of a snapshot without copying them.
+
+    :param trade_date: Trade date of the snapshot.
+    :param columns: Column names, defaults to every column in SNAPSHOT_SCHEMA.
+    :param base_dir: Snapshot root, defaults to STORAGE_CONFIG['snapshot_dir'].
+    :return: column -> read-only np.memmap, or None if there is no snapshot for the date.
+    """
+    for attempt in range(3):
+        path = _data_dir(trade_date, base_dir)
+        if path is None:
+            return None
+        try:
+            return {c: np.load(path / f'{c}.npy', mmap_mode='r') for c in (columns or SNAPSHOT_SCHEMA)}
+        except FileNotFoundError:
+            # 读取期间又写入了两次，这一代已被删除；重新读取指针
+            if attempt == 2:
+                raise
+
+
+def load_snapshot(trade_date: date, base_dir: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Loads a snapshot as a DataFrame in the layout returned by fetch_stock_data.
+
+    Numeric columns are backed by the memory-mapped files.
+
+    :param trade_date: Trade date of the snapshot.
+    :param base_dir: Snapshot root, defaults to STORAGE_CONFIG['snapshot_dir'].
+    :return: DataFrame with a trade_date column, or None if there is no snapshot for the date.
+    """
+    columns = read_columns(trade_date, base_dir=base_dir)
+    if columns is None:
+        return None
+    for name in ('symbol', 'name'):
+        columns[name] = columns[name].astype(object)
+    df = pd.DataFrame(columns, copy=False)
+    df['trade_date'] = trade_date.strftime('%Y-%m-%d')
+    return df
+
+
+def write_live_snapshot(df: pd.DataFrame, trade_date: date, base_dir: Optional[str] = None) -> Path:
+    """
+    Replaces the intraday snapshot that the worker shares with API processes; snapshots of other days are removed.
+
+    :param df: Latest cleaned poll of the whole market.
+    :param trade_date: Trade date of the poll.
+    :param base_dir: Live snapshot root, defaults to STORAGE_CONFIG['live_snapshot_dir'].
+    """
+    base_dir = base_dir or config.STORAGE_CONFIG['live_snapshot_dir']
+    target = write_snapshot(df, trade_date, base_dir)
+    for path in Path(base_dir).iterdir():
+        if path.is_dir() and path.name != target.name and '.tmp-' not in path.name:
+            shutil.rmtree(path, ignore_errors=True)
+    return target
+
+
+def load_live_snapshot(trade_date: date, max_age: float, base_dir: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Loads the worker's intraday snapshot of `trade_date` if it was written at most `max_age` seconds ago.
+
+    :return: DataFrame as returned by load_snapshot, or None if there is no recent live snapshot.
+    """
+    base_dir = base_dir or config.STORAGE_CONFIG['live_snapshot_dir']
+    try:
+        path = _data_dir(trade_date, base_dir)
+        if path is None:
+            return None
+        age = datetime.now().timestamp() - (path / META_FILE).stat().st_mtime
+        if age > max_age:
+            return None
+        return load_snapshot(trade_date, base_dir)
+    except (OSError, ValueError) as e:
+        # 读取时恰好被 worker 替换
+        logger.debug(f'Live snapshot of {trade_date} not readable: {e}')
+        return None
+
+
+def migrate_csv_cache(source_dir: str = '.', base_dir: Optional[str] = None, remove: bool = False) -> list:
+    """
+    Converts the legacy stock_data_YYYYMMDD.csv cache files into snapshots.
+
+    Handles both the raw AkShare files (Chinese headers) and the cleaned ones
+    (English headers), as well as the copies written without the .csv extension.
+    When both exist for a day the .csv file wins.
+
+    :param source_dir: Directory containing the CSV files.
+    :param base_dir: Snapshot root, defaults to STORAGE_CONFIG['snapshot_dir'].
+    :param remove: Delete the CSV files after a successful conversion.
+    :return: Trade dates that were migrated.
+    """
+    files = {}
+    for path in sorted(Path(source_dir).iterdir()):
+        match = CSV_CACHE_PATTERN.match(path.name)
+        if match and path.is_file():
+            files.setdefault(match.group(1), []).append(path)
+
+    migrated = []
+    for date_str, paths in sorted(files.items()):
+        source = max(paths, key=lambda p: p.suffix == '.csv')
+        trade_date = datetime.strptime(date_str, '%Y%m%d').date()
+        try:
+            df = pd.read_csv(source, dtype={'代码': str, 'symbol': str})
+            write_snapshot(clean_stock_data(df), trade_date, base_dir)
+        except Exception as e:
+            logger.error(f'Failed to migrate {source}: {e}')
+            continue
+        migrated.append(trade_date)
+        if remove:
+            for path in paths:
+                path.unlink()
+    logger.info(f'Migrated {len(migrated)} CSV cache files to snapshots.')
+    return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert stock_data_YYYYMMDD.csv cache files into snapshots.')
+    parser.add_argument('source_dir', nargs='?', default='.', help='directory containing the CSV files')
+    parser.add_argument('--snapshot-dir', default=None, help="defaults to STORAGE_CONFIG['snapshot_dir']")
+    parser.add_argument('--remove', action='store_true', help='delete the CSV files after conversion')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    done = migrate_csv_cache(args.source_dir, args.snapshot_dir, args.remove)
+    print(f'Migrated {len(done)} day(s).')
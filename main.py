@@ -1,13 +1,16 @@
+import asyncio
 from contextlib import asynccontextmanager
-from services.scheduler_service import SchedulerService
 from app_logger import setup_logging
 import logging
-from services.data_collector import sync_trading_calendar
+from services.broadcast_hub import hub
+from services.warmup import warmup
+import config
 
 setup_logging(log_level=logging.DEBUG, console=True)
 logger = logging.getLogger(__name__)
 
-scheduler_service = SchedulerService()
+# 采集与分析 (akshare / pandas) 只在需要时加载；定时任务默认由 worker.py 运行，API 进程不会导入
+scheduler_service = None
 
 # 创建FastAPI实例
 from fastapi import FastAPI
@@ -19,13 +22,36 @@ async def lifespan(app: FastAPI):
     """
     FastAPI应用的生命周期管理器，用于在应用启动和关闭时执行特定操作。
     """
+    global scheduler_service
     # 在应用启动时执行初始化操作
     logger.info("Starting up the application...")
     # 初始化数据库
     from database import init_db
 
     init_db()
-    scheduler_service.start_scheduler()
+    # 采集线程通过事件循环把推送事件分发给客户端
+    hub.bind(asyncio.get_running_loop())
+    relay_task = None
+    if config.SCHEDULER_CONFIG["run_in_api"]:
+        from services.scheduler_service import SchedulerService
+
+        scheduler_service = SchedulerService()
+        scheduler_service.start_when_leader()
+    else:
+        # 定时任务在 worker.py 中运行，推送事件经 stream_events 表转发给本进程的客户端
+        from services.event_relay import DbEventRelay
+        from services.trading_calendar import trading_calendar
+
+        # 交易日历为空时由 worker 从 AkShare 补齐，API 进程不请求 AkShare
+        trading_calendar.seed = False
+
+        relay_task = asyncio.create_task(DbEventRelay(hub).run())
+    # 预热在后台进行，完成前 /api/health/ready 返回 503
+    if config.WARMUP_CONFIG["enabled"]:
+        warmup_task = asyncio.create_task(warmup.run())
+    else:
+        warmup_task = None
+        warmup.mark_ready()
     # Execute once a year, no need to schedule it.Manual invocation is preferred.
     # scheduler_service.add_job(
     #     func=sync_trading_calendar,
@@ -38,7 +64,14 @@ async def lifespan(app: FastAPI):
     yield
     # 在应用关闭时执行清理操作
     logger.info("Shutting down the application...")
-    scheduler_service.stop_scheduler()
+    for task in (warmup_task, relay_task):
+        if task is not None and not task.done():
+            task.cancel()
+    if scheduler_service is not None:
+        scheduler_service.stop_scheduler()
+    from database.async_db import dispose_async_engine
+
+    await dispose_async_engine()
 
 
 app = FastAPI(title="Stock Monitoring API", lifespan=lifespan)
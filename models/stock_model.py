@@ -5,7 +5,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from database import Base
-from sqlalchemy import Column, Integer, String, DECIMAL, BigInteger, TIMESTAMP, Date, UniqueConstraint, func
+from sqlalchemy import Column, Integer, String, DECIMAL, BigInteger, TIMESTAMP, Date, DateTime, func, Double, Boolean, Index, Text
 
 
 class StockData(Base):
@@ -36,17 +36,118 @@ class StockData(Base):
     year_to_date_change_percent = Column(DECIMAL(10, 2), comment='年初至今涨跌幅')
     update_time = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp(), comment='更新时间')
 
-    __table_args__ = (UniqueConstraint('symbol', 'trade_date', name='idx_symbol_trade_date'),)
+    # 主键 (symbol, trade_date) 已保证唯一；按日期读取的选股与查询走以 trade_date 开头的覆盖索引
+    __table_args__ = (
+        Index('idx_stock_date_screen', 'trade_date', 'symbol', 'open', 'close', 'yesterday_close', 'volume', 'turnover_ratio'),
+    )
 
     def __repr__(self):
         return f"<StockData(symbol='{self.symbol}', trade_date='{self.trade_date}')>"
-    # ma5 = Column(Float)  # 5日均线
-    # ma10 = Column(Float)  # 10日均线
-    # ma20 = Column(Float)  # 20日均线
-    # ma30 = Column(Float)  # 30日均线
-    # ma60 = Column(Float)  # 60日均线
-    # ma120 = Column(Float)  # 120日均线
-    # zhanhe = Column(Float)  # 均线粘合度
+
+
+# 新增: 入库时计算的技术指标与选股条件，与 stock_data 一一对应
+class StockIndicator(Base):
+    __tablename__ = 'stock_indicators'
+
+    symbol = Column(String(10), primary_key=True, comment='代码')
+    trade_date = Column(Date, primary_key=True, comment='交易日期')
+    ma5 = Column(Double, comment='5日均线')
+    ma10 = Column(Double, comment='10日均线')
+    ma20 = Column(Double, comment='20日均线')
+    ma30 = Column(Double, comment='30日均线')
+    ma60 = Column(Double, comment='60日均线')
+    ma120 = Column(Double, comment='120日均线')
+    max_ma = Column(Double, comment='MA5~MA60最大值')
+    min_ma = Column(Double, comment='MA5~MA60最小值')
+    zhanhe = Column(Double, comment='均线粘合度')
+    zhanhe_less_3 = Column(Boolean, nullable=False, comment='近15天至少10天粘合度<3%')
+    rise_5 = Column(Boolean, nullable=False, comment='涨幅>5%')
+    vol_up = Column(Boolean, nullable=False, comment='成交量>昨日1.5倍')
+    break_ma = Column(Boolean, nullable=False, comment='阳线上穿多根均线')
+    turnover_ratio_condition = Column(Boolean, nullable=False, comment='换手率2%~5%')
+    golden_cross = Column(Boolean, nullable=False, comment='MA60上穿MA120')
+    selected = Column(Boolean, nullable=False, comment='满足全部选股条件')
+
+    __table_args__ = (Index('idx_indicator_date_selected', 'trade_date', 'selected'),)
+
+    def __repr__(self):
+        return f"<StockIndicator(symbol='{self.symbol}', trade_date='{self.trade_date}')>"
+
+# 新增: 盘中轮询得到的逐笔快照，只记录相对上一次轮询有变化的股票
+class IntradayTick(Base):
+    __tablename__ = 'stock_intraday_ticks'
+
+    symbol = Column(String(10), primary_key=True, comment='代码')
+    tick_time = Column(DateTime, primary_key=True, comment='轮询时间 (交易所时区)')
+    trade_date = Column(Date, nullable=False, comment='交易日期')
+    close = Column(DECIMAL(10, 2), comment='最新价')
+    change_percent = Column(DECIMAL(6, 3), comment='涨跌幅')
+    volume = Column(BigInteger, comment='成交量')
+    turnover_value = Column(DECIMAL(15, 2), comment='成交额')
+    high = Column(DECIMAL(10, 2), comment='最高')
+    low = Column(DECIMAL(10, 2), comment='最低')
+    turnover_ratio = Column(DECIMAL(6, 3), comment='换手率')
+    price_delta = Column(DECIMAL(10, 2), comment='较上一次轮询的价格变化')
+    volume_delta = Column(BigInteger, comment='较上一次轮询新增的成交量')
+
+    __table_args__ = (Index('idx_tick_date_time', 'trade_date', 'tick_time'),)
+
+    def __repr__(self):
+        return f"<IntradayTick(symbol='{self.symbol}', tick_time='{self.tick_time}')>"
+
+# 新增: worker 进程产生的推送事件，API 进程按 id 增量读取后转发给 SSE 客户端
+class StreamEvent(Base):
+    __tablename__ = 'stream_events'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True, comment='事件序号')
+    event = Column(String(20), nullable=False, comment='事件类型')
+    data = Column(Text(16777215), nullable=False, comment='JSON 数据 (MEDIUMTEXT)')
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp(), comment='写入时间')
+
+    def __repr__(self):
+        return f"<StreamEvent(id={self.id}, event='{self.event}')>"
+
+# 新增: 各 API 进程定期上报的 SSE 订阅者数量，worker 据此判断是否有人接收推送事件
+class StreamListener(Base):
+    __tablename__ = 'stream_listeners'
+
+    process = Column(String(100), primary_key=True, comment='API 进程 (主机名:pid)')
+    subscribers = Column(Integer, nullable=False, default=0, comment='订阅者数量')
+    updated_at = Column(DateTime, nullable=False, comment='最近一次上报时间')
+
+    def __repr__(self):
+        return f"<StreamListener(process='{self.process}', subscribers={self.subscribers})>"
+
+# 新增: API 进程提交、由 worker 执行的历史日线回补任务
+class BackfillJob(Base):
+    __tablename__ = 'backfill_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='任务序号')
+    start_date = Column(Date, nullable=False, comment='起始日期')
+    end_date = Column(Date, nullable=False, comment='结束日期')
+    symbols = Column(Text, comment='股票代码 JSON 列表，空表示全市场')
+    status = Column(String(10), nullable=False, default='pending', comment='pending / running / done / failed')
+    result = Column(Text, comment='回补结果或错误信息 (JSON)')
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp(), comment='提交时间')
+    started_at = Column(DateTime, comment='开始时间')
+    finished_at = Column(DateTime, comment='结束时间')
+
+    __table_args__ = (Index('idx_backfill_status', 'status', 'id'),)
+
+    def __repr__(self):
+        return f"<BackfillJob(id={self.id}, status='{self.status}')>"
+
+# 新增: 通过 API 注册的 TDX 风格选股公式
+class ScreenRule(Base):
+    __tablename__ = 'screen_rules'
+
+    name = Column(String(50), primary_key=True, comment='规则名称')
+    formula = Column(Text, nullable=False, comment='公式源码')
+    description = Column(String(200), comment='说明')
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp(), comment='创建时间')
+
+    def __repr__(self):
+        return f"<ScreenRule(name='{self.name}')>"
 
 # 新增: TradingCalendar 模型定义
 class TradingCalendar(Base):
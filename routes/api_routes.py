@@ -1,12 +1,18 @@
+import asyncio
 import datetime
-from typing import Annotated
-from fastapi import APIRouter, Depends,Body
+from typing import Annotated, Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends,Body, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from database import get_db, SessionLocal
-from services.data_collector import fetch_stock_data, save_stock_data, sync_trading_calendar
-from services.stock_analyzer import get_screened_stocks
+from database.async_db import get_async_db
+from services.snapshot_cache import today_cache
+from services.broadcast_hub import hub
+from services.warmup import warmup
+import config
 import logging
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -35,44 +41,437 @@ class StockUpdateRequest(BaseModel):
             # Log the error for debugging purposes (optional)
             logger.error(f"Invalid date format received: '{value}'. Error: {e}")
             raise ValueError("Invalid date format. Expected 'YYYY-MM-DD'.")
+
+class RuleRequest(BaseModel):
+    name: str
+    formula: str
+    description: Optional[str] = None
+
+class StrategyRequest(BaseModel):
+    # 未给出的阈值取 TDX 公式的默认值 (StrategyParams)
+    name: Optional[str] = None
+    zhanhe_max: Optional[float] = None
+    zhanhe_days: Optional[int] = Field(None, ge=1)
+    zhanhe_window: Optional[int] = Field(None, ge=1, le=config.SCREEN_CONFIG["max_zhanhe_window"])
+    rise_min: Optional[float] = None
+    volume_ratio: Optional[float] = None
+    turnover_min: Optional[float] = None
+    turnover_max: Optional[float] = None
+    require_break_ma: Optional[bool] = None
+    require_golden_cross: Optional[bool] = None
+
+class BatchScreenRequest(BaseModel):
+    trade_date: Optional[datetime.date] = None
+    strategies: list[StrategyRequest] = Field(min_length=1, max_length=config.SCREEN_CONFIG["max_strategies"])
+
+class BacktestRequest(BaseModel):
+    start_date: datetime.date
+    end_date: datetime.date
+    horizons: list[int] = Field([1, 5, 10, 20], min_length=1, max_length=10)
+    entry: Literal["close", "next_open"] = "close"
+    include_trades: bool = False
+
+    @field_validator("horizons")
+    @classmethod
+    def validate_horizons(cls, value):
+        if any(h < 1 or h > 250 for h in value):
+            raise ValueError("Horizons must be between 1 and 250 trading days.")
+        return sorted(set(value))
+
+class BackfillRequest(BaseModel):
+    start_date: datetime.date
+    end_date: datetime.date
+    symbols: Optional[list[str]] = None
+
+@router.get("/health/live")
+def liveness():
+    """
+    进程存活检查
+    :return: 固定返回 ok
+    """
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+def readiness():
+    """
+    就绪检查：启动预热完成前返回 503，负载均衡不会把请求转发到未预热的实例
+    :return: 预热状态及各步骤耗时
+    """
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @router.get("/stocks/today")
-def get_today_stock_data(db: Session = Depends(get_db)):
+async def get_today_stock_data():
     """
     获取今日最新行情
-    :param db: 数据库会话
+    数据来自进程内共享缓存 (已序列化的 JSON)，并发的未命中只会触发一次获取
     :return: 今日最新行情数据
     """
-    df = fetch_stock_data()
-    return df.to_dict(orient='records')
+    body = await today_cache.get()
+    return Response(content=body, media_type="application/json")
+
+@router.get("/stocks/today/stats")
+def get_today_cache_stats():
+    """
+    行情缓存的命中率与获取耗时
+    :return: 缓存统计信息
+    """
+    return today_cache.stats()
+
+@router.get("/stocks/stream")
+async def stream_stock_events(request: Request):
+    """
+    以 Server-Sent Events 推送每个采集周期的变化：
+    ticks (价格有变化的股票) 和 screen (新命中 / 不再命中选股条件的股票)
+    :return: text/event-stream 响应
+    """
+    subscription = hub.subscribe()
+    heartbeat = config.STREAM_CONFIG["heartbeat"]
+
+    async def events():
+        try:
+            yield b"retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # 注释行作为心跳，保持连接不被代理断开
+                    yield b": keep-alive\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stocks/stream/stats")
+def get_stream_stats():
+    """
+    推送订阅者数量及丢弃的事件数
+    :return: 推送统计信息
+    """
+    return hub.stats()
+
+@router.get("/db/pool")
+def get_db_pool_stats():
+    """
+    数据库连接池的占用情况、建立 / 失效的连接数及取连接的等待时间
+    :return: 连接池统计信息
+    """
+    import database
+    from database.pool_metrics import pool_metrics
+
+    return pool_metrics.snapshot(database.engine.pool)
+
+def _start_backfill(background_tasks: BackgroundTasks, start_date: datetime.date, end_date: datetime.date, symbols=None):
+    """
+    定时任务在 API 进程中运行时直接在后台回补；否则提交给 worker，API 进程不请求 AkShare
+    :return: 响应
+    """
+    if config.SCHEDULER_CONFIG["run_in_api"]:
+        from services.backfill import run_backfill
+
+        background_tasks.add_task(run_backfill, start_date, end_date, symbols)
+        return {"message": f"Backfill from {start_date} to {end_date} started"}
+
+    from services.backfill_queue import enqueue_backfill
+
+    job = enqueue_backfill(start_date, end_date, symbols)
+    return JSONResponse(
+        {"message": f"Backfill from {start_date} to {end_date} queued for the worker",
+         "job": job, "status_url": f"/api/stocks/backfill/{job['id']}"},
+        status_code=202,
+    )
 
 @router.post("/stocks/update")
-def update_stock_data(date: Annotated[datetime.date, Body(embed=True)], db: Session = Depends(get_db)):
+def update_stock_data(date: Annotated[datetime.date, Body(embed=True)], background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """
     更新股票数据
+    当日数据取实时行情，历史日期通过日线回补 (与 /stocks/backfill 相同)
+    定时任务在 worker 中运行时两者都提交给 worker，API 进程不请求 AkShare
+    :param date: 交易日期
     :param db: 数据库会话
     :return: 更新结果
     """
-    # retrieve date from the request body if needed
+    from helpers.market_time import market_now
+
     logger.info(f"Updating stock data for date: {date}")
+    # 按交易所时区判断，服务器时区不同时不会把当日误判为历史日期
+    today = market_now().date()
+    if date > today:
+        return JSONResponse({"error": f"Cannot update {date}, which is after today ({today})"}, status_code=400)
+    if date < today or not config.SCHEDULER_CONFIG["run_in_api"]:
+        return _start_backfill(background_tasks, date, date)
+
+    from services.data_collector import fetch_stock_data, save_stock_data
+
     df = fetch_stock_data()
     if not df.empty:
-        save_stock_data(df)
-        return {"message": "Stock data updated successfully"}
+        counts = save_stock_data(df)
+        return {"message": "Stock data updated successfully", **counts}
     else:
         return {"error": "Failed to fetch stock data"}
 
+@router.post("/stocks/backfill")
+def backfill_stock_data(request: BackfillRequest, background_tasks: BackgroundTasks):
+    """
+    回补指定区间的历史日线：默认提交给 worker 执行，SCHEDULER_IN_API 时在本进程后台执行
+    中断后再次提交相同区间会从检查点继续
+    :param request: 起止日期及可选的股票代码列表
+    :return: 任务已启动或已排队的提示
+    """
+    if request.start_date > request.end_date:
+        return {"error": "start_date must not be after end_date"}
+    return _start_backfill(background_tasks, request.start_date, request.end_date, request.symbols)
+
+@router.get("/stocks/backfill/{job_id}")
+def get_backfill_job_status(job_id: int):
+    """
+    提交给 worker 的回补任务的状态及结果
+    :param job_id: 任务序号
+    :return: 任务信息
+    """
+    from services.backfill_queue import get_backfill_job
+
+    job = get_backfill_job(job_id)
+    if job is None:
+        return JSONResponse({"error": f"Backfill job {job_id} not found"}, status_code=404)
+    return job
+
+async def _history_response(request: Request, db: AsyncSession, fmt: str, limit: Optional[int], filename: str, **stmt_args):
+    """分页 JSON，或以 NDJSON / CSV 流式输出全部结果"""
+    from services.history_query import (
+        DEFAULT_PAGE_SIZE,
+        MAX_PAGE_SIZE,
+        QueryError,
+        decode_cursor,
+        fetch_page,
+        parse_fields,
+        parse_ranges,
+        stream_rows,
+    )
+
+    try:
+        stmt_args["fields"] = parse_fields(stmt_args.get("fields"))
+        stmt_args["ranges"] = parse_ranges(request.query_params)
+        if fmt == "json":
+            if limit is not None and limit > MAX_PAGE_SIZE:
+                raise QueryError(f"limit must not exceed {MAX_PAGE_SIZE} for JSON pages, use format=ndjson or csv")
+            return await fetch_page(db, stmt_args, limit or DEFAULT_PAGE_SIZE)
+        # 先校验游标，避免在已开始输出后才出错
+        if stmt_args.get("cursor"):
+            decode_cursor(stmt_args["cursor"])
+        return StreamingResponse(
+            stream_rows(stmt_args, fmt, limit),
+            media_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+            headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"} if fmt == "csv" else None,
+        )
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+@router.get("/stocks")
+async def query_stock_data(
+    request: Request,
+    date: Optional[datetime.date] = None,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    symbols: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: Literal["json", "ndjson", "csv"] = "json",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    按交易日 (或日期区间)、股票代码及字段范围查询行情，按 (symbol, trade_date) 排序并用游标分页
+    范围条件写作 <字段>_min / <字段>_max，例如 close_min=10&turnover_ratio_max=5
+    :param date: 交易日期，等同于 start_date = end_date = date
+    :param symbols: 逗号分隔的股票代码
+    :param fields: 逗号分隔的返回字段，symbol 与 trade_date 总是返回
+    :param cursor: 上一页返回的 next_cursor
+    :param limit: JSON 每页行数；NDJSON / CSV 为可选的总行数上限
+    :param format: json (分页) / ndjson / csv (流式输出全部结果)
+    :return: {"items": [...], "next_cursor": ...} 或流式响应
+    """
+    if date is not None:
+        start_date = end_date = date
+    return await _history_response(
+        request, db, format, limit, f"stocks_{date or start_date or 'all'}",
+        fields=fields,
+        symbols=[s for s in (symbols or "").split(",") if s] or None,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+    )
+
+@router.get("/stocks/{symbol}/history")
+async def get_stock_history(
+    request: Request,
+    symbol: str,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: Literal["json", "ndjson", "csv"] = "json",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    单只股票的历史行情，按交易日排序，参数同 /stocks
+    :param symbol: 股票代码
+    :return: {"items": [...], "next_cursor": ...} 或流式响应
+    """
+    return await _history_response(
+        request, db, format, limit, f"{symbol}_history",
+        fields=fields,
+        symbols=[symbol],
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+    )
+
 @router.get("/stocks/screened")
-def get_screened_stocks_endpoint(db: Session = Depends(get_db)):
+async def get_screened_stocks_endpoint(db: AsyncSession = Depends(get_async_db)):
     """
     获取符合选股条件的股票列表
+    通过异步会话查询，等待数据库时不占用线程池
+    :param db: 异步数据库会话
+    :return: 符合条件的股票列表
+    """
+    from services.screen_results import get_screened_stocks_async
+
+    return await get_screened_stocks_async(db)
+
+@router.post("/stocks/screened/batch")
+def screen_strategies_endpoint(request: BatchScreenRequest):
+    """
+    批量评估多组选股阈值：历史只读取一次、均线只计算一次，所有策略在同一次向量化计算中完成
+    :param request: 交易日期 (默认最新) 及策略列表，未给出的阈值使用默认公式的值
+    :return: 每个策略命中的股票代码
+    """
+    from services.screening_engine import StrategyParams
+    from services.stock_analyzer import screen_strategies
+
+    strategies = [StrategyParams(**s.model_dump(exclude={"name"}, exclude_none=True)) for s in request.strategies]
+    trade_date, hits = screen_strategies(strategies, request.trade_date)
+    return {
+        "trade_date": trade_date,
+        "strategies": [
+            {"name": s.name or f"strategy_{i}", "params": vars(params), "count": len(symbols), "symbols": symbols}
+            for i, (s, params, symbols) in enumerate(zip(request.strategies, strategies, hits))
+        ],
+    }
+
+@router.post("/backtest")
+def backtest_endpoint(request: BacktestRequest):
+    """
+    回测 TDX 选股：在区间内每个交易日的选股结果上统计持有 N 个交易日的收益
+    所有交易日在一次向量化计算中完成选股，之后的交易日只用于计算卖出价
+    :param request: 信号起止日期、持有天数、买入价 (当日收盘 / 次日开盘) 及是否返回逐笔明细
+    :return: 各持有期的胜率与收益统计
+    """
+    from services.backtest import run_backtest
+    from services.broadcast_hub import records
+
+    if request.start_date > request.end_date:
+        return {"error": "start_date must not be after end_date"}
+    result = run_backtest(request.start_date, request.end_date, request.horizons, request.entry)
+    response = {
+        "start_date": request.start_date,
+        "end_date": request.end_date,
+        "entry": request.entry,
+        "trading_days": result.trading_days,
+        "signal_days": result.signal_days,
+        "signals": len(result.trades),
+        "summary": result.summary,
+    }
+    if request.include_trades:
+        response["trades"] = records(result.trades)
+    return response
+
+@router.get("/rules")
+def list_rules_endpoint(db: Session = Depends(get_db)):
+    """
+    列出内置及已注册的选股公式
+    :param db: 数据库会话
+    :return: 规则列表 (名称、公式、说明、所需历史天数)
+    """
+    from services.screen_rules import list_rules
+
+    return list_rules(db)
+
+@router.post("/rules")
+def register_rule_endpoint(request: RuleRequest, db: Session = Depends(get_db)):
+    """
+    注册 (或替换) 一条 TDX 风格的选股公式，例如 "CROSS(MA(C,5),MA(C,20)) AND V>REF(V,1)*2"
+    公式在注册时编译，语法错误直接返回
+    :param request: 规则名称、公式及说明
+    :param db: 数据库会话
+    :return: 注册结果
+    """
+    from services.formula import FormulaError
+    from services.screen_rules import register_rule
+
+    try:
+        compiled = register_rule(db, request.name, request.formula, request.description)
+    except FormulaError as e:
+        return JSONResponse({"error": str(e), "position": e.position}, status_code=400)
+    return {"message": f"Rule {request.name} registered", "fields": sorted(compiled.fields), "lookback": compiled.lookback}
+
+@router.delete("/rules/{name}")
+def delete_rule_endpoint(name: str, db: Session = Depends(get_db)):
+    """
+    删除已注册的选股公式 (内置规则不可删除)
+    :param name: 规则名称
+    :param db: 数据库会话
+    :return: 删除结果
+    """
+    from services.screen_rules import delete_rule
+
+    if not delete_rule(db, name):
+        return JSONResponse({"error": f"Rule {name} not found"}, status_code=404)
+    return {"message": f"Rule {name} deleted"}
+
+@router.get("/rules/stats")
+def get_rule_screen_stats():
+    """
+    公式选股缓存的历史窗口及已计算 / 复用的算子数
+    :return: 统计信息
+    """
+    from services.screen_rules import rule_screener
+
+    return rule_screener.stats()
+
+@router.get("/rules/{names}/screen")
+def screen_by_rules_endpoint(names: str, trade_date: Optional[datetime.date] = None, db: Session = Depends(get_db)):
+    """
+    按一条或多条公式选股，多条规则用逗号分隔，需同时满足
+    同一交易日的历史及中间结果在进程内复用，新规则只计算它独有的算子
+    :param names: 规则名称，例如 rise_5,vol_up
+    :param trade_date: 交易日期，默认为最新交易日
     :param db: 数据库会话
     :return: 符合条件的股票列表
     """
-    selected_stocks = get_screened_stocks()
-    return selected_stocks.to_dict(orient='records')
+    from services.broadcast_hub import records
+    from services.formula import FormulaError
+    from services.screen_rules import load_rules, rule_screener
+
+    try:
+        formulas = load_rules(db, [n for n in names.split(",") if n])
+    except KeyError as e:
+        return JSONResponse({"error": f"Unknown rules: {e.args[0]}"}, status_code=404)
+    except FormulaError as e:
+        return JSONResponse({"error": str(e), "position": e.position}, status_code=400)
+    if not formulas:
+        return JSONResponse({"error": "No rule given"}, status_code=400)
+    return records(rule_screener.screen(formulas, trade_date))
 
 @router.post("/stocks/sync_trading_calendar")
 def sync_trading_calendar_endpoint():
+    from services.data_collector import sync_trading_calendar
+
     res = sync_trading_calendar()
     if res is None:
         return {"error": "Failed to sync trading calendar"}
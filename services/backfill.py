@@ -0,0 +1,285 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import pandas as pd
+
+import config
+from database.database_utils import db_session_scope
+from helpers.data_cleaner import clean_stock_data, translate_chinese_columns
+from models.stock_model import StockData
+
+logger = logging.getLogger(__name__)
+
+
+class AkShareHistorySource:
+    """
+    Default data source: the symbol universe and per-symbol daily bars from AkShare.
+
+    Any object with the same two methods can be passed to run_backfill instead,
+    e.g. a local fake that serves bars from a DataFrame.
+    """
+
+    def __init__(self, adjust: str = "", timeout: Optional[float] = None):
+        self.adjust = adjust
+        self.timeout = timeout or config.AKSHARE_CONFIG["timeout"]
+
+    def list_symbols(self) -> pd.DataFrame:
+        """:return: DataFrame with symbol and name columns."""
+        import akshare as ak
+
+        return ak.stock_info_a_code_name().rename(columns={"code": "symbol"})[["symbol", "name"]]
+
+    def daily_bars(self, symbol: str, start_date: date, end_date: date) -> pd.DataFrame:
+        """:return: Raw daily bars of one symbol (AkShare's Chinese column names)."""
+        import akshare as ak
+
+        return ak.stock_zh_a_hist(
+            symbol=symbol,
+            period="daily",
+            start_date=start_date.strftime("%Y%m%d"),
+            end_date=end_date.strftime("%Y%m%d"),
+            adjust=self.adjust,
+            timeout=self.timeout,
+        )
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart, shared by all worker threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def fetch_with_retry(source, symbol: str, start_date: date, end_date: date, limiter: RateLimiter,
+                     max_retries: int, backoff: float) -> pd.DataFrame:
+    """
+    Fetches the daily bars of one symbol, retrying with exponential backoff.
+
+    :raises Exception: The last error once max_retries attempts have failed.
+    """
+    for attempt in range(1, max_retries + 1):
+        limiter.acquire()
+        try:
+            return source.daily_bars(symbol, start_date, end_date)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(f"Fetching {symbol} failed (attempt {attempt}/{max_retries}): {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def normalize_bars(raw: pd.DataFrame, symbol: str, name: Optional[str]) -> pd.DataFrame:
+    """
+    Turns raw daily bars into stock_data rows through clean_stock_data.
+
+    yesterday_close is derived as close - change_amount. Columns the source does
+    not provide (valuation, intraday speed, ...) are dropped, so an upsert never
+    overwrites values captured from the real-time feed with NULL.
+
+    :param raw: Output of the source's daily_bars.
+    :param symbol: Symbol of the bars.
+    :param name: Stock name, or None if unknown.
+    :return: Cleaned rows with trade_date as date objects.
+    """
+    if raw is None or raw.empty:
+        return pd.DataFrame()
+    df = translate_chinese_columns(raw)
+    df["symbol"] = symbol
+    if name is not None:
+        df["name"] = name
+    if "yesterday_close" not in df.columns and {"close", "change_amount"} <= set(df.columns):
+        df["yesterday_close"] = (pd.to_numeric(df["close"]) - pd.to_numeric(df["change_amount"])).round(2)
+    supplied = set(df.columns)
+
+    cleaned = clean_stock_data(df)
+    cleaned = cleaned[[c for c in cleaned.columns if c in supplied]].copy()
+    cleaned["trade_date"] = pd.to_datetime(cleaned["trade_date"]).dt.date
+    return cleaned
+
+
+def checkpoint_path(start_date: date, end_date: date) -> Path:
+    return Path(config.BACKFILL_CONFIG["checkpoint_dir"]) / f"{start_date:%Y%m%d}_{end_date:%Y%m%d}.json"
+
+
+def _load_checkpoint(path: Path, start_date: date, end_date: date) -> dict:
+    if path.exists():
+        state = json.loads(path.read_text(encoding="utf-8"))
+        # 旧版本在回补完成后仍保留检查点 (materialized 为 true)，这类检查点不再续跑
+        if not state.get("materialized"):
+            logger.info(f"Resuming backfill from {path}: {len(state['done'])} symbols already loaded.")
+            return state
+        logger.info(f"Ignoring the checkpoint of a finished backfill in {path}.")
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "done": [],
+        "failed": {},
+    }
+
+
+def _save_checkpoint(path: Path, state: dict):
+    """Writes the checkpoint atomically, so an interrupted write never corrupts it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp-{os.getpid()}")
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _refresh_derived(start_date: date, end_date: date):
+    """Recomputes indicators for the backfilled range (and the days depending on it), then rebuilds the cube."""
+    from services.history_cube import build_history_cube
+    from services.stock_analyzer import rematerialize_indicators
+
+    with db_session_scope() as db:
+        dates = [
+            d for (d,) in db.query(StockData.trade_date)
+            .filter(StockData.trade_date.between(start_date, end_date))
+            .distinct()
+        ]
+        refreshed = rematerialize_indicators(db, dates)
+    logger.info(f"Recomputed indicators for {len(refreshed)} trade dates.")
+    try:
+        build_history_cube()
+    except Exception as e:
+        logger.error(f"Failed to rebuild the history cube after backfill: {e}")
+
+
+def run_backfill(start_date: date, end_date: date, symbols=None, source=None, resume: bool = True,
+                 max_workers: Optional[int] = None, requests_per_second: Optional[float] = None,
+                 chunk_size: Optional[int] = None) -> dict:
+    """
+    Backfills stock_data with daily bars for a date range.
+
+    Symbols are processed in chunks: the bars of a chunk are fetched concurrently
+    by a bounded, rate-limited thread pool, cleaned, and upserted in trade_date
+    order in one transaction, after which the chunk is recorded in a checkpoint
+    file, so a rerun of an interrupted range skips the symbols already loaded.
+    Indicators and the history cube are rebuilt once, after the last chunk, and the
+    checkpoint is then removed: the next request for the same range loads it again.
+    Symbols without a name in the source's universe are skipped and reported as failed,
+    since stock_data.name is required.
+
+    :param start_date: First trade date (inclusive).
+    :param end_date: Last trade date (inclusive).
+    :param symbols: Symbols to load, defaults to the source's whole universe.
+    :param source: Data source with list_symbols() and daily_bars(symbol, start, end),
+        defaults to AkShareHistorySource.
+    :param resume: Continue an interrupted run from its checkpoint; False starts over.
+    :param max_workers: Fetch threads, defaults to BACKFILL_CONFIG['max_workers'].
+    :param requests_per_second: Request rate limit, defaults to BACKFILL_CONFIG['requests_per_second'].
+    :param chunk_size: Symbols per write / checkpoint, defaults to BACKFILL_CONFIG['chunk_size'].
+    :return: Summary with symbols, rows, inserted, updated, failed, seconds and symbols_per_min.
+    """
+    from services.data_collector import save_stock_data
+
+    settings = config.BACKFILL_CONFIG
+    source = source or AkShareHistorySource()
+    max_workers = max_workers or settings["max_workers"]
+    chunk_size = chunk_size or settings["chunk_size"]
+    limiter = RateLimiter(requests_per_second or settings["requests_per_second"])
+
+    path = checkpoint_path(start_date, end_date)
+    if not resume and path.exists():
+        path.unlink()
+    state = _load_checkpoint(path, start_date, end_date)
+
+    universe = source.list_symbols()
+    names = dict(zip(universe["symbol"], universe["name"]))
+    done = set(state["done"])
+    todo = [s for s in (symbols or list(names)) if s not in done]
+    unnamed = [s for s in todo if not names.get(s)]
+    if unnamed:
+        logger.warning(f"Skipping {len(unnamed)} symbols missing from the source's universe: {unnamed[:20]}")
+        state["failed"].update({s: "not in the symbol universe" for s in unnamed})
+        todo = [s for s in todo if names.get(s)]
+    logger.info(f"Backfilling {len(todo)} symbols from {start_date} to {end_date} with {max_workers} workers.")
+
+    summary = {"symbols": 0, "rows": 0, "inserted": 0, "updated": 0, "failed": 0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for offset in range(0, len(todo), chunk_size):
+            chunk = todo[offset:offset + chunk_size]
+            futures = {
+                pool.submit(fetch_with_retry, source, s, start_date, end_date, limiter,
+                            settings["max_retries"], settings["retry_backoff"]): s
+                for s in chunk
+            }
+            frames, loaded = [], []
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    frames.append(normalize_bars(future.result(), symbol, names[symbol]))
+                    loaded.append(symbol)
+                except Exception as e:
+                    logger.error(f"Giving up on {symbol}: {e}")
+                    state["failed"][symbol] = str(e)
+
+            frames = [f for f in frames if not f.empty]
+            if frames:
+                df = pd.concat(frames, ignore_index=True).sort_values(["trade_date", "symbol"], kind="stable")
+                counts = save_stock_data(df, update_derived=False)
+                summary["rows"] += len(df)
+                summary["inserted"] += counts["inserted"]
+                summary["updated"] += counts["updated"]
+
+            state["done"].extend(loaded)
+            for symbol in loaded:
+                state["failed"].pop(symbol, None)
+            _save_checkpoint(path, state)
+
+            summary["symbols"] += len(loaded)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Backfill progress: {offset + len(chunk)}/{len(todo)} symbols, {summary['rows']} rows, "
+                f"{summary['symbols'] / elapsed * 60:.1f} symbols/min"
+            )
+
+    _refresh_derived(start_date, end_date)
+    # 完成的回补不保留检查点，否则同一区间再次请求时会被当作已完成而直接跳过
+    path.unlink(missing_ok=True)
+
+    seconds = time.perf_counter() - started
+    summary["failed"] = len(state["failed"])
+    summary["seconds"] = round(seconds, 2)
+    summary["symbols_per_min"] = round(summary["symbols"] / seconds * 60, 1) if seconds else None
+    logger.info(f"Backfill from {start_date} to {end_date} finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill stock_data with daily bars from AkShare.")
+    parser.add_argument("start_date", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("end_date", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--symbols", nargs="+", default=None, help="defaults to every A-share symbol")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rps", type=float, default=None, help="requests per second")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_backfill(args.start_date, args.end_date, args.symbols, resume=not args.restart,
+                          max_workers=args.workers, requests_per_second=args.rps)
+    print(result)
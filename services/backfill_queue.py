@@ -0,0 +1,130 @@
+import json
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from database.database_utils import db_session_scope
+from models.stock_model import BackfillJob
+
+logger = logging.getLogger(__name__)
+
+
+def _as_dict(job: BackfillJob) -> dict:
+    return {
+        "id": job.id,
+        "start_date": str(job.start_date),
+        "end_date": str(job.end_date),
+        "symbols": json.loads(job.symbols) if job.symbols else None,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at and str(job.created_at),
+        "started_at": job.started_at and str(job.started_at),
+        "finished_at": job.finished_at and str(job.finished_at),
+    }
+
+
+def enqueue_backfill(start_date: date, end_date: date, symbols: Optional[list] = None) -> dict:
+    """
+    Queues a backfill for the worker; used by API processes, which never fetch history themselves.
+
+    :return: The queued job.
+    """
+    with db_session_scope(join=False) as db:
+        job = BackfillJob(start_date=start_date, end_date=end_date,
+                          symbols=json.dumps(symbols) if symbols else None, status="pending")
+        db.add(job)
+        db.flush()
+        queued = _as_dict(job)
+    logger.info(f"Queued backfill job {queued['id']} from {start_date} to {end_date}.")
+    return queued
+
+
+def get_backfill_job(job_id: int) -> Optional[dict]:
+    with db_session_scope() as db:
+        job = db.get(BackfillJob, job_id)
+        return _as_dict(job) if job is not None else None
+
+
+def _claim_next() -> Optional[BackfillJob]:
+    """Marks the oldest pending job as running; :return: the job, None when the queue is empty."""
+    with db_session_scope(join=False) as db:
+        job = db.query(BackfillJob).filter(BackfillJob.status == "pending").order_by(BackfillJob.id).first()
+        if job is None:
+            return None
+        claimed = (
+            db.query(BackfillJob)
+            .filter(BackfillJob.id == job.id, BackfillJob.status == "pending")
+            .update({"status": "running", "started_at": datetime.now()}, synchronize_session=False)
+        )
+        if not claimed:
+            return None
+        db.expunge(job)
+        return job
+
+
+def _finish(job_id: int, status: str, result: dict):
+    with db_session_scope(join=False) as db:
+        db.query(BackfillJob).filter(BackfillJob.id == job_id).update(
+            {"status": status, "result": json.dumps(result), "finished_at": datetime.now()},
+            synchronize_session=False,
+        )
+
+
+def requeue_interrupted() -> int:
+    """
+    Puts jobs left running by a worker that stopped back in the queue; run_backfill
+    resumes them from their checkpoint. Only the scheduler leader calls this.
+
+    :return: Number of jobs requeued.
+    """
+    with db_session_scope(join=False) as db:
+        count = (
+            db.query(BackfillJob)
+            .filter(BackfillJob.status == "running")
+            .update({"status": "pending", "started_at": None}, synchronize_session=False)
+        )
+    if count:
+        logger.warning(f"Requeued {count} interrupted backfill jobs.")
+    return count
+
+
+def _collect_today() -> dict:
+    """Captures today from the real-time feed, as /stocks/update did in the API process before."""
+    from services.data_collector import fetch_stock_data, save_stock_data
+
+    df = fetch_stock_data()
+    if df.empty:
+        raise RuntimeError("Failed to fetch stock data")
+    return save_stock_data(df)
+
+
+def _run_job(job: BackfillJob) -> dict:
+    from helpers.market_time import market_now
+    from services.backfill import run_backfill
+
+    # /stocks/update 提交的当日任务取实时行情，当日的日线尚未收盘
+    if job.start_date == job.end_date == market_now().date():
+        return _collect_today()
+    symbols = json.loads(job.symbols) if job.symbols else None
+    return run_backfill(job.start_date, job.end_date, symbols)
+
+
+def run_queued_backfills() -> int:
+    """
+    Scheduler job of the worker: runs the queued backfills one after another.
+    A job for today's date alone captures the real-time feed instead of daily bars.
+
+    :return: Number of jobs processed.
+    """
+    processed = 0
+    while (job := _claim_next()) is not None:
+        logger.info(f"Running backfill job {job.id} from {job.start_date} to {job.end_date}.")
+        try:
+            summary = _run_job(job)
+        except Exception as e:
+            logger.error(f"Backfill job {job.id} failed: {e}")
+            _finish(job.id, "failed", {"error": str(e)})
+        else:
+            _finish(job.id, "done", summary)
+        processed += 1
+    return processed
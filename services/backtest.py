@@ -0,0 +1,215 @@
+import bisect
+import logging
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from database.database_utils import db_session_scope
+from services.history_cube import open_history_cube
+from services.history_loader import load_history, window_start_date
+from services.indicator_state import REBUILD_DAYS
+from services.screening_engine import MarketMatrix, pivot_fields
+
+logger = logging.getLogger(__name__)
+
+# 默认的持有交易日数
+DEFAULT_HORIZONS = (1, 5, 10, 20)
+# 买入价：信号当日收盘价，或次日开盘价
+ENTRY_PRICES = ("close", "next_open")
+
+
+@dataclass
+class BacktestResult:
+    """Per-trade forward returns of every screen hit and their statistics per holding period."""
+
+    trades: pd.DataFrame
+    summary: list = field(default_factory=list)
+    signal_days: int = 0
+    trading_days: int = 0
+
+
+def _entry_prices(matrix: MarketMatrix, entry: str) -> np.ndarray:
+    if entry == "close":
+        return matrix.fields["close"]
+    if entry == "next_open":
+        out = np.full(matrix.shape, np.nan)
+        out[:-1] = matrix.fields["open"][1:]
+        return out
+    raise ValueError(f"entry must be one of {ENTRY_PRICES}, got {entry!r}")
+
+
+def _forward_returns(close: np.ndarray, entry: np.ndarray, horizon: int) -> np.ndarray:
+    """(dates × symbols) return from the entry price on day t to the close of day t + horizon; NaN where unknown."""
+    out = np.full(close.shape, np.nan)
+    if horizon < close.shape[0]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:-horizon] = close[horizon:] / entry[:-horizon] - 1
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def _screen_hits_in_chunks(matrix: MarketMatrix, first_row: int, last_row: int, workers: Optional[int],
+                           chunk_rows: int) -> tuple:
+    """
+    Screen hits on rows first_row..last_row, screened `chunk_rows` dates at a time.
+
+    Every chunk also gets the REBUILD_DAYS - 1 rows before it, everything the screen on its
+    first date reads, so the hits are identical to one pass over the whole matrix while the
+    indicator and condition planes only ever cover one chunk (the field slices are views).
+
+    :return: (date_pos, symbol_pos) in (date, symbol) order, positions in `matrix`.
+    """
+    from services.parallel_screen import parallel_screen_hits
+
+    overlap = REBUILD_DAYS - 1
+    date_parts, symbol_parts = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.intp)]
+    for start in range(first_row, last_row + 1, chunk_rows):
+        stop = min(start + chunk_rows, last_row + 1)
+        lo = max(start - overlap, 0)
+        fields = {name: values[lo:stop] for name, values in matrix.fields.items()}
+        chunk = MarketMatrix(matrix.dates[lo:stop], matrix.symbols, fields)
+        date_pos, symbol_pos, _ = parallel_screen_hits(chunk, workers)
+        keep = date_pos >= start - lo
+        date_parts.append(date_pos[keep] + lo)
+        symbol_parts.append(symbol_pos[keep])
+    return np.concatenate(date_parts), np.concatenate(symbol_parts)
+
+
+def _market_mean(returns: np.ndarray, chunk_rows: int) -> np.ndarray:
+    """Equal-weight mean return of all symbols per row, NaN for rows without any; computed in row blocks."""
+    market = np.full(returns.shape[0], np.nan)
+    for start in range(0, returns.shape[0], chunk_rows):
+        block = returns[start:start + chunk_rows]
+        counted = (~np.isnan(block)).any(axis=1)
+        market[start:start + chunk_rows][counted] = np.nanmean(block[counted], axis=1)
+    return market
+
+
+def _summarize(horizon: int, returns: np.ndarray, excess: np.ndarray) -> dict:
+    returns = returns[~np.isnan(returns)]
+    excess = excess[~np.isnan(excess)]
+    if returns.size == 0:
+        return {"horizon": horizon, "trades": 0}
+    return {
+        "horizon": horizon,
+        "trades": int(returns.size),
+        "hit_rate": float(np.mean(returns > 0)),
+        "mean_return": float(returns.mean()),
+        "median_return": float(np.median(returns)),
+        "std_return": float(returns.std()),
+        "best": float(returns.max()),
+        "worst": float(returns.min()),
+        # 相对同日全市场等权平均收益
+        "mean_excess": float(excess.mean()) if excess.size else None,
+        "excess_hit_rate": float(np.mean(excess > 0)) if excess.size else None,
+    }
+
+
+def backtest_matrix(matrix: MarketMatrix, first_row: int = 0, last_row: Optional[int] = None,
+                    horizons=DEFAULT_HORIZONS, entry: str = "close", workers: Optional[int] = None,
+                    chunk_rows: Optional[int] = None) -> BacktestResult:
+    """
+    Replays the TDX screen on every trading day of the matrix, vectorized over chunks
+    of dates, and measures the forward returns of its hits.
+
+    The screen at day t only reads rows up to t, so every signal is what the live
+    screen would have produced that day. Rows after `last_row` only supply exit prices.
+    Peak memory grows with the chunk size rather than the tested range: 5000 symbols
+    over 1250 days took ~2.5 GB in one pass.
+
+    :param matrix: MarketMatrix with SCREEN_FIELDS, including the warm-up rows before `first_row`.
+    :param first_row: First row whose signals are traded (earlier rows only warm up the MAs).
+    :param last_row: Last row whose signals are traded, defaults to the last row.
+    :param horizons: Holding periods in trading days.
+    :param entry: "close" buys at the signal day's close, "next_open" at the next day's open.
+    :param workers: Screening processes, see parallel_screen.resolve_workers.
+    :param chunk_rows: Dates screened at a time, defaults to SCREEN_CONFIG['backtest_chunk_days'].
+    :return: BacktestResult; trades has symbol, signal_date, entry_price and return_<h> / excess_<h> per horizon.
+    """
+    last_row = matrix.shape[0] - 1 if last_row is None else last_row
+    chunk_rows = chunk_rows or config.SCREEN_CONFIG["backtest_chunk_days"]
+    date_pos, symbol_pos = _screen_hits_in_chunks(matrix, first_row, last_row, workers, chunk_rows)
+
+    close = matrix.fields["close"]
+    entry_prices = _entry_prices(matrix, entry)
+    trades = pd.DataFrame({
+        "symbol": matrix.symbols[symbol_pos],
+        "signal_date": matrix.dates[date_pos],
+        "entry_price": entry_prices[date_pos, symbol_pos],
+    })
+
+    summary = []
+    for horizon in horizons:
+        returns = _forward_returns(close, entry_prices, horizon)
+        # 同一天买入全部股票的等权平均收益作为基准
+        market = _market_mean(returns, chunk_rows)
+        trade_returns = returns[date_pos, symbol_pos]
+        # 下一个持有期的收益矩阵分配前先释放这一个
+        del returns
+        trade_excess = trade_returns - market[date_pos]
+        trades[f"return_{horizon}"] = trade_returns
+        trades[f"excess_{horizon}"] = trade_excess
+        summary.append(_summarize(horizon, trade_returns, trade_excess))
+
+    return BacktestResult(
+        trades=trades,
+        summary=summary,
+        signal_days=int(np.unique(date_pos).size),
+        trading_days=max(last_row - first_row + 1, 0),
+    )
+
+
+def _load_matrix(start_date: date, end_date: date, horizon: int) -> tuple:
+    """
+    Loads the warm-up rows before `start_date`, the tested range and up to `horizon`
+    trading days after `end_date`, from the history cube when it has been built.
+
+    :return: (matrix, first_row, last_row), matrix is None when there is no data.
+    """
+    # 交易日数按日历天数放宽，足以覆盖长假
+    load_end = end_date + timedelta(days=horizon * 2 + 14)
+    cube = open_history_cube()
+    if cube is not None:
+        cube.refresh()
+    if cube is not None and cube.dates and cube.dates[0] <= start_date:
+        stop = bisect.bisect_right(cube.dates, load_end)
+        start = max(bisect.bisect_left(cube.dates, start_date) - (REBUILD_DAYS - 1), 0)
+        matrix = cube.matrix(cube.dates[stop - 1], stop - start)
+        logger.info(f"Backtest reads {stop - start} days from the history cube.")
+    else:
+        with db_session_scope() as db:
+            history = load_history(db, load_end, start_date=window_start_date(db, start_date))
+        if history.empty:
+            return None, 0, -1
+        matrix = pivot_fields(history)
+
+    first_row = int(np.searchsorted(matrix.dates, np.datetime64(start_date, "D"), side="left"))
+    last_row = int(np.searchsorted(matrix.dates, np.datetime64(end_date, "D"), side="right")) - 1
+    return matrix, first_row, last_row
+
+
+def run_backtest(start_date: date, end_date: date, horizons=DEFAULT_HORIZONS, entry: str = "close",
+                 workers: Optional[int] = None) -> BacktestResult:
+    """
+    Backtests the TDX screen over stored history.
+
+    :param start_date: First signal date.
+    :param end_date: Last signal date; later stored days are only used for exits.
+    :param horizons: Holding periods in trading days.
+    :param entry: See backtest_matrix.
+    :param workers: See backtest_matrix.
+    """
+    matrix, first_row, last_row = _load_matrix(start_date, end_date, max(horizons))
+    if matrix is None or last_row < first_row:
+        logger.warning(f"No stock data between {start_date} and {end_date}.")
+        return BacktestResult(trades=pd.DataFrame(), summary=[{"horizon": h, "trades": 0} for h in horizons])
+    result = backtest_matrix(matrix, first_row, last_row, horizons, entry, workers)
+    logger.info(
+        f"Backtest {start_date}..{end_date}: {len(result.trades)} signals on "
+        f"{result.signal_days} of {result.trading_days} trading days."
+    )
+    return result
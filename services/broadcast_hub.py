@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import threading
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Optional
+
+import config
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    # 只会遇到由 DataFrame 生成的值，此时 numpy / pandas 已加载
+    import numpy as np
+    import pandas as pd
+
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload) -> str:
+    """Event payload as compact JSON text."""
+    return json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+
+def records(df: "pd.DataFrame") -> list:
+    """DataFrame rows as JSON-ready dicts (NaN / NA become None)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+class Subscription:
+    """One client's bounded event queue; when it is full the oldest event is dropped."""
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, frame: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+class BroadcastHub:
+    """
+    Fan-out of server-sent events from the collector threads to every connected client.
+
+    An event is serialized once into an SSE frame in the publishing thread and the
+    same bytes are handed to every subscriber on the event loop, so the cost of a
+    cycle does not grow with the number of clients. Each subscriber has its own
+    bounded queue; a slow client only loses its own oldest events and never blocks
+    the publisher.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or config.STREAM_CONFIG["queue_size"]
+        self._subscribers = set()
+        self._loop = None
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self.published = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Attaches the hub to the event loop serving the clients; called once at application start-up."""
+        self._loop = loop
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def listening(self) -> bool:
+        """Whether publishing has any effect; publishers skip building events otherwise."""
+        return bool(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        """Registers a client; must be called on the event loop."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        logger.info(f"Stream client connected ({len(self._subscribers)} subscribers).")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+        logger.info(f"Stream client disconnected ({len(self._subscribers)} subscribers).")
+
+    def publish(self, event: str, payload) -> bool:
+        """
+        Serializes `payload` once and queues it for every subscriber. Safe to call from any thread.
+
+        :param event: SSE event name.
+        :param payload: JSON-serializable object.
+        :return: False when nobody is listening (nothing was serialized).
+        """
+        if not self._subscribers or self._loop is None or self._loop.is_closed():
+            return False
+        return self.publish_serialized(event, dumps(payload))
+
+    def publish_serialized(self, event: str, data: str) -> bool:
+        """Queues an event whose payload is already JSON text, e.g. relayed from another process."""
+        if not self._subscribers or self._loop is None or self._loop.is_closed():
+            return False
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        frame = f"id: {sequence}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+        self._loop.call_soon_threadsafe(self._fan_out, frame)
+        self.published += 1
+        return True
+
+    def _fan_out(self, frame: bytes):
+        for subscription in list(self._subscribers):
+            subscription.offer(frame)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "queue_size": self.queue_size,
+            "dropped": sum(s.dropped for s in self._subscribers),
+            "max_backlog": max((s.queue.qsize() for s in self._subscribers), default=0),
+        }
+
+
+# 进程内共享的推送中心
+hub = BroadcastHub()
@@ -1,61 +1,23 @@
 from typing import Optional
-import akshare as ak
 import pandas as pd
 from models.stock_model import StockData, TradingCalendar
 from database import SessionLocal
-import os
-import re
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 from helpers.data_cleaner import clean_stock_data
-from functools import lru_cache  # 新增：用于缓存交易日历
+from helpers.snapshot_store import load_snapshot, write_snapshot
+from helpers.market_time import is_final, market_now
 import logging
 from database.database_utils import db_session_scope
+from database.bulk_loader import bulk_insert_frame, bulk_upsert_frame, diff_frame
+import config
+from services.stock_analyzer import rematerialize_indicators
+from services.history_cube import append_to_history_cube
+from services.trading_calendar import trading_calendar
 
 logger = logging.getLogger(__name__)
 
-
-def load_trading_calendar_from_db():
-    db = SessionLocal()
-    try:
-        trading_calendar = db.query(TradingCalendar.trade_date)
-        trading_calendar = (
-            trading_calendar.order_by(TradingCalendar.trade_date.desc())
-            .limit(365)
-            .all()
-        )
-        logger.debug(
-            f"Loaded trading calendar from DB: {[date[0] for date in trading_calendar][:-5:]}"
-        )
-        return [date[0] for date in trading_calendar]
-    except Exception as e:
-        print(f"Error loading trading calendar from DB: {e}")
-        return []
-    finally:
-        db.close()
-
-
-def save_trading_calendar_to_db(trading_calendar):
-    db = SessionLocal()
-    try:
-        # 使用ORM批量插入交易日
-        for date in trading_calendar:
-            db.add(TradingCalendar(trade_date=date))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Error saving trading calendar to DB: {e}")
-    finally:
-        db.close()
-    # with db_session_scope() as db:
-    #     # 确保交易日历表中没有重复的日期
-    #     db.query(TradingCalendar).filter(
-    #         TradingCalendar.trade_date.in_(trading_calendar)
-    #     ).delete(synchronize_session=False)
-    #     db.bulk_insert_mappings(
-    #         TradingCalendar.__mapper__,
-    #         [{"trade_date": date} for date in trading_calendar],
-    #     )
-    #     db.commit()
+# stock_data 的唯一键
+KEY_COLUMNS = ["symbol", "trade_date"]
 
 
 import pandas as pd
@@ -71,6 +33,8 @@ def sync_trading_calendar():
     then adds new dates and removes outdated ones.
     It's designed to be called as a service in a route.
     """
+    import akshare as ak
+
     try:
         logger.info("Initiating trading calendar synchronization...")
 
@@ -86,11 +50,10 @@ def sync_trading_calendar():
                 )
                 return {"status": "warning", "message": "AkShare data is empty."}
 
-            latest_calendar_dates = set(ak_calendar_df["trade_date"].values)
+            latest_calendar_dates = set(pd.to_datetime(ak_calendar_df["trade_date"]).dt.date)
 
-            # Load existing trading calendar from the database
-            # Assuming load_trading_calendar_from_db returns a list of date objects or strings
-            cached_calendar_dates = set(load_trading_calendar_from_db())
+            # Compare against every stored date, not just the recent ones, so old dates are not re-added
+            cached_calendar_dates = {d for (d,) in db.query(TradingCalendar.trade_date)}
             logger.info(f"Loaded {len(cached_calendar_dates)} dates from database.")
 
             # Determine dates to add and remove
@@ -129,6 +92,7 @@ def sync_trading_calendar():
                 }
 
             db.commit()
+            trading_calendar.invalidate()
             logger.info(
                 f"Successfully synced trading calendar: Added {added_count} dates, Removed {removed_count} dates."
             )
@@ -153,79 +117,43 @@ def sync_trading_calendar():
         logger.info("Trading calendar synchronization process finished.")
 
 
-# 修改：is_trading_day 函数，优先从缓存或数据库中读取交易日历
-@lru_cache(maxsize=None)  # 新增：使用缓存机制
-def is_trading_day(date):
-    """
-    判断给定日期是否为交易日
-    :param date: 需要判断的日期
-    :return: True if trading day, False otherwise
-    """
-    # 优先从缓存中读取交易日历
-    cached_calendar = load_trading_calendar_from_db()
-    if cached_calendar:
-        return date.strftime("%Y-%m-%d") in cached_calendar
-
-    # 如果缓存为空，从 AkShare 获取交易日历并保存到数据库
-    trading_calendar = ak.tool_trade_date_hist_sina()["trade_date"].values.tolist()
-    save_trading_calendar_to_db(trading_calendar)
-    return date.strftime("%Y-%m-%d") in trading_calendar
-
-
-def fetch_stock_data(date_str_req: Optional[str] = None) -> pd.DataFrame:
+def fetch_stock_data(date_str_req: Optional[str] = None, refresh: bool = False) -> pd.DataFrame:
     """
     使用 AkShare 获取 A 股市场实时数据
+    只有收盘后的 (不再变化的) 数据才会保存为本地快照
+    :param date_str_req: 可选，YYYYMMDD 格式的日期，优先读取该日的本地快照
+    :param refresh: 跳过本地快照，直接请求实时行情
     :return: 包含股票数据的 DataFrame
     """
     try:
-        # 检查本地CSV文件是否存在
-        today = datetime.now().date()
+        # 优先读取本地快照
+        current_time = market_now()
+        today = current_time.date()
         file_str = date_str_req if date_str_req else today.strftime("%Y%m%d")
-        local_csv_path = f"stock_data_{file_str}.csv"
+        snapshot = None if refresh else load_snapshot(datetime.strptime(file_str, "%Y%m%d").date())
+        if snapshot is not None:
+            logger.info(f"成功从本地快照加载股票数据: {file_str}")
+            return snapshot
 
-        if os.path.exists(local_csv_path):
-            # 从本地CSV读取数据
-            df = pd.read_csv(
-                local_csv_path,
-                dtype={"代码": str},  # 确保代码列为字符串类型
-            )
-            logger.info("成功从本地CSV加载股票数据")
-
-            # 从文件名提取日期
-            match = re.search(r"stock_data_(\d{8})", local_csv_path)
-            if match:
-                date_str = match.group(1)
-                date = datetime.strptime(date_str, "%Y%m%d").date()
-            else:
-                raise ValueError("无法从文件名中提取日期")
-                date = datetime.now().date()  # 默认使用当前日期
-        else:
-            # 获取实时行情数据
-            df = ak.stock_zh_a_spot_em()
-            if df.empty:
-                logger.warning("没有获取到股票数据")
-                return pd.DataFrame()
-
-            # 判断当前时间是否为交易日
-            current_time = datetime.now()
-            if current_time.hour >= 15:
-                date = current_time.date()
-            else:
-                # 优化逻辑：逐次减一天查找最近的交易日，最大查找次数为10
-                date = current_time.date()
-                max_attempts = 10
-                attempts = 0
-                while not is_trading_day(date) and attempts < max_attempts:
-                    date -= timedelta(days=1)
-                    attempts += 1
-                if attempts == max_attempts:
-                    print("警告：在10次查找内未找到交易日，使用当前日期作为默认值")
-                    date = current_time.date()
-
-        df.to_csv(f"stock_data_{date.strftime('%Y%m%d')}", index=False)
-        logger.info("成功从AkShare获取股票数据并保存到CSV")
-        # 清洗数据
+        # 获取实时行情数据；akshare 导入较慢，只在需要请求时加载
+        import akshare as ak
+
+        df = ak.stock_zh_a_spot_em()
+        if df.empty:
+            logger.warning("没有获取到股票数据")
+            return pd.DataFrame()
+
+        # 当天为交易日时即当天，周末和节假日取最近的交易日
+        date = trading_calendar.prev_trading_day(today, inclusive=True)
+        if date is None:
+            logger.warning("交易日历为空，使用当前日期作为交易日")
+            date = today
+
+        # 清洗数据；盘中数据仍会变化，不写快照，避免收盘后读到过期数据
         df = clean_stock_data(df)
+        if is_final(date, current_time):
+            write_snapshot(df, date)
+            logger.info("成功从AkShare获取股票数据并保存快照")
 
         # 添加日期字段
         df["trade_date"] = date.strftime("%Y-%m-%d")
@@ -235,70 +163,93 @@ def fetch_stock_data(date_str_req: Optional[str] = None) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def save_stock_data(df: pd.DataFrame):
-    """Saves stock data to the database using a managed session."""
+def save_stock_data(df: pd.DataFrame, update_derived: bool = True) -> dict:
+    """
+    Upserts stock data on (symbol, trade_date) using a managed session.
+
+    Incoming rows are diffed against the stored ones: new rows are bulk inserted,
+    changed rows are updated with INSERT ... ON DUPLICATE KEY UPDATE and identical
+    rows are not written at all, so re-running a day (or repairing part of it) is
+    safe. Indicators of every affected trade date are recomputed in the same
+    transaction, so screening never sees raw data without its indicators.
+
+    :param df: Cleaned rows with a trade_date column; may span several dates.
+        Only the columns present in df are written.
+    :param update_derived: Recompute indicators and update the history cube. Backfills
+        pass False and rebuild both once at the end.
+    :return: {"inserted": ..., "updated": ..., "unchanged": ...}
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
     if df.empty:
         logger.info("DataFrame is empty, skipping database save.")
-        return
+        return counts
+
+    df = df.drop_duplicates(subset=["symbol", "trade_date"], keep="last").copy()
+    df["trade_date"] = pd.to_datetime(df["trade_date"]).dt.date
+    table = StockData.__table__
 
     with db_session_scope() as db:
-        data = df.to_dict(orient="records")
-        # Ensure all keys in each dict are strings
-        data = [{str(k): v for k, v in record.items()} for record in data]
-        # Check if date already exists to prevent duplicates
-        trade_date = data[0]["trade_date"]
-        exists = db.query(StockData).filter(StockData.trade_date == trade_date).first()
-        if not exists:
-            db.bulk_insert_mappings(StockData.__mapper__, data)
-            logger.info(
-                f"Successfully saved {len(data)} records for date {trade_date}."
+        connection = db.connection()
+        new, changed = diff_frame(connection, table, df, KEY_COLUMNS)
+        counts = {
+            "inserted": int(new.sum()),
+            "updated": int(changed.sum()),
+            "unchanged": int(len(df) - new.sum() - changed.sum()),
+        }
+        if new.any():
+            bulk_insert_frame(
+                connection,
+                table,
+                df[new],
+                batch_size=config.INGEST_CONFIG["batch_size"],
+                mode=config.INGEST_CONFIG["mode"],
             )
-        else:
-            logger.warning(
-                f"Data for date {trade_date} already exists in DB. Skipping."
-            )
-
+        if changed.any():
+            bulk_upsert_frame(connection, table, df[changed], KEY_COLUMNS, batch_size=config.INGEST_CONFIG["batch_size"])
 
-def get_latest_trade_date(trading_days: set[str]) -> date:
-    """
-    Calculates the most recent valid trading date.
+        written = df[new | changed]
+        changed_dates = sorted(set(written["trade_date"]))
+        if changed_dates and update_derived:
+            # Compute indicators in the same transaction so both tables commit together
+            rematerialize_indicators(db, changed_dates)
 
-    If it's before 3 PM on a trading day, it returns the previous trading day.
-    Otherwise, it returns today's date (if it's a trading day) or the most
-    recent previous trading day.
-    """
-    today = datetime.now().date()
-    # If market is still open, data is for the previous day
-    if datetime.now().hour < 15 and today.strftime("%Y-%m-%d") in trading_days:
-        date_to_check = today - timedelta(days=1)
-    else:
-        date_to_check = today
+    logger.info(
+        f"Saved stock data for {df['trade_date'].nunique()} date(s): {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged."
+    )
 
-    # Find the most recent trading day, looking back up to 10 days
-    for i in range(10):
-        check_str = (date_to_check - timedelta(days=i)).strftime("%Y-%m-%d")
-        if check_str in trading_days:
-            return date_to_check - timedelta(days=i)
+    if not update_derived:
+        return counts
 
-    logger.error("Could not find a recent trading day in the last 10 days.")
-    raise ValueError("Failed to determine a valid recent trade date.")
+    # The cube is a local copy of committed data; a failure here must not undo the save
+    for trade_date, day_df in written.groupby("trade_date", sort=True):
+        try:
+            append_to_history_cube(day_df)
+        except Exception as e:
+            logger.error(f"Failed to write {trade_date} to the history cube: {e}")
+    return counts
 
 
-# This function should be called at startup and on a schedule (e.g., daily)
-@lru_cache(maxsize=1)
-def get_trading_calendar_set(force_refresh: bool = False) -> set[str]:
+def get_latest_trade_date(moment: Optional[datetime] = None) -> date:
     """
-    Loads the trading calendar from the DB. Uses a cache for performance.
-    The cache is only refreshed when force_refresh=True.
+    Calculates the most recent trading date whose data is complete.
+
+    Before the close on a trading day this is the previous trading day;
+    otherwise it is today (if it's a trading day) or the most recent previous one.
+
+    :param moment: Defaults to now in the exchange time zone.
     """
-    logger.info("Loading trading calendar into memory set.")
-    with db_session_scope() as db:
-        dates = (
-            db.query(TradingCalendar.trade_date)
-            .filter(TradingCalendar.trade_date >= datetime.now() - timedelta(days=365))
-            .all()
-        )
-        return {d.trade_date.strftime("%Y-%m-%d") for d in dates}
+    moment = moment or market_now()
+    today = moment.date()
+    if is_final(today, moment):
+        latest = trading_calendar.prev_trading_day(today, inclusive=True)
+    else:
+        latest = trading_calendar.prev_trading_day(today)
+
+    if latest is None:
+        logger.error("The trading calendar has no date before today.")
+        raise ValueError("Failed to determine a valid recent trade date.")
+    return latest
 
 
 # Refactored fetch_stock_data, now with clear responsibilities
@@ -309,29 +260,26 @@ def get_stock_data(target_date: date) -> pd.DataFrame:
     This function is now responsible ONLY for fetching/loading for a GIVEN date.
     The logic to decide the date is handled elsewhere.
     """
-    date_str = target_date.strftime("%Y%m%d")
-    local_csv_path = f"stock_data_{date_str}.csv"
-
-    # 1. Try loading from local CSV cache
-    if os.path.exists(local_csv_path):
-        logger.info(f"Loading stock data from local file: {local_csv_path}")
-        df = pd.read_csv(local_csv_path, dtype={"代码": str})
-        df["trade_date"] = target_date.strftime("%Y-%m-%d")
+    # 1. Try loading from the local snapshot
+    df = load_snapshot(target_date)
+    if df is not None:
+        logger.info(f"Loaded stock data from snapshot for {target_date}")
         return df
 
     # 2. If not cached, fetch from API
     logger.info(f"Fetching stock data from AkShare for date: {target_date}")
     try:
+        import akshare as ak
+
         df = ak.stock_zh_a_spot_em()
         if df.empty:
             logger.warning("AkShare returned no data.")
             return pd.DataFrame()
 
-        # 3. Clean and save to cache for next time
+        # 3. Clean and save the snapshot for next time
         df = clean_stock_data(df)
+        write_snapshot(df, target_date)
         df["trade_date"] = target_date.strftime("%Y-%m-%d")
-        df.to_csv(local_csv_path, index=False)
-        logger.info(f"Saved new data to {local_csv_path}")
         return df
     except Exception as e:
         logger.error(f"Failed to fetch data from AkShare: {e}")
@@ -343,18 +291,15 @@ def get_stock_data_for_date():
     Fetches stock data for a specific date, ensuring the date is a trading day.
     If the date is not a trading day, it fetches data for the most recent trading day.
     """
-    # 2. Get the calendar once into a fast, in-memory set
-    trading_days_set = get_trading_calendar_set(force_refresh=True)
-
-    # 3. Determine the date you want to process
+    # 2. Determine the date you want to process
     try:
-        target_date = get_latest_trade_date(trading_days_set)
+        target_date = get_latest_trade_date()
         logger.info(f"Determined target trade date is: {target_date}")
 
-        # 4. Get the data for that specific date
+        # 3. Get the data for that specific date
         stock_df = get_stock_data(target_date)
 
-        # 5. If data is retrieved, save it to the database
+        # 4. If data is retrieved, save it to the database
         if not stock_df.empty:
             save_stock_data(stock_df)
 
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import config
+from services.broadcast_hub import BroadcastHub, dumps, hub
+
+logger = logging.getLogger(__name__)
+
+# 超过这么多个上报间隔未更新的 API 进程视为已退出
+STALE_HEARTBEATS = 3
+
+
+def _stale_before() -> datetime:
+    return datetime.now() - timedelta(seconds=STALE_HEARTBEATS * config.STREAM_CONFIG["listener_heartbeat"])
+
+
+class DbEventPublisher:
+    """
+    Publisher used by the worker process: events go to the stream_events table,
+    from which every API process relays them to its own SSE clients.
+
+    Has the same publish / listening interface as BroadcastHub. The worker cannot
+    see the API's clients; `listening` reads the subscriber counts the relays report
+    in stream_listeners, so no events are built while nobody is connected.
+    """
+
+    def __init__(self, retained_events: Optional[int] = None):
+        """
+        :param retained_events: Rows kept in stream_events, defaults to STREAM_CONFIG['retained_events'].
+        """
+        self.retained_events = retained_events or config.STREAM_CONFIG["retained_events"]
+        self.published = 0
+        self._listeners = None
+        self._listeners_checked = 0.0
+        self._last_prune = 0.0
+
+    @property
+    def listening(self) -> bool:
+        """Whether an API process with subscribers reported recently; checked at most once per heartbeat."""
+        now = time.monotonic()
+        if self._listeners is None or now - self._listeners_checked >= config.STREAM_CONFIG["listener_heartbeat"]:
+            self._listeners_checked = now
+            try:
+                self._listeners = self._count_listeners()
+            except Exception as e:
+                # 读取失败时照常发布，宁可多写事件也不丢失
+                logger.error(f"Failed to read stream listeners: {e}")
+                self._listeners = None
+                return True
+        return self._listeners > 0
+
+    def _count_listeners(self) -> int:
+        from sqlalchemy import func
+
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamListener
+
+        with db_session_scope(join=False) as db:
+            return (
+                db.query(func.coalesce(func.sum(StreamListener.subscribers), 0))
+                .filter(StreamListener.updated_at >= _stale_before())
+                .scalar()
+            )
+
+    def publish(self, event: str, payload) -> bool:
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamEvent
+
+        # 事件独立提交，不随调用方的事务回滚或延迟
+        with db_session_scope(join=False) as db:
+            db.add(StreamEvent(event=event, data=dumps(payload)))
+        self.published += 1
+        if time.monotonic() - self._last_prune >= config.STREAM_CONFIG["prune_interval"]:
+            self.prune()
+        return True
+
+    def prune(self):
+        """
+        Keeps only the newest `retained_events` events (an API process that was disconnected
+        longer simply starts from the newest one) and drops the rows of exited API processes.
+        Runs at most once per STREAM_CONFIG['prune_interval'] instead of on every publish.
+        """
+        from sqlalchemy import func
+
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamEvent, StreamListener
+
+        self._last_prune = time.monotonic()
+        try:
+            with db_session_scope(join=False) as db:
+                newest = db.query(func.max(StreamEvent.id)).scalar() or 0
+                events = db.query(StreamEvent).filter(StreamEvent.id <= newest - self.retained_events).delete(
+                    synchronize_session=False
+                )
+                listeners = db.query(StreamListener).filter(StreamListener.updated_at < _stale_before()).delete(
+                    synchronize_session=False
+                )
+        except Exception as e:
+            logger.error(f"Failed to prune stream events: {e}")
+            return
+        if events or listeners:
+            logger.debug(f"Pruned {events} stream events and {listeners} stale listeners.")
+
+
+class DbEventRelay:
+    """
+    Runs in each API process: polls stream_events for rows newer than the last one
+    seen and hands their already-serialized JSON to the local hub.
+
+    The table is only polled while the hub has subscribers. When the first client
+    connects the relay starts from the newest row, so clients never receive a
+    backlog of old events. The subscriber count is reported to stream_listeners
+    every STREAM_CONFIG['listener_heartbeat'] seconds and as soon as it changes,
+    so the worker only builds events while someone is connected.
+    """
+
+    def __init__(self, target: BroadcastHub = hub, interval: Optional[float] = None, batch_size: int = 500):
+        """
+        :param target: Hub of this process.
+        :param interval: Seconds between polls, defaults to STREAM_CONFIG['relay_interval'].
+        :param batch_size: Maximum rows read per poll.
+        """
+        self.hub = target
+        self.interval = interval or config.STREAM_CONFIG["relay_interval"]
+        self.batch_size = batch_size
+        self.last_id = None
+        self.relayed = 0
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self._reported = None
+        self._reported_at = 0.0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._heartbeat()
+            if not self.hub.listening:
+                self.last_id = None
+                continue
+            try:
+                if self.last_id is None:
+                    self.last_id = await asyncio.to_thread(self._max_id)
+                    continue
+                rows = await asyncio.to_thread(self._read, self.last_id)
+            except Exception as e:
+                logger.error(f"Failed to read stream events: {e}")
+                continue
+            for event_id, event, data in rows:
+                self.hub.publish_serialized(event, data)
+                self.last_id = event_id
+            self.relayed += len(rows)
+
+    async def _heartbeat(self):
+        subscribers = self.hub.subscriber_count
+        if subscribers == self._reported and (
+            time.monotonic() - self._reported_at < config.STREAM_CONFIG["listener_heartbeat"]
+        ):
+            return
+        try:
+            await asyncio.to_thread(self._report, subscribers)
+        except Exception as e:
+            logger.error(f"Failed to report stream listeners: {e}")
+            return
+        self._reported, self._reported_at = subscribers, time.monotonic()
+
+    def _report(self, subscribers: int):
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamListener
+
+        with db_session_scope() as db:
+            db.merge(StreamListener(process=self.process, subscribers=subscribers, updated_at=datetime.now()))
+
+    def _max_id(self) -> int:
+        from sqlalchemy import func
+
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamEvent
+
+        with db_session_scope() as db:
+            return db.query(func.max(StreamEvent.id)).scalar() or 0
+
+    def _read(self, last_id: int) -> list:
+        from database.database_utils import db_session_scope
+        from models.stock_model import StreamEvent
+
+        with db_session_scope() as db:
+            return (
+                db.query(StreamEvent.id, StreamEvent.event, StreamEvent.data)
+                .filter(StreamEvent.id > last_id)
+                .order_by(StreamEvent.id)
+                .limit(self.batch_size)
+                .all()
+            )
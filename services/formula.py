@@ -0,0 +1,398 @@
+import logging
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import config
+from services.screening_engine import PRICE_DECIMALS, MarketMatrix, _window_sums, rolling_count, rolling_mean, shift
+
+logger = logging.getLogger(__name__)
+
+# 公式中的行情字段 -> stock_data 列
+FIELD_COLUMNS = {
+    "OPEN": "open", "O": "open",
+    "CLOSE": "close", "C": "close",
+    "HIGH": "high", "H": "high",
+    "LOW": "low", "L": "low",
+    "YCLOSE": "yesterday_close",
+    "VOL": "volume", "V": "volume",
+    "TURNOVER": "turnover_ratio",
+}
+# 按整数累加 (精确求和) 的列及其小数位数，与 stock_data 的 DECIMAL 精度一致
+EXACT_DECIMALS = {"open": PRICE_DECIMALS, "close": PRICE_DECIMALS, "high": PRICE_DECIMALS,
+                  "low": PRICE_DECIMALS, "yesterday_close": PRICE_DECIMALS, "volume": 0}
+# 函数名 -> (参数个数, 最后一个参数是否为窗口长度)；参数个数 None 表示两个及以上
+FUNCTIONS = {
+    "MA": (2, True), "SUM": (2, True), "HHV": (2, True), "LLV": (2, True),
+    "COUNT": (2, True), "REF": (2, True), "CROSS": (2, False),
+    "MAX": (None, False), "MIN": (None, False), "ABS": (1, False),
+}
+# 窗口长度上限，避免一条公式要求读取过长的历史
+MAX_WINDOW = 1000
+
+TOKEN = re.compile(r"\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_][A-Za-z0-9_]*)|(:=|<=|>=|<>|!=|==|&&|\|\||[-+*/(),;<>=!]))")
+KEYWORDS = {"AND": "&&", "OR": "||", "NOT": "!"}
+COMPARISONS = {">": ">", "<": "<", ">=": ">=", "<=": "<=", "=": "==", "==": "==", "<>": "!=", "!=": "!="}
+# a < b 与 b > a 使用同一个节点，便于公共子表达式复用
+MIRRORED = {"<": ">", "<=": ">="}
+COMMUTATIVE = {"+", "*", "&&", "||", "==", "!=", "MAX", "MIN"}
+
+
+class FormulaError(ValueError):
+    """Syntax or semantic error in a formula; `position` is the character offset, if known."""
+
+    def __init__(self, message: str, position: int = None):
+        super().__init__(message if position is None else f"{message} (at position {position})")
+        self.position = position
+
+
+@dataclass
+class Formula:
+    """
+    A compiled formula. `root` is an expression tree of plain tuples, so equal
+    subexpressions are equal keys and are evaluated once per Evaluator, across formulas.
+    """
+
+    text: str
+    root: tuple
+    fields: set = field(default_factory=set)
+    lookback: int = 0  # 得到最后一天的结果需要的此前交易日数
+
+
+def _tokenize(text: str) -> list:
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match:
+            pos += len(text[pos:]) - len(text[pos:].lstrip())
+            raise FormulaError(f"Unexpected character {text[pos]!r}", pos)
+        number, name, op = match.groups()
+        start = match.start(match.lastindex)
+        if number is not None:
+            tokens.append(("num", float(number), start))
+        elif name is not None:
+            upper = name.upper()
+            tokens.append(("op", KEYWORDS[upper], start) if upper in KEYWORDS else ("name", upper, start))
+        else:
+            tokens.append(("op", op, start))
+        pos = match.end()
+    tokens.append(("end", None, len(text)))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing canonical expression tuples."""
+
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.i = 0
+        self.variables = {}
+
+    def peek(self, *ops):
+        kind, value, _ = self.tokens[self.i]
+        return kind == "op" and value in ops
+
+    def take(self):
+        token = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def expect(self, op):
+        kind, value, pos = self.take()
+        if kind != "op" or value != op:
+            raise FormulaError(f"Expected {op!r}", pos)
+
+    def program(self) -> tuple:
+        result = None
+        while self.tokens[self.i][0] != "end":
+            kind, value, pos = self.tokens[self.i]
+            if kind == "name" and self.tokens[self.i + 1][1] == ":=":
+                self.i += 2
+                if value in FIELD_COLUMNS or value in FUNCTIONS:
+                    raise FormulaError(f"{value} is reserved", pos)
+                self.variables[value] = self.expr()
+            else:
+                result = self.expr()
+            if not self.peek(";") and self.tokens[self.i][0] != "end":
+                raise FormulaError("Expected ';' or end of formula", self.tokens[self.i][2])
+            while self.peek(";"):
+                self.take()
+        if result is None:
+            raise FormulaError("The formula has no result expression")
+        return result
+
+    def expr(self):
+        node = self.conjunction()
+        while self.peek("||"):
+            self.take()
+            node = _binary("||", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek("&&"):
+            self.take()
+            node = _binary("&&", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek("!"):
+            self.take()
+            return ("!", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        node = self.additive()
+        if self.peek(*COMPARISONS):
+            op = COMPARISONS[self.take()[1]]
+            node = _binary(op, node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.peek("+", "-"):
+            op = self.take()[1]
+            node = _binary(op, node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while self.peek("*", "/"):
+            op = self.take()[1]
+            node = _binary(op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek("-"):
+            self.take()
+            return _binary("-", ("const", 0.0), self.unary())
+        if self.peek("+"):
+            self.take()
+        return self.primary()
+
+    def primary(self):
+        kind, value, pos = self.take()
+        if kind == "num":
+            return ("const", value)
+        if kind == "op" and value == "(":
+            node = self.expr()
+            self.expect(")")
+            return node
+        if kind == "name":
+            if self.peek("("):
+                return self.call(value, pos)
+            if value in self.variables:
+                return self.variables[value]
+            if value in FIELD_COLUMNS:
+                return ("field", FIELD_COLUMNS[value])
+            raise FormulaError(f"Unknown name {value}", pos)
+        raise FormulaError("Expected a value", pos)
+
+    def call(self, name: str, pos: int):
+        if name not in FUNCTIONS:
+            raise FormulaError(f"Unknown function {name}", pos)
+        self.expect("(")
+        args = [self.expr()]
+        while self.peek(","):
+            self.take()
+            args.append(self.expr())
+        self.expect(")")
+
+        arity, windowed = FUNCTIONS[name]
+        if (arity is not None and len(args) != arity) or (arity is None and len(args) < 2):
+            raise FormulaError(f"{name} takes {arity or 'at least 2'} arguments, got {len(args)}", pos)
+        if windowed:
+            n = args[-1]
+            if n[0] != "const" or n[1] != int(n[1]) or not 0 <= n[1] <= MAX_WINDOW or (name != "REF" and n[1] < 1):
+                raise FormulaError(f"The period of {name} must be an integer constant up to {MAX_WINDOW}", pos)
+            return (name, args[0], int(n[1]))
+        if name == "CROSS":
+            a, b = args
+            # CROSS(A, B): A 由下向上穿过 B
+            return _binary("&&", _binary(">", a, b), _binary(">=", ("REF", b, 1), ("REF", a, 1)))
+        if name in ("MAX", "MIN"):
+            node = args[0]
+            for arg in args[1:]:
+                node = _binary(name, node, arg)
+            return node
+        return (name, args[0])
+
+
+def _binary(op: str, a: tuple, b: tuple) -> tuple:
+    if op in MIRRORED:
+        op, a, b = MIRRORED[op], b, a
+    if op in COMMUTATIVE and repr(b) < repr(a):
+        a, b = b, a
+    return (op, a, b)
+
+
+def _walk(node: tuple, fields: set, memo: dict) -> int:
+    """Collects the fields used by `node` and returns its lookback in trading days."""
+    # 变量在树中共享同一个节点，按 id 记忆，反复引用的变量只遍历一次
+    if id(node) in memo:
+        return memo[id(node)]
+    kind = node[0]
+    if kind == "field":
+        fields.add(node[1])
+        lookback = 0
+    elif kind == "const":
+        lookback = 0
+    elif kind in ("MA", "SUM", "HHV", "LLV", "COUNT"):
+        lookback = _walk(node[1], fields, memo) + node[2] - 1
+    elif kind == "REF":
+        lookback = _walk(node[1], fields, memo) + node[2]
+    else:
+        lookback = max(_walk(child, fields, memo) for child in node[1:])
+    memo[id(node)] = lookback
+    return lookback
+
+
+def compile_formula(text: str, max_lookback: int = None) -> Formula:
+    """
+    Compiles a TDX-style formula.
+
+    Statements are separated by ';'. `NAME := expr` defines an intermediate variable,
+    the last plain expression is the result. Supported: fields (OPEN/O, CLOSE/C, HIGH/H,
+    LOW/L, YCLOSE, VOL/V, TURNOVER), numbers, + - * /, comparisons (> < >= <= = <> !=),
+    AND / OR / NOT (also && || !), MA, SUM, HHV, LLV, COUNT, REF, CROSS, MAX, MIN, ABS.
+    Names are case-insensitive.
+
+    :param max_lookback: Longest history a formula may need, defaults to SCREEN_CONFIG['max_rule_lookback'].
+        Each period is capped by MAX_WINDOW, but nesting adds them up (REF(MA(REF(C,1000),1000),1000)).
+    :raise FormulaError: On syntax errors, unknown names, non-constant periods or a lookback over the limit.
+    """
+    root = _Parser(text).program()
+    fields = set()
+    lookback = _walk(root, fields, {})
+    max_lookback = config.SCREEN_CONFIG["max_rule_lookback"] if max_lookback is None else max_lookback
+    if lookback > max_lookback:
+        raise FormulaError(f"The formula needs {lookback} trading days of history, the limit is {max_lookback}")
+    return Formula(text=text, root=root, fields=fields, lookback=lookback)
+
+
+def _truth(values):
+    """Logical value of an operand: booleans as is, numbers are true when non-zero (NaN is false)."""
+    if isinstance(values, np.ndarray) and values.dtype == bool:
+        return values
+    with np.errstate(invalid="ignore"):
+        return np.asarray((values != 0) & ~np.isnan(values))
+
+
+def _numeric(values):
+    return values.astype(np.float64) if isinstance(values, np.ndarray) and values.dtype == bool else values
+
+
+def _rolling_sum(values: np.ndarray, window: int, prefix=None) -> np.ndarray:
+    sums, counts, scale = prefix if prefix is not None else _window_sums(values)
+    out = np.full(values.shape, np.nan)
+    if window <= values.shape[0]:
+        window_count = counts[window:] - counts[:-window]
+        out[window - 1:] = np.where(window_count == window, (sums[window:] - sums[:-window]) / scale, np.nan)
+    return out
+
+
+def _window_extreme(values: np.ndarray, window: int, reducer) -> np.ndarray:
+    out = np.full(values.shape, np.nan)
+    if window <= values.shape[0]:
+        out[window - 1:] = reducer(np.lib.stride_tricks.sliding_window_view(values, window, axis=0), axis=-1)
+    return out
+
+
+class Evaluator:
+    """
+    Evaluates compiled formulas on one MarketMatrix with vectorized NumPy operations.
+
+    Every node result is memoized by its expression tuple, so subexpressions shared
+    by several formulas (the same MA, the same REF) are computed once, and evaluating
+    a further formula on the same matrix only computes the nodes it does not share.
+    """
+
+    def __init__(self, matrix: MarketMatrix):
+        self.matrix = matrix
+        self.memo = {}
+        self.computed = 0
+        self.reused = 0
+
+    def evaluate(self, formula: Formula) -> np.ndarray:
+        """:return: (dates x symbols) boolean matrix of the formula's result."""
+        missing = formula.fields - set(self.matrix.fields)
+        if missing:
+            raise FormulaError(f"Fields not loaded: {', '.join(sorted(missing))}")
+        return np.broadcast_to(_truth(self._eval(formula.root)), self.matrix.shape)
+
+    def _eval(self, node: tuple):
+        result = self.memo.get(node)
+        if result is not None:
+            self.reused += 1
+            return result
+        result = self._compute(node)
+        self.memo[node] = result
+        self.computed += 1
+        return result
+
+    def _series(self, node: tuple) -> np.ndarray:
+        """Numeric (dates x symbols) matrix of a node; constants are broadcast for the window functions."""
+        return np.broadcast_to(_numeric(self._eval(node)), self.matrix.shape)
+
+    def _compute(self, node: tuple):
+        kind = node[0]
+        if kind == "const":
+            return np.float64(node[1])
+        if kind == "field":
+            return self.matrix.fields[node[1]]
+        if kind == "prefix":
+            column = node[1][1]
+            return _window_sums(self.matrix.fields[column], EXACT_DECIMALS[column])
+        if kind == "MA":
+            arg, window = node[1], node[2]
+            if arg[0] == "field" and arg[1] in EXACT_DECIMALS:
+                # 与 screening_engine 相同的精确求和，所有周期共用一次前缀和
+                return rolling_mean(self.matrix.fields[arg[1]], window, self._eval(("prefix", arg)))
+            return rolling_mean(self._series(arg), window)
+        if kind == "SUM":
+            arg, window = node[1], node[2]
+            if arg[0] == "field" and arg[1] in EXACT_DECIMALS:
+                return _rolling_sum(self.matrix.fields[arg[1]], window, self._eval(("prefix", arg)))
+            return _rolling_sum(self._series(arg), window)
+        if kind == "HHV":
+            return _window_extreme(self._series(node[1]), node[2], np.max)
+        if kind == "LLV":
+            return _window_extreme(self._series(node[1]), node[2], np.min)
+        if kind == "COUNT":
+            return rolling_count(np.broadcast_to(_truth(self._eval(node[1])), self.matrix.shape), node[2])
+        if kind == "REF":
+            values = self._series(node[1])
+            return values if node[2] == 0 else shift(values, node[2])
+        if kind == "ABS":
+            return np.abs(_numeric(self._eval(node[1])))
+        if kind == "!":
+            return ~_truth(self._eval(node[1]))
+        if kind in ("&&", "||"):
+            a, b = _truth(self._eval(node[1])), _truth(self._eval(node[2]))
+            return (a & b) if kind == "&&" else (a | b)
+
+        a, b = _numeric(self._eval(node[1])), _numeric(self._eval(node[2]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if kind == "+":
+                return a + b
+            if kind == "-":
+                return a - b
+            if kind == "*":
+                return a * b
+            if kind == "/":
+                return a / b
+            if kind == "MAX":
+                return np.fmax(a, b)
+            if kind == "MIN":
+                return np.fmin(a, b)
+            if kind == ">":
+                return np.asarray(a > b)
+            if kind == ">=":
+                return np.asarray(a >= b)
+            if kind == "==":
+                return np.asarray(a == b)
+            if kind == "!=":
+                return np.asarray((a != b) & ~np.isnan(a) & ~np.isnan(b))
+        raise FormulaError(f"Unknown operator {kind}")
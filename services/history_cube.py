@@ -0,0 +1,456 @@
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+import config
+from services.screening_engine import SCREEN_FIELDS, MarketMatrix
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 开发环境没有 fcntl，只能由单个进程写入
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 字段及其存储类型
+CUBE_FIELDS = {
+    "open": "float32",
+    "close": "float32",
+    "high": "float32",
+    "low": "float32",
+    "yesterday_close": "float32",
+    "turnover_ratio": "float32",
+    "volume": "int64",
+}
+# 与 stock_data 中 DECIMAL 列的小数位一致，用于从 float32 还原精确值
+FIELD_DECIMALS = {"open": 2, "close": 2, "high": 2, "low": 2, "yesterday_close": 2, "turnover_ratio": 3}
+# volume 为整数列，缺失值用 -1 表示
+MISSING_VOLUME = -1
+INITIAL_DAY_CAPACITY = 256
+META_FILE = "meta.json"
+# 指向当前数据目录 (代) 的文件；重建、修改已发布的交易日或扩充股票列时写入新的一代再原子切换
+POINTER_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+# 尚未发布的代目录后缀
+BUILDING_SUFFIX = ".tmp"
+# 写入方持有的排它锁文件，保证同一时刻只有一个进程 (或线程) 写入
+LOCK_FILE = "LOCK"
+
+
+class HistoryCube:
+    """
+    Memory-mapped (trading_days × symbols) arrays, one file per field.
+
+    Rows follow the trading calendar (a missed trading day is a row of NaN) and
+    columns are assigned to symbols in order of first appearance, so existing
+    cells never move.
+
+    The files live in a generation directory named by the CURRENT pointer. Readers in
+    other processes map them, so a published file is never truncated or rewritten:
+    - a new day is written past the published rows, flushed, and only then counted
+      in meta.json (replaced atomically); files only grow by appending;
+    - changing a published day, adding symbol columns or rebuilding writes a new
+      generation in a temporary sibling directory, which is fsynced and swapped in
+      with os.replace on the pointer. Readers keep their old mapping until they refresh.
+
+    Writers (append_to_history_cube, build_history_cube) hold an exclusive lock on
+    the LOCK file from opening the cube until publishing, so the worker's jobs, an API
+    process running the scheduler and the backfill CLI never write at the same time.
+    """
+
+    def __init__(self, path: Optional[str] = None, readonly: bool = True, data_path: Optional[Path] = None):
+        """
+        :param path: Cube directory, defaults to STORAGE_CONFIG['cube_dir'].
+        :param readonly: Map the files read-only.
+        :param data_path: Generation directory to use instead of the current one (an unpublished build).
+        """
+        self.path = Path(path or config.STORAGE_CONFIG["cube_dir"])
+        self.readonly = readonly
+        self.data_path = data_path
+        self._meta_mtime = None
+        self._maps = {}
+        self.refresh()
+
+    @classmethod
+    def create(cls, path: Optional[str] = None, symbol_capacity: Optional[int] = None) -> "HistoryCube":
+        """
+        Creates an empty cube in a new generation directory. Readers keep seeing the
+        current generation until publish() is called.
+
+        :param path: Cube directory, defaults to STORAGE_CONFIG['cube_dir'].
+        :param symbol_capacity: Number of symbol columns to reserve.
+        :return: A writable HistoryCube.
+        """
+        root = Path(path or config.STORAGE_CONFIG["cube_dir"])
+        target = _new_generation_dir(root)
+        meta = {
+            "fields": CUBE_FIELDS,
+            "day_capacity": INITIAL_DAY_CAPACITY,
+            "symbol_capacity": symbol_capacity or config.STORAGE_CONFIG["cube_symbol_capacity"],
+            "symbols": [],
+            "dates": [],
+        }
+        for field, dtype in CUBE_FIELDS.items():
+            _extend(target / f"{field}.dat", meta["day_capacity"] * meta["symbol_capacity"] * np.dtype(dtype).itemsize)
+        _write_meta(target, meta)
+        return cls(root, readonly=False, data_path=target)
+
+    @classmethod
+    def exists(cls, path: Optional[str] = None) -> bool:
+        return _current_generation(Path(path or config.STORAGE_CONFIG["cube_dir"])) is not None
+
+    @property
+    def unpublished(self) -> bool:
+        """True while writing a generation that readers cannot see yet."""
+        return self.data_path is not None and self.data_path.name.endswith(BUILDING_SUFFIX)
+
+    def refresh(self) -> bool:
+        """
+        Re-reads meta.json if another process published new days or a new generation.
+
+        :return: True if the cube was (re)loaded.
+        """
+        data_path = self.data_path if self.unpublished else _current_generation(self.path)
+        if data_path is None:
+            raise FileNotFoundError(f"No history cube in {self.path}.")
+        mtime = (data_path / META_FILE).stat().st_mtime_ns
+        if data_path == self.data_path and mtime == self._meta_mtime:
+            return False
+        self.meta = json.loads((data_path / META_FILE).read_text(encoding="utf-8"))
+        self.symbols = self.meta["symbols"]
+        self.dates = [date.fromisoformat(d) for d in self.meta["dates"]]
+        self.symbol_index = {s: i for i, s in enumerate(self.symbols)}
+        self.date_index = {d: i for i, d in enumerate(self.dates)}
+        self.data_path = data_path
+        self._maps = {}
+        self._meta_mtime = mtime
+        return True
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    def _map(self, field: str) -> np.memmap:
+        if field not in self._maps:
+            self._maps[field] = np.memmap(
+                self.data_path / f"{field}.dat",
+                dtype=self.meta["fields"][field],
+                mode="r" if self.readonly else "r+",
+                shape=(self.meta["day_capacity"], self.meta["symbol_capacity"]),
+            )
+        return self._maps[field]
+
+    def view(self, field: str) -> np.ndarray:
+        """Zero-copy view of the filled region of one field."""
+        return self._map(field)[: len(self.dates), : len(self.symbols)]
+
+    def window(self, field: str, end_date: Optional[date] = None, days: Optional[int] = None) -> np.ndarray:
+        """
+        Zero-copy view of `days` rows ending at `end_date` (inclusive).
+
+        :param field: One of CUBE_FIELDS.
+        :param end_date: Last trade date, defaults to the latest row.
+        :param days: Number of rows, defaults to everything up to end_date.
+        :return: (days × symbols) view; columns follow self.symbols.
+        """
+        stop = len(self.dates) if end_date is None else self.date_index[end_date] + 1
+        start = 0 if days is None else max(stop - days, 0)
+        return self.view(field)[start:stop]
+
+    def matrix(self, end_date: Optional[date] = None, days: Optional[int] = None, fields=SCREEN_FIELDS) -> MarketMatrix:
+        """
+        Copies a window into a float64 MarketMatrix for the screening engine.
+
+        float32 values are rounded back to their DECIMAL scale, so comparisons such
+        as close == MA5 behave exactly as on data read from MySQL.
+        """
+        stop = len(self.dates) if end_date is None else self.date_index[end_date] + 1
+        start = 0 if days is None else max(stop - days, 0)
+        return MarketMatrix(
+            dates=np.array(self.dates[start:stop], dtype="datetime64[D]"),
+            symbols=np.array(self.symbols, dtype=str),
+            fields={f: to_float64(f, self.window(f, end_date, days)) for f in fields},
+        )
+
+    def append_day(self, day_df: pd.DataFrame, trade_date: date, gap_dates=()):
+        """
+        Writes one trading day. If the date is already stored, only the given
+        symbols are overwritten and the rest of the row is kept.
+
+        A new day is appended in place; overwriting a published day or adding symbol
+        columns first copies the cube into a new generation, published at the end.
+
+        :param day_df: Rows of a single trade date with symbol and CUBE_FIELDS columns; absent fields stay empty.
+        :param trade_date: Trade date of the rows.
+        :param gap_dates: Trading days between the last stored date and trade_date, stored as empty rows.
+        """
+        if self.readonly:
+            raise PermissionError("HistoryCube was opened read-only.")
+        if self.dates and trade_date < self.dates[-1] and trade_date not in self.date_index:
+            raise ValueError(f"Cannot insert {trade_date} before the last stored date {self.dates[-1]}.")
+
+        new_symbols = [s for s in dict.fromkeys(day_df["symbol"]) if s not in self.symbol_index]
+        symbol_capacity = self.meta["symbol_capacity"]
+        if len(self.symbols) + len(new_symbols) > symbol_capacity:
+            symbol_capacity = 2 * (len(self.symbols) + len(new_symbols))
+        copy_on_write = not self.unpublished and (
+            trade_date in self.date_index or symbol_capacity != self.meta["symbol_capacity"]
+        )
+        if copy_on_write:
+            self._begin_generation()
+        if symbol_capacity != self.meta["symbol_capacity"]:
+            self._grow_symbols(symbol_capacity)
+        for s in new_symbols:
+            self.symbol_index[s] = len(self.symbols)
+            self.symbols.append(s)
+
+        rows = {}
+        if trade_date in self.date_index:
+            row = self.date_index[trade_date]
+        else:
+            for d in list(gap_dates) + [trade_date]:
+                rows[d] = len(self.dates)
+                self.date_index[d] = len(self.dates)
+                self.dates.append(d)
+            if len(self.dates) > self.meta["day_capacity"]:
+                self._grow_days(max(2 * self.meta["day_capacity"], len(self.dates)))
+            row = rows[trade_date]
+
+        columns = np.array([self.symbol_index[s] for s in day_df["symbol"]], dtype=np.int64)
+        for field, dtype in CUBE_FIELDS.items():
+            target = self._map(field)
+            empty = MISSING_VOLUME if field == "volume" else np.nan
+            for new_row in rows.values():
+                target[new_row] = empty
+            if field in day_df.columns:
+                if field == "volume":
+                    values = day_df[field].fillna(MISSING_VOLUME).to_numpy(dtype=np.int64)
+                else:
+                    values = day_df[field].to_numpy(dtype=np.float64, na_value=np.nan).astype(dtype)
+                target[row, columns] = values
+            # 数据落盘后才发布新的行数
+            target.flush()
+
+        self.meta["symbols"] = self.symbols
+        self.meta["dates"] = [d.isoformat() for d in self.dates]
+        _write_meta(self.data_path, self.meta)
+        self._meta_mtime = (self.data_path / META_FILE).stat().st_mtime_ns
+        if copy_on_write:
+            self.publish()
+        logger.info(f"History cube: wrote {len(day_df)} rows for {trade_date}, shape {self.shape}.")
+
+    def publish(self):
+        """
+        Makes an unpublished generation the current one: the directory is renamed and
+        the pointer replaced atomically. Older generations except the previous one are
+        removed; processes still mapping them keep their data until they unmap it.
+        """
+        if not self.unpublished:
+            return
+        for field in CUBE_FIELDS:
+            _fsync(self.data_path / f"{field}.dat")
+        final = self.data_path.with_name(self.data_path.name[: -len(BUILDING_SUFFIX)])
+        self._maps = {}
+        os.replace(self.data_path, final)
+        _fsync(self.path)
+        previous = _current_generation(self.path)
+        _write_pointer(self.path, final.name)
+        self.data_path = final
+        _remove_stale_generations(self.path, keep={final, previous})
+        logger.info(f"History cube: published {final.name}, shape {self.shape}.")
+
+    def _begin_generation(self):
+        """Copies the published files into a new generation; further writes go there."""
+        target = _new_generation_dir(self.path)
+        for field in CUBE_FIELDS:
+            shutil.copyfile(self.data_path / f"{field}.dat", target / f"{field}.dat")
+        self._maps = {}
+        self.data_path = target
+
+    def _grow_days(self, capacity: int):
+        """Extends every file by appending rows; existing rows keep their offsets and mappings stay valid."""
+        for field, dtype in CUBE_FIELDS.items():
+            self._maps.pop(field, None)
+            _extend(self.data_path / f"{field}.dat", capacity * self.meta["symbol_capacity"] * np.dtype(dtype).itemsize)
+        self.meta["day_capacity"] = capacity
+
+    def _grow_symbols(self, capacity: int):
+        """Rewrites every file of an unpublished generation with more columns."""
+        for field, dtype in CUBE_FIELDS.items():
+            old = np.array(self._map(field))
+            self._maps.pop(field)
+            path = self.data_path / f"{field}.dat"
+            os.remove(path)
+            new = np.memmap(path, dtype=dtype, mode="w+", shape=(self.meta["day_capacity"], capacity))
+            new[:, old.shape[1]:] = MISSING_VOLUME if field == "volume" else np.nan
+            new[:, : old.shape[1]] = old
+            new.flush()
+            del new
+        self.meta["symbol_capacity"] = capacity
+
+
+def to_float64(field: str, values: np.ndarray) -> np.ndarray:
+    """Converts a cube view to float64, restoring DECIMAL precision and mapping missing volume to NaN."""
+    if field == "volume":
+        return np.where(values == MISSING_VOLUME, np.nan, values.astype(np.float64))
+    out = values.astype(np.float64)
+    if field in FIELD_DECIMALS:
+        np.round(out, FIELD_DECIMALS[field], out=out)
+    return out
+
+
+def _fsync(path: Path):
+    """Flushes a file, or a directory entry on POSIX, to disk."""
+    if path.is_dir() and os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _extend(path: Path, size: int):
+    """Grows a file to `size` bytes by appending zeros; never shrinks or rewrites it."""
+    with open(path, "ab") as fh:
+        missing = size - os.path.getsize(path)
+        while missing > 0:
+            chunk = min(missing, 1 << 24)
+            fh.write(bytes(chunk))
+            missing -= chunk
+
+
+def _write_meta(path: Path, meta: dict):
+    tmp = path / f"{META_FILE}.tmp"
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    _fsync(tmp)
+    os.replace(tmp, path / META_FILE)
+    _fsync(path)
+
+
+def _write_pointer(root: Path, name: str):
+    tmp = root / f"{POINTER_FILE}.tmp"
+    tmp.write_text(name, encoding="utf-8")
+    _fsync(tmp)
+    os.replace(tmp, root / POINTER_FILE)
+    _fsync(root)
+
+
+def _current_generation(root: Path) -> Optional[Path]:
+    """Directory of the published generation, None if there is no cube."""
+    try:
+        return root / (root / POINTER_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        # 引入分代目录之前的单目录布局
+        return root if (root / META_FILE).exists() else None
+
+
+def _new_generation_dir(root: Path) -> Path:
+    root.mkdir(parents=True, exist_ok=True)
+    numbers = [
+        int(p.name[len(GENERATION_PREFIX):].split(".")[0])
+        for p in root.glob(f"{GENERATION_PREFIX}*")
+        if p.name[len(GENERATION_PREFIX):].split(".")[0].isdigit()
+    ]
+    target = root / f"{GENERATION_PREFIX}{max(numbers, default=0) + 1:06d}{BUILDING_SUFFIX}"
+    target.mkdir()
+    return target
+
+
+def _remove_stale_generations(root: Path, keep: set):
+    """Deletes generation directories (and files of the single-directory layout) not in `keep`."""
+    for child in root.glob(f"{GENERATION_PREFIX}*"):
+        if child.is_dir() and child not in keep:
+            shutil.rmtree(child, ignore_errors=True)
+    if root not in keep:
+        for name in [META_FILE] + [f"{field}.dat" for field in CUBE_FIELDS]:
+            (root / name).unlink(missing_ok=True)
+
+
+@contextmanager
+def writer_lock(path: Optional[str] = None):
+    """Holds the cube's exclusive writer lock; blocks while another process or thread writes."""
+    root = Path(path or config.STORAGE_CONFIG["cube_dir"])
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / LOCK_FILE, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def open_history_cube(path: Optional[str] = None) -> Optional[HistoryCube]:
+    """Opens the cube read-only, or returns None if it has not been built yet."""
+    return HistoryCube(path) if HistoryCube.exists(path) else None
+
+
+def append_to_history_cube(df: pd.DataFrame, path: Optional[str] = None):
+    """
+    Appends a saved day of stock data to the cube, creating the cube on first use.
+    Trading days missing between the last stored day and this one become empty rows.
+
+    :param df: Rows of a single trade date, as written by save_stock_data; may cover only some symbols.
+    :param path: Cube directory, defaults to STORAGE_CONFIG['cube_dir'].
+    """
+    from services.trading_calendar import trading_calendar
+
+    with writer_lock(path):
+        cube = HistoryCube(path, readonly=False) if HistoryCube.exists(path) else HistoryCube.create(path)
+        trade_date = pd.Timestamp(df["trade_date"].iloc[0]).date()
+
+        gap_dates = []
+        if cube.dates and trade_date > cube.dates[-1]:
+            gap_dates = [d for d in trading_calendar.trading_days_between(cube.dates[-1], trade_date)
+                         if cube.dates[-1] < d < trade_date]
+        cube.append_day(df, trade_date, gap_dates)
+        cube.publish()
+
+
+def build_history_cube(path: Optional[str] = None, start_date: Optional[date] = None) -> HistoryCube:
+    """
+    Rebuilds the cube from stock_data, one trade date at a time, in a new generation
+    that replaces the current one only once it is complete.
+
+    :param path: Cube directory, defaults to STORAGE_CONFIG['cube_dir'].
+    :param start_date: First trade date to include, defaults to the earliest stored date.
+    :return: The rebuilt, writable cube.
+    """
+    from database.database_utils import db_session_scope
+    from models.stock_model import StockData
+    from services.trading_calendar import trading_calendar
+
+    columns = [StockData.symbol] + [getattr(StockData, f) for f in CUBE_FIELDS]
+    with writer_lock(path), db_session_scope() as db:
+        cube = HistoryCube.create(path)
+        query = db.query(StockData.trade_date).distinct().order_by(StockData.trade_date)
+        if start_date is not None:
+            query = query.filter(StockData.trade_date >= start_date)
+        trade_dates = [d for (d,) in query.all()]
+        if not trade_dates:
+            cube.publish()
+            return cube
+        calendar = trading_calendar.trading_days_between(trade_dates[0], trade_dates[-1])
+        stored = set(trade_dates)
+
+        gap_dates = []
+        for trade_date in sorted(stored.union(calendar)):
+            if trade_date not in stored:
+                gap_dates.append(trade_date)
+                continue
+            day_df = pd.read_sql(
+                db.query(*columns).filter(StockData.trade_date == trade_date).statement, db.connection()
+            )
+            cube.append_day(day_df, trade_date, gap_dates)
+            gap_dates = []
+        cube.publish()
+    return cube
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, func, literal_column, select, type_coerce
+from models.stock_model import StockData
+from services.indicator_state import REBUILD_DAYS
+from services.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 选股所需的最少字段
+HISTORY_COLUMNS = ("symbol", "trade_date", "open", "close", "yesterday_close", "volume", "turnover_ratio")
+PRICE_COLUMNS = ("open", "close", "yesterday_close", "turnover_ratio")
+# 服务端游标每批读取的行数
+CHUNK_SIZE = 50_000
+
+
+def _as_double(column):
+    """DECIMAL + 0E0 is evaluated as DOUBLE by the database, so the driver returns floats instead of Decimal objects."""
+    return type_coerce(column + literal_column("0E0"), Float).label(column.key)
+
+
+def window_start_date(db, end_date, days: int = REBUILD_DAYS):
+    """
+    Finds the first trade date of the `days`-trading-day window ending at `end_date`.
+
+    Uses the trading calendar; falls back to the distinct dates stored in stock_data
+    when the calendar does not reach back far enough.
+
+    :param db: Database session.
+    :param end_date: Last trade date of the window (inclusive).
+    :param days: Number of trading days in the window.
+    :return: The first date of the window, or None if there is no data.
+    """
+    start = trading_calendar.nth_trading_day_before(end_date, days - 1)
+    if start is not None:
+        return start
+
+    logger.debug("Trading calendar does not cover the window, using stored trade dates.")
+    recent_dates = (
+        select(StockData.trade_date)
+        .where(StockData.trade_date <= end_date)
+        .distinct()
+        .order_by(StockData.trade_date.desc())
+        .limit(days)
+        .subquery()
+    )
+    return db.execute(select(func.min(recent_dates.c.trade_date))).scalar()
+
+
+def history_select(start_date, end_date, price_columns: tuple = PRICE_COLUMNS):
+    """
+    SELECT of the screening columns between two trade dates. With the default columns
+    it is answered from idx_stock_date_screen alone (a covering range scan).
+    """
+    return select(
+        StockData.symbol,
+        StockData.trade_date,
+        *[_as_double(getattr(StockData, c)) for c in price_columns],
+        func.coalesce(StockData.volume, 0).label("volume"),
+    ).where(StockData.trade_date.between(start_date, end_date))
+
+
+def load_history(db, end_date, days: int = REBUILD_DAYS, chunk_size: int = CHUNK_SIZE, start_date=None,
+                 price_columns: tuple = PRICE_COLUMNS) -> pd.DataFrame:
+    """
+    Loads the screening columns for the last `days` trading days up to `end_date`.
+
+    Rows are streamed through a server-side cursor and converted chunk by chunk
+    into float64 (prices, turnover ratio) and int64 (volume) arrays, so memory
+    depends on the window size rather than on the size of stock_data.
+
+    :param db: Database session; the query runs on its connection and sees uncommitted rows.
+    :param end_date: Last trade date to load (inclusive).
+    :param days: Number of trading days to load.
+    :param chunk_size: Rows fetched per round trip.
+    :param start_date: First trade date to load; overrides `days` when given.
+    :param price_columns: DECIMAL columns of stock_data to load as float64, e.g. PRICE_COLUMNS + ("high", "low").
+    :return: DataFrame with symbol, trade_date, `price_columns` and volume (HISTORY_COLUMNS by default).
+    """
+    columns = ("symbol", "trade_date", *price_columns, "volume")
+    if start_date is None:
+        start_date = window_start_date(db, end_date, days)
+    if start_date is None:
+        return pd.DataFrame({c: [] for c in columns})
+
+    stmt = history_select(start_date, end_date, price_columns).execution_options(
+        stream_results=True, yield_per=chunk_size
+    )
+
+    chunks = {c: [] for c in columns}
+    for rows in db.execute(stmt).partitions(chunk_size):
+        symbol, trade_date, *prices, volume = zip(*rows)
+        chunks["symbol"].append(np.array(symbol, dtype=object))
+        chunks["trade_date"].append(np.array(trade_date, dtype="datetime64[D]"))
+        for name, values in zip(price_columns, prices):
+            # None (NULL) becomes NaN
+            chunks[name].append(np.array(values, dtype=np.float64))
+        chunks["volume"].append(np.array(volume, dtype=np.int64))
+
+    if not chunks["symbol"]:
+        return pd.DataFrame({c: [] for c in columns})
+    df = pd.DataFrame({c: np.concatenate(chunks[c]) for c in columns})
+    logger.debug(f"Loaded {len(df)} history rows from {start_date} to {end_date}.")
+    return df
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+
+from models.stock_model import StockData
+
+logger = logging.getLogger(__name__)
+
+# 可查询的字段；symbol 与 trade_date 是游标的键，总是返回
+KEY_FIELDS = ("symbol", "trade_date")
+QUERY_FIELDS = tuple(
+    c.key for c in StockData.__table__.columns if c.key not in KEY_FIELDS and c.key not in ("id", "update_time")
+)
+NUMERIC_FIELDS = tuple(c for c in QUERY_FIELDS if c != "name")
+# 分页 JSON 每页的默认与最大行数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+# NDJSON / CSV 每次向客户端写出的行数
+STREAM_CHUNK_ROWS = 1000
+FORMATS = ("json", "ndjson", "csv")
+
+
+class QueryError(ValueError):
+    """Invalid query parameter; the message is returned to the client."""
+
+
+def parse_fields(fields: Optional[str]) -> tuple:
+    """
+    :param fields: Comma-separated column names, None or empty for every column.
+    :return: KEY_FIELDS followed by the selected columns.
+    """
+    if not fields:
+        return KEY_FIELDS + QUERY_FIELDS
+    selected = [f.strip() for f in fields.split(",") if f.strip() and f.strip() not in KEY_FIELDS]
+    unknown = sorted(set(selected) - set(QUERY_FIELDS))
+    if unknown:
+        raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+    return KEY_FIELDS + tuple(dict.fromkeys(selected))
+
+
+def parse_ranges(params) -> dict:
+    """
+    Collects `<field>_min` / `<field>_max` query parameters.
+
+    :param params: Query parameters (name -> value).
+    :return: field -> (min, max), either bound may be None.
+    """
+    ranges = {}
+    for key, value in params.items():
+        if not key.endswith(("_min", "_max")):
+            continue
+        field, bound = key[:-4], key[-3:]
+        if field not in NUMERIC_FIELDS:
+            raise QueryError(f"Unknown range filter {key}")
+        try:
+            number = float(value)
+        except ValueError:
+            raise QueryError(f"{key} must be a number")
+        low, high = ranges.get(field, (None, None))
+        ranges[field] = (number, high) if bound == "min" else (low, number)
+    return ranges
+
+
+def encode_cursor(symbol: str, trade_date) -> str:
+    return f"{symbol}:{trade_date.isoformat() if isinstance(trade_date, date) else trade_date}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """:return: (symbol, trade_date) of the last row of the previous page."""
+    try:
+        symbol, day = cursor.rsplit(":", 1)
+        return symbol, date.fromisoformat(day)
+    except ValueError:
+        raise QueryError("Invalid cursor")
+
+
+def history_statement(fields=KEY_FIELDS + QUERY_FIELDS, symbols=None, start_date=None, end_date=None,
+                      ranges=None, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    SELECT over stock_data in (symbol, trade_date) order with keyset pagination.
+
+    The cursor is compared as a row value, (symbol, trade_date) > (:symbol, :trade_date),
+    so every page is an index range scan that starts where the previous one ended,
+    however deep the page.
+
+    :param fields: Columns to return, see parse_fields.
+    :param symbols: Optional list of symbols.
+    :param start_date: First trade date (inclusive).
+    :param end_date: Last trade date (inclusive).
+    :param ranges: field -> (min, max) filters, see parse_ranges.
+    :param cursor: encode_cursor of the last row already returned.
+    :param limit: Maximum number of rows.
+    """
+    stmt = select(*[getattr(StockData, f) for f in fields])
+    if symbols:
+        stmt = stmt.where(StockData.symbol.in_(symbols) if len(symbols) > 1 else StockData.symbol == symbols[0])
+    if start_date is not None:
+        stmt = stmt.where(StockData.trade_date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(StockData.trade_date <= end_date)
+    for field, (low, high) in (ranges or {}).items():
+        column = getattr(StockData, field)
+        if low is not None:
+            stmt = stmt.where(column >= low)
+        if high is not None:
+            stmt = stmt.where(column <= high)
+    if cursor:
+        symbol, trade_date = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(StockData.symbol, StockData.trade_date) > tuple_(symbol, trade_date))
+    stmt = stmt.order_by(StockData.symbol, StockData.trade_date)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def fetch_page(db, stmt_args: dict, page_size: int) -> dict:
+    """
+    One page of rows plus the cursor of the next page (None on the last page).
+
+    :param db: AsyncSession.
+    :param stmt_args: Keyword arguments of history_statement, without limit.
+    :param page_size: Rows per page.
+    """
+    result = await db.execute(history_statement(**stmt_args, limit=page_size + 1))
+    rows = [dict(row) for row in result.mappings()]
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]["symbol"], rows[-1]["trade_date"])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+async def stream_rows(stmt_args: dict, fmt: str, limit: Optional[int] = None):
+    """
+    Encodes the rows as NDJSON lines or CSV while they are read through a server-side
+    cursor, STREAM_CHUNK_ROWS at a time, so an export never materializes in memory.
+
+    The session is opened here rather than taken from the request's dependency,
+    which FastAPI closes before a streaming body is sent.
+
+    :param stmt_args: Keyword arguments of history_statement, without limit.
+    :param fmt: "ndjson" or "csv".
+    :param limit: Optional maximum number of rows.
+    """
+    from database.async_db import async_session
+
+    fields = stmt_args.get("fields", KEY_FIELDS + QUERY_FIELDS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(fields)
+
+    written = 0
+    async with async_session() as db:
+        result = await db.stream(history_statement(**stmt_args, limit=limit))
+        async for rows in result.partitions(STREAM_CHUNK_ROWS):
+            if writer is not None:
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=_json_value))
+                    buffer.write("\n")
+            written += len(rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if writer is not None and written == 0:
+        yield buffer.getvalue().encode()
+    logger.debug(f"Streamed {written} history rows as {fmt}.")
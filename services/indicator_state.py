@@ -0,0 +1,256 @@
+import copy
+import logging
+import numpy as np
+import pandas as pd
+from services.screening_engine import (
+    CONDITION_COLUMNS,
+    CONVERGENCE_WINDOWS,
+    INDICATOR_COLUMNS,
+    MA_WINDOWS,
+    PRICE_DECIMALS,
+    SCREEN_FIELDS,
+    pivot_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+# 环形缓冲区长度：最长均线周期
+HISTORY_SIZE = max(MA_WINDOWS)
+# 粘合度计数窗口
+FLAG_WINDOW = 15
+# 从零重建状态所需的最少交易日数：MA120 及其前一日的值
+REBUILD_DAYS = HISTORY_SIZE + 1
+
+
+class IndicatorState:
+    """
+    Rolling per-symbol indicator state, advanced once per trade_date.
+
+    Holds a ring of the last 120 closes (in integer cents), running sums and
+    valid-cell counts for every MA window, a ring of the last 15 `zhanhe < 3`
+    flags and the previous day's volume, MA60 and MA120. Each `update` costs
+    O(symbols) regardless of how much history is stored.
+
+    Sums are exact integers, so a state advanced day by day is bit-identical to
+    one rebuilt from history with `from_history`, and both match the matrix
+    engine in services.screening_engine.
+    """
+
+    def __init__(self):
+        self.symbols = []
+        self._columns = {}
+        self.last_trade_date = None
+        self.days = 0
+        self.latest = None
+        self._allocate(0)
+
+    def _allocate(self, n):
+        self.closes = np.full((n, HISTORY_SIZE), np.nan)
+        self.sums = {w: np.zeros(n) for w in MA_WINDOWS}
+        self.counts = {w: np.zeros(n, dtype=np.int64) for w in MA_WINDOWS}
+        self.zhanhe_flags = np.zeros((n, FLAG_WINDOW), dtype=bool)
+        self.prev_volume = np.full(n, np.nan)
+        self.prev_ma60 = np.full(n, np.nan)
+        self.prev_ma120 = np.full(n, np.nan)
+
+    def _add_symbols(self, symbols):
+        """Appends columns for symbols seen for the first time; their history is empty (NaN)."""
+        new = [s for s in symbols if s not in self._columns]
+        if not new:
+            return
+        for s in new:
+            self._columns[s] = len(self.symbols)
+            self.symbols.append(s)
+        extra = len(new)
+        self.closes = np.vstack([self.closes, np.full((extra, HISTORY_SIZE), np.nan)])
+        for w in MA_WINDOWS:
+            self.sums[w] = np.concatenate([self.sums[w], np.zeros(extra)])
+            self.counts[w] = np.concatenate([self.counts[w], np.zeros(extra, dtype=np.int64)])
+        self.zhanhe_flags = np.vstack([self.zhanhe_flags, np.zeros((extra, FLAG_WINDOW), dtype=bool)])
+        self.prev_volume = np.concatenate([self.prev_volume, np.full(extra, np.nan)])
+        self.prev_ma60 = np.concatenate([self.prev_ma60, np.full(extra, np.nan)])
+        self.prev_ma120 = np.concatenate([self.prev_ma120, np.full(extra, np.nan)])
+
+    def _advance(self, values: dict) -> tuple[dict, dict]:
+        """
+        Pushes one trading day into the state.
+
+        :param values: SCREEN_FIELDS -> float64 arrays aligned with self.symbols (NaN when absent).
+        :return: (indicators, conditions) for the day, aligned with self.symbols.
+        """
+        close = values["close"]
+        scale = 10 ** PRICE_DECIMALS
+        cents = np.rint(close * scale)
+        valid = ~np.isnan(cents)
+        slot = self.days % HISTORY_SIZE
+
+        indicators = {}
+        for w in MA_WINDOWS:
+            if self.days >= w:
+                outgoing = self.closes[:, (self.days - w) % HISTORY_SIZE]
+                out_valid = ~np.isnan(outgoing)
+                self.sums[w] -= np.where(out_valid, outgoing, 0.0)
+                self.counts[w] -= out_valid
+            self.sums[w] += np.where(valid, cents, 0.0)
+            self.counts[w] += valid
+        self.closes[:, slot] = cents
+        self.days += 1
+
+        for w in MA_WINDOWS:
+            indicators[f"ma{w}"] = np.where(self.counts[w] == w, self.sums[w] / (w * scale), np.nan)
+
+        convergence = [indicators[f"ma{w}"] for w in CONVERGENCE_WINDOWS]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            indicators["max_ma"] = np.fmax.reduce(convergence)
+            indicators["min_ma"] = np.fmin.reduce(convergence)
+            indicators["zhanhe"] = (indicators["max_ma"] / indicators["min_ma"] - 1) * 100
+            self.zhanhe_flags[:, (self.days - 1) % FLAG_WINDOW] = indicators["zhanhe"] < 3
+
+            open_ = values["open"]
+            yesterday_close = values["yesterday_close"]
+            volume = values["volume"]
+            turnover_ratio = values["turnover_ratio"]
+            ma5, ma10, ma20, ma30 = (indicators[f"ma{w}"] for w in (5, 10, 20, 30))
+            ma60, ma120 = indicators["ma60"], indicators["ma120"]
+
+            conditions = {}
+            if self.days >= FLAG_WINDOW:
+                conditions["zhanhe_less_3"] = self.zhanhe_flags.sum(axis=1) >= 10
+            else:
+                conditions["zhanhe_less_3"] = np.zeros(len(self.symbols), dtype=bool)
+            conditions["rise_5"] = (close - yesterday_close) / yesterday_close > 0.05
+            conditions["vol_up"] = volume > self.prev_volume * 1.5
+            above2 = (close > ma5) & (close > ma10)
+            below2 = (open_ < ma5) | (open_ < ma10)
+            above3 = above2 & (close > ma20)
+            below3 = below2 | (open_ < ma20)
+            above4 = above3 & (close > ma30)
+            below4 = below3 | (open_ < ma30)
+            conditions["break_ma"] = (above2 & below2) | (above3 & below3) | (above4 & below4)
+            conditions["turnover_ratio_condition"] = (turnover_ratio >= 2) & (turnover_ratio <= 5)
+            conditions["golden_cross"] = (ma60 > ma120) & (self.prev_ma60 <= self.prev_ma120)
+
+        self.prev_volume = volume.copy()
+        self.prev_ma60 = ma60
+        self.prev_ma120 = ma120
+        return indicators, conditions
+
+    def update(self, day_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Advances the state by one trade_date.
+
+        :param day_df: stock_data rows of a single trade_date, newer than last_trade_date.
+        :return: The day's rows with indicator and condition columns appended.
+        """
+        trade_date = pd.Timestamp(day_df["trade_date"].iloc[0]).date()
+        if self.last_trade_date is not None and trade_date <= self.last_trade_date:
+            raise ValueError(f"Trade date {trade_date} is not after {self.last_trade_date}")
+
+        self._add_symbols(day_df["symbol"].tolist())
+        columns = np.array([self._columns[s] for s in day_df["symbol"]], dtype=np.int64)
+        values = {}
+        for field in SCREEN_FIELDS:
+            aligned = np.full(len(self.symbols), np.nan)
+            aligned[columns] = day_df[field].to_numpy(dtype=np.float64, na_value=np.nan)
+            values[field] = aligned
+
+        indicators, conditions = self._advance(values)
+        self.last_trade_date = trade_date
+        self.latest = _attach(day_df, columns, indicators, conditions)
+        return self.latest
+
+    def preview(self, day_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Computes what `update(day_df)` would return without advancing this state,
+        e.g. for provisional intraday screening on top of the last closed day.
+
+        :param day_df: stock_data rows of a single trade_date, newer than last_trade_date.
+        :return: The day's rows with indicator and condition columns appended.
+        """
+        return copy.deepcopy(self).update(day_df)
+
+    def screen(self) -> pd.DataFrame:
+        """
+        Returns the latest day's rows that satisfy every condition.
+
+        :return: The latest rows with their indicator and condition columns; empty when the state holds no data.
+        """
+        if self.latest is None:
+            return pd.DataFrame()
+        selected = np.logical_and.reduce([self.latest[c].to_numpy() for c in CONDITION_COLUMNS])
+        return self.latest[selected]
+
+    @classmethod
+    def replay(cls, df: pd.DataFrame, dates=None):
+        """
+        Replays every trade_date in `df` through the update path, yielding the state
+        after each requested day with `latest` set to that day's rows.
+
+        :param df: stock_data rows, any order, starting at least REBUILD_DAYS days before the first requested date.
+        :param dates: Trade dates to yield, defaults to every date in `df`.
+        :return: Generator of the (same, advancing) IndicatorState.
+        """
+        state = cls()
+        if df.empty:
+            return
+        wanted = None if dates is None else {pd.Timestamp(d).date() for d in dates}
+        matrix = pivot_fields(df)
+        state._add_symbols(list(matrix.symbols))
+        for t in range(len(matrix.dates)):
+            indicators, conditions = state._advance({f: matrix.fields[f][t] for f in SCREEN_FIELDS})
+            state.last_trade_date = pd.Timestamp(matrix.dates[t]).date()
+            if wanted is not None and state.last_trade_date not in wanted:
+                continue
+            rows = matrix.row_index[t]
+            present = rows >= 0
+            state.latest = _attach(df.iloc[rows[present]], np.flatnonzero(present), indicators, conditions)
+            yield state
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame) -> "IndicatorState":
+        """
+        Full rebuild: replays every trade_date in `df` through the same update path.
+
+        :param df: stock_data rows, any order, covering at least REBUILD_DAYS days for exact MA120.
+        :return: A new IndicatorState positioned at the last trade_date of `df`.
+        """
+        if df.empty:
+            return cls()
+        last = pd.Timestamp(df["trade_date"].max()).date()
+        for state in cls.replay(df, dates=[last]):
+            logger.info(
+                f"Rebuilt indicator state for {len(state.symbols)} symbols over {state.days} days "
+                f"up to {state.last_trade_date}"
+            )
+            return state
+
+    def equals(self, other: "IndicatorState") -> bool:
+        """Bit-for-bit comparison of the rolling state of both objects, aligned by symbol."""
+        if self.last_trade_date != other.last_trade_date or set(self.symbols) != set(other.symbols):
+            return False
+        order = np.array([other._columns[s] for s in self.symbols], dtype=np.int64)
+        pairs = [
+            (self.prev_volume, other.prev_volume[order]),
+            (self.prev_ma60, other.prev_ma60[order]),
+            (self.prev_ma120, other.prev_ma120[order]),
+        ]
+        pairs += [(self.sums[w], other.sums[w][order]) for w in MA_WINDOWS]
+        pairs += [(self.counts[w], other.counts[w][order]) for w in MA_WINDOWS]
+        if not all(np.array_equal(a, b, equal_nan=True) for a, b in pairs):
+            return False
+        # 两个状态推进的天数可能不同，按时间顺序比较环形缓冲区
+        mine = np.roll(self.closes, -(self.days % HISTORY_SIZE), axis=1)
+        theirs = np.roll(other.closes[order], -(other.days % HISTORY_SIZE), axis=1)
+        flags = np.roll(self.zhanhe_flags, -(self.days % FLAG_WINDOW), axis=1)
+        other_flags = np.roll(other.zhanhe_flags[order], -(other.days % FLAG_WINDOW), axis=1)
+        return np.array_equal(mine, theirs, equal_nan=True) and np.array_equal(flags, other_flags)
+
+
+def _attach(day_df: pd.DataFrame, columns: np.ndarray, indicators: dict, conditions: dict) -> pd.DataFrame:
+    """Appends the indicator and condition values at `columns` to a copy of the day's rows."""
+    frame = day_df.copy()
+    for name in INDICATOR_COLUMNS:
+        frame[name] = indicators[name][columns]
+    for name in CONDITION_COLUMNS:
+        frame[name] = conditions[name][columns]
+    return frame
@@ -0,0 +1,208 @@
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from database.bulk_loader import bulk_insert_frame
+from database.database_utils import db_session_scope
+from helpers.data_cleaner import clean_stock_data
+from helpers.market_time import in_trading_session, market_now
+from models.stock_model import IntradayTick
+from services.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 用于变化检测并写入 stock_intraday_ticks 的字段
+TICK_FIELDS = ("close", "change_percent", "volume", "turnover_value", "high", "low", "turnover_ratio")
+# 写库失败时最多保留的待写入行数，超出后丢弃最旧的数据
+MAX_PENDING_ROWS = 200_000
+
+
+class TickRing:
+    """
+    Fixed-size in-memory history of the last `size` distinct ticks of every symbol.
+
+    Memory is symbols x size x fields x 8 bytes no matter how long the collector
+    runs; older ticks are overwritten in place. `last` holds each symbol's most
+    recent tick and is what new polls are diffed against.
+    """
+
+    def __init__(self, size: int, fields=TICK_FIELDS):
+        self.size = size
+        self.fields = tuple(fields)
+        self.reset()
+
+    def reset(self):
+        self.symbols = []
+        self._index = {}
+        self._allocate(0)
+
+    def _allocate(self, capacity: int):
+        n_fields = len(self.fields)
+        values = np.full((capacity, self.size, n_fields), np.nan)
+        times = np.zeros((capacity, self.size), dtype="datetime64[s]")
+        count = np.zeros(capacity, dtype=np.int64)
+        last = np.full((capacity, n_fields), np.nan)
+        if getattr(self, "values", None) is not None:
+            n = len(self.symbols)
+            values[:n], times[:n], count[:n], last[:n] = self.values[:n], self.times[:n], self.count[:n], self.last[:n]
+        self.values, self.times, self.count, self.last = values, times, count, last
+
+    def columns(self, symbols) -> np.ndarray:
+        """Row positions of `symbols`, adding symbols seen for the first time."""
+        new = [s for s in dict.fromkeys(symbols) if s not in self._index]
+        if new:
+            if len(self.symbols) + len(new) > len(self.count):
+                self._allocate(max(2 * len(self.count), len(self.symbols) + len(new)))
+            for s in new:
+                self._index[s] = len(self.symbols)
+                self.symbols.append(s)
+        return np.fromiter((self._index[s] for s in symbols), dtype=np.int64, count=len(symbols))
+
+    def push(self, columns: np.ndarray, values: np.ndarray, moment: datetime):
+        """Appends one tick for each symbol at `columns`; `values` is (len(columns), len(fields))."""
+        slots = self.count[columns] % self.size
+        self.values[columns, slots] = values
+        self.times[columns, slots] = np.datetime64(moment.replace(tzinfo=None), "s")
+        self.count[columns] += 1
+        self.last[columns] = values
+
+    def history(self, symbol: str) -> pd.DataFrame:
+        """Ticks of one symbol still held in the ring, oldest first."""
+        if symbol not in self._index:
+            return pd.DataFrame(columns=["tick_time", *self.fields])
+        i = self._index[symbol]
+        n = min(self.count[i], self.size)
+        order = (np.arange(self.count[i] - n, self.count[i])) % self.size
+        frame = pd.DataFrame(self.values[i, order], columns=list(self.fields))
+        frame.insert(0, "tick_time", self.times[i, order])
+        return frame
+
+
+class IntradayCollector:
+    """
+    Polls the real-time spot feed and persists only the symbols whose tick changed since the previous poll.
+
+    Each poll is diffed against the last tick of every symbol held in a TickRing;
+    changed rows get price_delta / volume_delta against that tick and are written
+    to stock_intraday_ticks through the bulk loader. Rows that fail to write are
+    retried on the next poll.
+    """
+
+    def __init__(self, fetcher: Optional[Callable[[], pd.DataFrame]] = None, ring_size: Optional[int] = None,
+                 batch_size: Optional[int] = None):
+        """
+        :param fetcher: Returns the cleaned spot data of the whole market, defaults to AkShare's stock_zh_a_spot_em.
+        :param ring_size: Ticks kept per symbol, defaults to SCHEDULER_CONFIG['intraday_ring_size'].
+        :param batch_size: Rows per insert batch, defaults to INGEST_CONFIG['batch_size'].
+        """
+        self.fetcher = fetcher or _fetch_spot
+        self.ring = TickRing(ring_size or config.SCHEDULER_CONFIG["intraday_ring_size"])
+        self.batch_size = batch_size or config.INGEST_CONFIG["batch_size"]
+        self.trade_date = None
+        self._pending = []
+        self._scales = [getattr(IntradayTick.__table__.c[f].type, "scale", None) for f in TICK_FIELDS]
+        self.stats = {"polls": 0, "changed_rows": 0, "written_rows": 0, "last_poll_seconds": None}
+        # 每次轮询后调用 listener(changed, df, moment)，用于实时推送
+        self.listeners = []
+
+    def poll_if_open(self):
+        """Scheduler entry point: polls only during a trading session of a trading day."""
+        now = market_now()
+        if in_trading_session(now) and not trading_calendar.is_holiday(now.date()):
+            self.poll(now)
+
+    def poll(self, moment: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Fetches one tick of the market, detects changes and persists them.
+
+        :param moment: Tick time, defaults to now in the exchange time zone.
+        :return: The changed rows (symbol, trade_date, tick_time, TICK_FIELDS, price_delta, volume_delta).
+        """
+        started = time.perf_counter()
+        moment = moment or market_now()
+        if moment.date() != self.trade_date:
+            # 新的交易日从空状态开始
+            self.ring.reset()
+            self.trade_date = moment.date()
+
+        df = self.fetcher()
+        if df.empty:
+            logger.warning("Intraday poll returned no data.")
+            return pd.DataFrame()
+
+        changed = self.detect(df, moment)
+        if not changed.empty:
+            self._pending.append(changed)
+        self.flush()
+        for listener in self.listeners:
+            try:
+                listener(changed, df, moment)
+            except Exception as e:
+                logger.error(f"Intraday listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+        self.stats["polls"] += 1
+        self.stats["changed_rows"] += len(changed)
+        self.stats["last_poll_seconds"] = round(time.perf_counter() - started, 4)
+        logger.info(f"Intraday poll at {moment:%H:%M:%S}: {len(changed)}/{len(df)} symbols changed.")
+        return changed
+
+    def detect(self, df: pd.DataFrame, moment: datetime) -> pd.DataFrame:
+        """Diffs one poll against the previous tick of every symbol and records the changed ones in the ring."""
+        columns = self.ring.columns(df["symbol"].tolist())
+        values = np.column_stack([
+            # 按数据库精度取整，避免浮点误差被当作变化
+            np.round(df[f].to_numpy(dtype=np.float64, na_value=np.nan), scale) if scale is not None
+            else df[f].to_numpy(dtype=np.float64, na_value=np.nan)
+            for f, scale in zip(TICK_FIELDS, self._scales)
+        ])
+        previous = self.ring.last[columns]
+        same = (values == previous) | (np.isnan(values) & np.isnan(previous))
+        rows = np.flatnonzero(~same.all(axis=1))
+        if len(rows) == 0:
+            return pd.DataFrame()
+
+        close, volume = TICK_FIELDS.index("close"), TICK_FIELDS.index("volume")
+        changed = pd.DataFrame({
+            "symbol": df["symbol"].to_numpy()[rows],
+            "trade_date": moment.date(),
+            "tick_time": moment.replace(tzinfo=None),
+        })
+        for i, field in enumerate(TICK_FIELDS):
+            changed[field] = values[rows, i]
+        changed["price_delta"] = values[rows, close] - previous[rows, close]
+        # 当日第一笔的成交量增量即为累计成交量
+        changed["volume_delta"] = values[rows, volume] - np.nan_to_num(previous[rows, volume])
+        for field in ("volume", "volume_delta"):
+            changed[field] = pd.array(changed[field].to_numpy(), dtype="Int64")
+
+        self.ring.push(columns[rows], values[rows], moment)
+        return changed
+
+    def flush(self):
+        """Writes pending rows; on failure keeps them (up to MAX_PENDING_ROWS) for the next poll."""
+        if not self._pending:
+            return
+        frame = pd.concat(self._pending, ignore_index=True)
+        try:
+            with db_session_scope() as db:
+                bulk_insert_frame(db.connection(), IntradayTick.__table__, frame, batch_size=self.batch_size)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(frame)} intraday ticks, will retry: {e}")
+            if len(frame) > MAX_PENDING_ROWS:
+                logger.warning(f"Dropping {len(frame) - MAX_PENDING_ROWS} oldest pending intraday ticks.")
+                frame = frame.iloc[-MAX_PENDING_ROWS:]
+            self._pending = [frame]
+            return
+        self._pending = []
+        self.stats["written_rows"] += len(frame)
+
+
+def _fetch_spot() -> pd.DataFrame:
+    import akshare as ak
+
+    return clean_stock_data(ak.stock_zh_a_spot_em())
@@ -0,0 +1,100 @@
+import logging
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from database.database_utils import db_session_scope
+from models.stock_model import StockData
+from services.broadcast_hub import hub, records
+from services.history_loader import load_history
+from services.indicator_state import IndicatorState
+from services.screening_engine import CONDITION_COLUMNS, INDICATOR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# 推送给客户端的盘中变化字段
+TICK_EVENT_COLUMNS = ["symbol", "tick_time", "close", "change_percent", "volume", "price_delta", "volume_delta"]
+# 推送的选股命中字段
+HIT_EVENT_COLUMNS = ["symbol", "name", "close", "change_percent", "volume", "turnover_ratio", *INDICATOR_COLUMNS]
+
+
+class LiveScreen:
+    """
+    Provisional intraday screen: today's live quotes on top of the indicator state of
+    the last closed trade date, diffed against the previous cycle's hits.
+    """
+
+    def __init__(self):
+        self.trade_date = None
+        self.state = None
+        self.hits = set()
+
+    def reset(self):
+        self.trade_date = None
+        self.state = None
+        self.hits = set()
+
+    def _ensure_state(self, trade_date: date):
+        if self.trade_date == trade_date:
+            return
+        with db_session_scope() as db:
+            previous = db.query(func.max(StockData.trade_date)).filter(StockData.trade_date < trade_date).scalar()
+            self.state = IndicatorState.from_history(load_history(db, previous)) if previous else IndicatorState()
+        self.trade_date = trade_date
+        self.hits = set()
+
+    def preview(self, df: pd.DataFrame, trade_date: date) -> pd.DataFrame:
+        """:return: The rows of `df` that would pass the screen if the day closed now."""
+        self._ensure_state(trade_date)
+        rows = self.state.preview(df.assign(trade_date=trade_date))
+        selected = np.logical_and.reduce([rows[c].to_numpy() for c in CONDITION_COLUMNS])
+        return rows[selected]
+
+    def diff(self, screened: pd.DataFrame) -> tuple:
+        """:return: (rows of newly matching symbols, symbols that no longer match); remembers the new hit set."""
+        current = set(screened["symbol"]) if not screened.empty else set()
+        added = screened[~screened["symbol"].isin(self.hits)] if not screened.empty else screened
+        removed = sorted(self.hits - current)
+        self.hits = current
+        return added, removed
+
+
+live_screen = LiveScreen()
+
+
+def publish_intraday_cycle(changed: pd.DataFrame, df: pd.DataFrame, moment: datetime, publisher=hub):
+    """
+    IntradayCollector listener: pushes the changed ticks and the screen hits that appeared
+    or disappeared in this cycle. Nothing is computed while no client is connected.
+
+    :param publisher: The local hub, or a DbEventPublisher when running in the worker process.
+    """
+    if not publisher.listening:
+        live_screen.reset()
+        return
+    if not changed.empty:
+        publisher.publish("ticks", records(changed[TICK_EVENT_COLUMNS]))
+
+    added, removed = live_screen.diff(live_screen.preview(df, moment.date()))
+    if not added.empty or removed:
+        publisher.publish("screen", {
+            "trade_date": moment.date(),
+            "provisional": True,
+            "added": records(added[[c for c in HIT_EVENT_COLUMNS if c in added.columns]]),
+            "removed": removed,
+        })
+
+
+def publish_daily_screen(screened: pd.DataFrame, trade_date, publisher=hub):
+    """Pushes the final screen of a saved trade date, as additions / removals against the last pushed hits."""
+    if not publisher.listening:
+        return
+    added, removed = live_screen.diff(screened)
+    publisher.publish("screen", {
+        "trade_date": trade_date,
+        "provisional": False,
+        "added": records(added[[c for c in HIT_EVENT_COLUMNS if c in added.columns]]),
+        "removed": removed,
+    })
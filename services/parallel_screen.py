@@ -0,0 +1,127 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+import config
+from services.screening_engine import CONDITION_COLUMNS, INDICATOR_COLUMNS, SCREEN_FIELDS, MarketMatrix, screen_hits
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """
+    :param workers: Process count; None reads SCREEN_CONFIG['workers'], 0 means every available core.
+    """
+    workers = config.SCREEN_CONFIG["workers"] if workers is None else workers
+    return available_cores() if workers <= 0 else workers
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool shared by every parallel screen of this process, created on first use.
+
+    Workers are spawned rather than forked: the API and worker processes run scheduler
+    and event-loop threads, which must not be duplicated into the children.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            logger.info(f"Started a screening pool with {workers} processes.")
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def shard_bounds(n_symbols: int, shards: int) -> list:
+    """Splits the symbol axis into `shards` contiguous [lo, hi) ranges of near-equal size."""
+    edges = np.linspace(0, n_symbols, shards + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+def _screen_shard(shm_name: str, shape: tuple, fields: tuple, lo: int, hi: int):
+    """Pool task: screens symbols [lo, hi) of the field block in shared memory."""
+    shm = SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        # 复制本分片的列为连续数组，随后即可释放共享内存的映射
+        shard_fields = {f: np.ascontiguousarray(block[i, :, lo:hi]) for i, f in enumerate(fields)}
+        del block
+    finally:
+        shm.close()
+    shard = MarketMatrix(dates=np.empty(shape[1]), symbols=np.empty(hi - lo), fields=shard_fields)
+    date_pos, symbol_pos, values = screen_hits(shard)
+    return date_pos, symbol_pos + lo, values
+
+
+def parallel_screen_hits(matrix: MarketMatrix, workers: Optional[int] = None):
+    """
+    screen_hits over symbol shards in a process pool.
+
+    The field matrices are copied once into a shared memory block that every task
+    maps by name, so no history is pickled; only the hits travel back. Shards are
+    independent because every window runs along the date axis of a single symbol.
+    Hits are merged in (date, symbol) order, identical to the single-process result.
+
+    :param matrix: MarketMatrix with at least SCREEN_FIELDS.
+    :param workers: Process count, see resolve_workers. Small universes run in-process.
+    :return: Same as screen_hits.
+    """
+    workers = resolve_workers(workers)
+    n_dates, n_symbols = matrix.shape
+    shards = min(workers, n_symbols // config.SCREEN_CONFIG["min_shard_symbols"])
+    if shards <= 1:
+        return screen_hits(matrix)
+
+    fields = SCREEN_FIELDS
+    shape = (len(fields), n_dates, n_symbols)
+    shm = SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float64).itemsize)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for i, field in enumerate(fields):
+            block[i] = matrix.fields[field]
+        del block
+
+        pool = get_pool(workers)
+        futures = [pool.submit(_screen_shard, shm.name, shape, fields, lo, hi) for lo, hi in shard_bounds(n_symbols, shards)]
+        parts = [f.result() for f in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    date_pos = np.concatenate([p[0] for p in parts])
+    symbol_pos = np.concatenate([p[1] for p in parts])
+    order = np.lexsort((symbol_pos, date_pos))
+    values = {
+        name: np.concatenate([p[2][name] for p in parts])[order]
+        for name in INDICATOR_COLUMNS + CONDITION_COLUMNS
+    }
+    return date_pos[order], symbol_pos[order], values
@@ -1,5 +1,17 @@
+from functools import partial
 from apscheduler.schedulers.background import BackgroundScheduler
+from database.advisory_lock import AdvisoryLock
+from services.backfill_queue import requeue_interrupted, run_queued_backfills
+from services.broadcast_hub import hub
 from services.data_collector import fetch_stock_data, save_stock_data
+from services.intraday_collector import IntradayCollector
+from services.live_screen import publish_daily_screen, publish_intraday_cycle
+from services.stock_analyzer import get_screened_stocks
+from services.trading_calendar import trading_calendar
+from helpers.market_time import market_now
+from helpers.snapshot_store import write_live_snapshot
+import config
+import threading
 import time
 import logging
 
@@ -7,11 +19,64 @@ logger = logging.getLogger(__name__)
 
 
 class SchedulerService:
-    def __init__(self):
+    def __init__(self, publisher=None, share_live_snapshot: bool = False):
+        """
+        :param publisher: Where stream events go: the local hub (default) or, in the worker, a DbEventPublisher.
+        :param share_live_snapshot: Write every intraday poll to the live snapshot read by API processes.
+        """
         self.scheduler = BackgroundScheduler()
+        self.publisher = publisher or hub
+        self.intraday = IntradayCollector()
+        self.intraday.listeners.append(partial(publish_intraday_cycle, publisher=self.publisher))
+        if share_live_snapshot:
+            self.intraday.listeners.append(_share_live_snapshot)
+        self.lock = AdvisoryLock(config.SCHEDULER_CONFIG["lock_name"])
+        self.leader = False
+        self._stopped = threading.Event()
+        self._leader_thread = None
+
+    def start_when_leader(self):
+        """
+        Runs the jobs only while this process holds the scheduler lock, so that however
+        many API or worker processes are started the jobs run exactly once. A background
+        thread retries the lock every SCHEDULER_CONFIG['lock_retry'] seconds and pauses
+        the jobs if the lock is lost (e.g. the database connection dropped).
+        """
+        self._leader_thread = threading.Thread(target=self._lead, name="scheduler-leader", daemon=True)
+        self._leader_thread.start()
+
+    def _lead(self):
+        interval = config.SCHEDULER_CONFIG["lock_retry"]
+        while not self._stopped.is_set():
+            try:
+                if not self.leader and self.lock.acquire():
+                    self.leader = True
+                    logger.info(f"Acquired scheduler lock {self.lock.name}, running scheduled jobs.")
+                    if self.scheduler.running:
+                        self.scheduler.resume()
+                    else:
+                        self.start_scheduler()
+                elif self.leader and not self.lock.held():
+                    self.leader = False
+                    self.scheduler.pause()
+                    logger.error(f"Lost scheduler lock {self.lock.name}, jobs paused until it is reacquired.")
+            except Exception as e:
+                logger.error(f"Scheduler lock check failed: {e}")
+            self._stopped.wait(interval)
 
     def start_scheduler(self):
         """Start the scheduler and add jobs"""
+        # 只有持有调度锁的进程会执行到这里，分区维护不会在多个进程中同时运行
+        self._maintain_partitions()
+        self.scheduler.add_job(
+            func=self._maintain_partitions,
+            trigger="cron",
+            hour=0,
+            minute=30,
+            second=0,
+            id="maintain_partitions",
+            replace_existing=True,
+        )
         self.scheduler.add_job(
             func=self._collect_data,
             trigger="cron",
@@ -21,6 +86,31 @@ class SchedulerService:
             id="collect_stock_data",
             replace_existing=True,
         )
+        if config.SCHEDULER_CONFIG["intraday_enabled"]:
+            # 盘中轮询：非交易时段的触发直接返回；上一次轮询未结束时跳过本次
+            self.scheduler.add_job(
+                func=self.intraday.poll_if_open,
+                trigger="interval",
+                seconds=config.SCHEDULER_CONFIG["intraday_interval"],
+                id="collect_intraday_ticks",
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True,
+            )
+        # API 进程提交的历史回补在这里执行；上一任 leader 中断的任务从检查点继续
+        try:
+            requeue_interrupted()
+        except Exception as e:
+            logger.error(f"Failed to requeue interrupted backfill jobs: {e}")
+        self.scheduler.add_job(
+            func=run_queued_backfills,
+            trigger="interval",
+            seconds=config.SCHEDULER_CONFIG["backfill_poll_interval"],
+            id="run_queued_backfills",
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True,
+        )
         self.scheduler.start()
         logger.info("Scheduler started")
 
@@ -30,18 +120,40 @@ class SchedulerService:
 
     def stop_scheduler(self):
         """Stop the scheduler"""
-        self.scheduler.shutdown()
+        self._stopped.set()
+        if self._leader_thread is not None:
+            self._leader_thread.join()
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        if self.leader:
+            self.lock.release()
+            self.leader = False
         logger.info("Scheduler stopped")
 
+    def _maintain_partitions(self):
+        """Splits pmax so stock_data has a partition for next year before its first row arrives (no-op when not partitioned)."""
+        import database
+        from database.migrations import ensure_partitions
+
+        try:
+            with database.engine.begin() as connection:
+                ensure_partitions(connection)
+        except Exception as e:
+            logger.error(f"Error maintaining stock_data partitions: {e}")
+
     def _collect_data(self):
         """Collect stock data at regular intervals"""
         try:
+            if trading_calendar.is_holiday(market_now().date()):
+                logger.info("Not a trading day, skipping data collection.")
+                return
             logger.info(
                 f"Collecting stock data at {time.strftime('%Y-%m-%d %H:%M:%S')}"
             )
             pd = fetch_stock_data()
             if not pd.empty:
                 save_stock_data(pd)
+                publish_daily_screen(get_screened_stocks(), pd["trade_date"].iloc[0], publisher=self.publisher)
             else:
                 logger.info("No data collected.")
         except Exception as e:
@@ -51,5 +163,14 @@ class SchedulerService:
         """Get current scheduler status"""
         return {
             "status": "running" if self.scheduler.running else "stopped",
+            "leader": self.leader,
             "job_count": len(self.scheduler.get_jobs()),
         }
+
+
+def _share_live_snapshot(changed, df, moment):
+    """IntradayCollector listener in the worker: hands the latest poll to the API processes' /stocks/today."""
+    from services.snapshot_cache import write_live_body
+
+    write_live_snapshot(df, moment.date())
+    write_live_body(df, moment.date())
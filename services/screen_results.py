@@ -0,0 +1,46 @@
+import logging
+
+from sqlalchemy import func, select
+
+from models.stock_model import StockData, StockIndicator
+
+logger = logging.getLogger(__name__)
+
+# 选股结果中附带的指标列与条件列，与 INDICATOR_COLUMNS + CONDITION_COLUMNS 顺序一致；
+# 这里从模型读取，API 进程查询选股结果时不必导入 numpy / pandas
+RESULT_INDICATOR_COLUMNS = tuple(
+    c.key for c in StockIndicator.__table__.columns if c.key not in ("symbol", "trade_date", "selected")
+)
+
+
+def screened_stocks_statement(trade_date):
+    """stock_data 行及其指标列，只包含 selected 为真的股票"""
+    indicator_columns = [getattr(StockIndicator, c) for c in RESULT_INDICATOR_COLUMNS]
+    return (
+        select(*StockData.__table__.columns, *indicator_columns)
+        .join(
+            StockIndicator,
+            (StockIndicator.symbol == StockData.symbol) & (StockIndicator.trade_date == StockData.trade_date),
+        )
+        .where(StockIndicator.trade_date == trade_date, StockIndicator.selected.is_(True))
+        # 按指标表的 symbol 排序，优化器才会从 (trade_date, selected) 索引出发，而不是沿日期索引扫全市场
+        .order_by(StockIndicator.symbol)
+    )
+
+
+async def get_screened_stocks_async(db):
+    """
+    get_screened_stocks 的异步版本，等待数据库时不占用线程池
+    :param db: AsyncSession
+    :return: 符合条件的股票记录列表
+    """
+    try:
+        latest_date = (await db.execute(select(func.max(StockIndicator.trade_date)))).scalar()
+        if latest_date is None:
+            logger.warning("No materialized indicators found.")
+            return []
+        result = await db.execute(screened_stocks_statement(latest_date))
+        return [dict(row) for row in result.mappings()]
+    except Exception as e:
+        logger.error(f"Error getting screened stocks: {e}")
+        return []
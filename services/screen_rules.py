@@ -0,0 +1,187 @@
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+import config
+from database.database_utils import db_session_scope
+from models.stock_model import ScreenRule, StockData
+from services.formula import FIELD_COLUMNS, Evaluator, Formula, FormulaError, compile_formula
+from services.history_loader import PRICE_COLUMNS, load_history
+from services.indicator_state import REBUILD_DAYS
+from services.screening_engine import pivot_fields
+
+logger = logging.getLogger(__name__)
+
+_MAS = "MA5:=MA(C,5); MA10:=MA(C,10); MA20:=MA(C,20); MA30:=MA(C,30); MA60:=MA(C,60);"
+# 内置规则：与 screening_engine.evaluate_conditions 逐项等价
+BUILTIN_RULES = {
+    "zhanhe_less_3": _MAS + "ZHANHE:=(MAX(MA5,MA10,MA20,MA30,MA60)/MIN(MA5,MA10,MA20,MA30,MA60)-1)*100;"
+                            "COUNT(ZHANHE<3,15)>=10",
+    "rise_5": "(C-YCLOSE)/YCLOSE>0.05",
+    "vol_up": "V>REF(V,1)*1.5",
+    "break_ma": _MAS + "A2:=C>MA5 AND C>MA10; B2:=O<MA5 OR O<MA10;"
+                       "A3:=A2 AND C>MA20; B3:=B2 OR O<MA20;"
+                       "A4:=A3 AND C>MA30; B4:=B3 OR O<MA30;"
+                       "(A2 AND B2) OR (A3 AND B3) OR (A4 AND B4)",
+    "turnover_ratio_condition": "TURNOVER>=2 AND TURNOVER<=5",
+    "golden_cross": "CROSS(MA(C,60),MA(C,120))",
+}
+# 加载历史时读取全部公式字段，新规则不会因缺少字段而重新加载
+RULE_PRICE_COLUMNS = PRICE_COLUMNS + ("high", "low")
+RULE_FIELDS = tuple(dict.fromkeys(FIELD_COLUMNS.values()))
+RULE_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]{0,49}$")
+
+
+def list_rules(db) -> list:
+    """Built-in and registered rules as dicts with name, formula, description, builtin and lookback."""
+    rules = [
+        {"name": name, "formula": text, "description": None, "builtin": True}
+        for name, text in BUILTIN_RULES.items()
+    ]
+    rules += [
+        {"name": r.name, "formula": r.formula, "description": r.description, "builtin": False}
+        for r in db.query(ScreenRule).order_by(ScreenRule.name)
+    ]
+    for rule in rules:
+        try:
+            rule["lookback"] = compile_formula(rule["formula"]).lookback
+        except FormulaError as e:
+            # 注册后 max_rule_lookback 被调低的规则仍然列出，但不能再用于选股
+            rule["lookback"], rule["error"] = None, str(e)
+    return rules
+
+
+def register_rule(db, name: str, formula: str, description: Optional[str] = None) -> Formula:
+    """
+    Compiles and stores a rule, replacing a registered rule of the same name.
+
+    :raise FormulaError: If the name is invalid or taken by a built-in rule, or the formula does not compile
+        or needs more history than SCREEN_CONFIG['max_rule_lookback'].
+    """
+    if not RULE_NAME.match(name):
+        raise FormulaError("Rule names start with a letter and contain only letters, digits and '_' (max. 50)")
+    if name in BUILTIN_RULES:
+        raise FormulaError(f"{name} is a built-in rule")
+    compiled = compile_formula(formula)
+    db.merge(ScreenRule(name=name, formula=formula, description=description))
+    db.commit()
+    logger.info(f"Registered screening rule {name} (lookback {compiled.lookback} days).")
+    return compiled
+
+
+def delete_rule(db, name: str) -> bool:
+    """:return: False if no registered rule has this name."""
+    deleted = db.query(ScreenRule).filter(ScreenRule.name == name).delete()
+    db.commit()
+    return deleted > 0
+
+
+def load_rules(db, names: list) -> dict:
+    """
+    :return: Rule name -> compiled Formula, in the order of `names`.
+    :raise KeyError: For names that are neither built-in nor registered.
+    :raise FormulaError: If a stored rule needs more history than SCREEN_CONFIG['max_rule_lookback'] allows.
+    """
+    formulas = {name: BUILTIN_RULES[name] for name in names if name in BUILTIN_RULES}
+    missing = [name for name in names if name not in formulas]
+    if missing:
+        stored = db.query(ScreenRule).filter(ScreenRule.name.in_(missing)).all()
+        formulas.update({r.name: r.formula for r in stored})
+    unknown = [name for name in names if name not in formulas]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    return {name: compile_formula(formulas[name]) for name in names}
+
+
+@dataclass
+class _Window:
+    end_date: object
+    days: int
+    loaded_at: float
+    evaluator: Evaluator
+
+
+class RuleScreener:
+    """
+    Runs compiled rules on the history window ending at a trade date.
+
+    The loaded matrix and the evaluator's memo of intermediate results are kept for
+    `SCREEN_CONFIG['rule_cache_ttl']` seconds, so screening another rule on the same
+    date loads nothing and computes only the operators it does not share with the
+    rules evaluated before (e.g. the MAs of the built-in rules are computed once).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window: Optional[_Window] = None
+
+    def invalidate(self):
+        with self._lock:
+            self._window = None
+
+    def _evaluator(self, db, end_date, days: int) -> Evaluator:
+        window = self._window
+        if (
+            window is not None
+            and window.end_date == end_date
+            and window.days >= days
+            and time.monotonic() - window.loaded_at < config.SCREEN_CONFIG["rule_cache_ttl"]
+        ):
+            return window.evaluator
+
+        df = load_history(db, end_date, days=days, price_columns=RULE_PRICE_COLUMNS)
+        evaluator = Evaluator(pivot_fields(df, RULE_FIELDS))
+        self._window = _Window(end_date=end_date, days=days, loaded_at=time.monotonic(), evaluator=evaluator)
+        logger.info(f"Loaded {days} trading days up to {end_date} for rule screening.")
+        return evaluator
+
+    def screen(self, formulas: dict, trade_date=None) -> pd.DataFrame:
+        """
+        Stocks for which every rule holds on `trade_date`.
+
+        :param formulas: Rule name -> compiled Formula, see load_rules.
+        :param trade_date: Defaults to the latest date in stock_data.
+        :return: DataFrame with symbol, trade_date and the rule fields on that date.
+        """
+        with db_session_scope() as db:
+            trade_date = trade_date or db.query(func.max(StockData.trade_date)).scalar()
+            if trade_date is None:
+                return pd.DataFrame()
+            # 至少加载重建指标所需的天数，大多数规则可以共用同一窗口
+            days = max([REBUILD_DAYS] + [f.lookback + 1 for f in formulas.values()])
+            with self._lock:
+                evaluator = self._evaluator(db, trade_date, days)
+                matrix = evaluator.matrix
+                if len(matrix.dates) == 0 or matrix.dates[-1] != np.datetime64(trade_date, "D"):
+                    return pd.DataFrame()
+                before = evaluator.computed
+                selected = np.logical_and.reduce([evaluator.evaluate(f)[-1] for f in formulas.values()])
+                logger.debug(f"Screened {list(formulas)} with {evaluator.computed - before} new operators.")
+
+        columns = {"symbol": matrix.symbols[selected], "trade_date": trade_date}
+        columns.update({field: matrix.fields[field][-1, selected] for field in RULE_FIELDS})
+        return pd.DataFrame(columns)
+
+    def stats(self) -> dict:
+        window = self._window
+        if window is None:
+            return {"end_date": None}
+        return {
+            "end_date": window.end_date,
+            "days": window.days,
+            "age": round(time.monotonic() - window.loaded_at, 1),
+            "cached_nodes": len(window.evaluator.memo),
+            "computed": window.evaluator.computed,
+            "reused": window.evaluator.reused,
+        }
+
+
+# 进程内共享的公式选股器
+rule_screener = RuleScreener()
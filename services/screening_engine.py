@@ -0,0 +1,316 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 均线周期
+MA_WINDOWS = (5, 10, 20, 30, 60, 120)
+# 参与粘合度计算的均线
+CONVERGENCE_WINDOWS = (5, 10, 20, 30, 60)
+# 选股需要的原始字段
+SCREEN_FIELDS = ("open", "close", "yesterday_close", "volume", "turnover_ratio")
+# 选股条件列，顺序与 stock_indicators 表的列一致
+CONDITION_COLUMNS = (
+    "zhanhe_less_3",
+    "rise_5",
+    "vol_up",
+    "break_ma",
+    "turnover_ratio_condition",
+    "golden_cross",
+)
+INDICATOR_COLUMNS = tuple(f"ma{w}" for w in MA_WINDOWS) + ("max_ma", "min_ma", "zhanhe")
+# 价格精度，与 StockData.close 的 DECIMAL(10, 2) 一致
+PRICE_DECIMALS = 2
+
+
+@dataclass
+class MarketMatrix:
+    """
+    Dense (date × symbol) view of stock history.
+
+    Every field is a float64 matrix with one row per trade_date and one column
+    per symbol; cells without a stored row are NaN. `row_index` maps each cell
+    back to its row in the source DataFrame (-1 when absent).
+    """
+
+    dates: np.ndarray
+    symbols: np.ndarray
+    fields: dict
+    row_index: np.ndarray = None
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+
+def pivot_fields(df: pd.DataFrame, fields=SCREEN_FIELDS) -> MarketMatrix:
+    """
+    将长表 (symbol, trade_date, ...) 转换为按字段划分的 (日期 × 股票) 矩阵
+    :param df: 包含 symbol、trade_date 及所需字段的 DataFrame
+    :param fields: 需要转换的字段
+    :return: MarketMatrix
+    """
+    date_codes, dates = pd.factorize(df["trade_date"], sort=True)
+    symbol_codes, symbols = pd.factorize(df["symbol"], sort=True)
+    shape = (len(dates), len(symbols))
+
+    matrices = {}
+    for field in fields:
+        matrix = np.full(shape, np.nan)
+        matrix[date_codes, symbol_codes] = df[field].to_numpy(dtype=np.float64, na_value=np.nan)
+        matrices[field] = matrix
+
+    row_index = np.full(shape, -1, dtype=np.int64)
+    row_index[date_codes, symbol_codes] = np.arange(len(df))
+
+    return MarketMatrix(
+        dates=np.asarray(pd.to_datetime(dates).values.astype("datetime64[D]")),
+        symbols=np.asarray(symbols, dtype=str),
+        fields=matrices,
+        row_index=row_index,
+    )
+
+
+def _window_sums(values: np.ndarray, decimals: int = None):
+    """
+    Prefix sums of the non-NaN values and of the valid-cell counts, with a leading zero row.
+
+    When `decimals` is given the values are summed as integers of 10**-decimals, which keeps
+    every window sum exact so equal averages compare equal (MA60 == MA120 on a tie).
+    """
+    valid = ~np.isnan(values)
+    if decimals is not None:
+        values = np.rint(values * 10 ** decimals)
+    # 不用 cumsum(out=...)：numpy 2.3.0 在 out 参数上泄漏引用，结果矩阵永远不会释放
+    sums = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    sums[1:] = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.zeros((values.shape[0] + 1,) + values.shape[1:], dtype=np.int64)
+    counts[1:] = np.cumsum(valid, axis=0)
+    return sums, counts, 10 ** (decimals or 0)
+
+
+def rolling_mean(values: np.ndarray, window: int, prefix=None) -> np.ndarray:
+    """
+    沿日期轴计算滚动均值，窗口内存在缺失值时结果为 NaN（与 pandas rolling 一致）
+    :param values: (日期 × 股票) 矩阵
+    :param window: 窗口大小
+    :param prefix: 可选，_window_sums 的结果，多个窗口共用时避免重复计算
+    :return: 与 values 同形状的矩阵
+    """
+    sums, counts, scale = prefix if prefix is not None else _window_sums(values)
+    out = np.full(values.shape, np.nan)
+    if window <= values.shape[0]:
+        window_sum = sums[window:] - sums[:-window]
+        window_count = counts[window:] - counts[:-window]
+        out[window - 1:] = np.where(window_count == window, window_sum / (window * scale), np.nan)
+    return out
+
+
+def rolling_count(flags: np.ndarray, window: int) -> np.ndarray:
+    """
+    沿日期轴统计窗口内为 True 的个数，不足一个窗口的位置为 NaN
+    :param flags: 布尔矩阵
+    :param window: 窗口大小
+    :return: float64 矩阵
+    """
+    counts = np.zeros((flags.shape[0] + 1,) + flags.shape[1:], dtype=np.int64)
+    counts[1:] = np.cumsum(flags, axis=0)
+    out = np.full(flags.shape, np.nan)
+    if window <= flags.shape[0]:
+        out[window - 1:] = counts[window:] - counts[:-window]
+    return out
+
+
+def shift(values: np.ndarray, periods: int = 1) -> np.ndarray:
+    """沿日期轴后移 periods 行，空出的位置填 NaN"""
+    out = np.full(values.shape, np.nan)
+    if periods < values.shape[0]:
+        out[periods:] = values[:-periods]
+    return out
+
+
+def compute_indicators(close: np.ndarray) -> dict:
+    """
+    计算均线及粘合度
+    :param close: 收盘价矩阵
+    :return: 包含 ma5..ma120、max_ma、min_ma、zhanhe 的字典
+    """
+    prefix = _window_sums(close, PRICE_DECIMALS)
+    indicators = {f"ma{w}": rolling_mean(close, w, prefix) for w in MA_WINDOWS}
+
+    # 与 DataFrame.max(axis=1) 一致：忽略 NaN，全部为 NaN 时结果为 NaN
+    convergence = [indicators[f"ma{w}"] for w in CONVERGENCE_WINDOWS]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        indicators["max_ma"] = np.fmax.reduce(convergence)
+        indicators["min_ma"] = np.fmin.reduce(convergence)
+        indicators["zhanhe"] = (indicators["max_ma"] / indicators["min_ma"] - 1) * 100
+    return indicators
+
+
+def evaluate_conditions(fields: dict, indicators: dict) -> dict:
+    """
+    按 TDX 公式计算各选股条件
+    :param fields: 原始字段矩阵
+    :param indicators: compute_indicators 的结果
+    :return: 条件名 -> 布尔矩阵
+    """
+    close = fields["close"]
+    open_ = fields["open"]
+    yesterday_close = fields["yesterday_close"]
+    volume = fields["volume"]
+    turnover_ratio = fields["turnover_ratio"]
+    ma5, ma10, ma20, ma30 = (indicators[f"ma{w}"] for w in (5, 10, 20, 30))
+    ma60, ma120 = indicators["ma60"], indicators["ma120"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        conditions = {}
+        # 均线粘合条件：近15天中至少有10天粘合度 < 3%
+        conditions["zhanhe_less_3"] = rolling_count(indicators["zhanhe"] < 3, 15) >= 10
+
+        # 放量大涨条件：涨幅 > 5% 且 成交量 > 昨日成交量 × 1.5 倍
+        conditions["rise_5"] = (close - yesterday_close) / yesterday_close > 0.05
+        conditions["vol_up"] = volume > shift(volume) * 1.5
+
+        # 阳线上穿多根均线条件
+        above2 = (close > ma5) & (close > ma10)
+        below2 = (open_ < ma5) | (open_ < ma10)
+        above3 = above2 & (close > ma20)
+        below3 = below2 | (open_ < ma20)
+        above4 = above3 & (close > ma30)
+        below4 = below3 | (open_ < ma30)
+        conditions["break_ma"] = (above2 & below2) | (above3 & below3) | (above4 & below4)
+
+        # 换手率条件
+        conditions["turnover_ratio_condition"] = (turnover_ratio >= 2) & (turnover_ratio <= 5)
+
+        # 长期均线金叉条件：MA60 上穿 MA120
+        conditions["golden_cross"] = (ma60 > ma120) & (shift(ma60) <= shift(ma120))
+    return conditions
+
+
+def screen_matrix(matrix: MarketMatrix):
+    """
+    在整个 (日期 × 股票) 矩阵上执行选股
+    :param matrix: MarketMatrix
+    :return: (indicators, conditions, selected) 其中 selected 为综合条件的布尔矩阵
+    """
+    indicators = compute_indicators(matrix.fields["close"])
+    conditions = evaluate_conditions(matrix.fields, indicators)
+    selected = np.logical_and.reduce([conditions[name] for name in CONDITION_COLUMNS])
+    return indicators, conditions, selected
+
+
+@dataclass
+class StrategyParams:
+    """Thresholds of one screen variant; the defaults are the TDX formula of evaluate_conditions."""
+
+    zhanhe_max: float = 3.0  # 粘合度上限 (%)
+    zhanhe_days: int = 10  # 窗口内至少满足粘合的天数
+    zhanhe_window: int = 15  # 粘合度计数窗口
+    rise_min: float = 0.05  # 涨幅下限
+    volume_ratio: float = 1.5  # 成交量相对昨日的倍数
+    turnover_min: float = 2.0  # 换手率下限
+    turnover_max: float = 5.0  # 换手率上限
+    require_break_ma: bool = True
+    require_golden_cross: bool = True
+
+    @property
+    def lookback(self) -> int:
+        """Trading days before the screened date that the variant reads."""
+        return max(max(MA_WINDOWS), max(CONVERGENCE_WINDOWS) + self.zhanhe_window - 1)
+
+
+def _zhanhe_counts(zhanhe: np.ndarray, row: int, thresholds: np.ndarray, windows: np.ndarray) -> np.ndarray:
+    """
+    Days with zhanhe < threshold in the `window` days ending at `row`, per strategy and symbol.
+
+    Strategies sharing a threshold share one cumulative count over the longest window, taken
+    backwards from `row` so each distinct (threshold, window) pair is a single row of it.
+    Memory stays at one (window × symbols) block whatever the number of strategies, and the
+    cost grows with the number of distinct thresholds rather than strategies.
+
+    :return: (strategies × symbols) int matrix.
+    """
+    span = int(windows.max())
+    block = zhanhe[max(row - span + 1, 0):row + 1]
+    pairs, pair_of = np.unique(np.column_stack([thresholds, windows]), axis=0, return_inverse=True)
+    pair_counts = np.empty((len(pairs), block.shape[1]), dtype=np.int32)
+    for threshold in np.unique(pairs[:, 0]):
+        below = block < threshold
+        rows = np.flatnonzero(pairs[:, 0] == threshold)
+        if len(rows) == 1:
+            pair_counts[rows[0]] = np.count_nonzero(below[-int(pairs[rows[0], 1]):], axis=0)
+            continue
+        # 从窗口末尾向前累加，窗口 w 的计数即第 w 行
+        suffix = np.cumsum(below[::-1], axis=0, dtype=np.int32)
+        for i in rows:
+            pair_counts[i] = suffix[min(int(pairs[i, 1]), len(suffix)) - 1]
+    return pair_counts[pair_of.ravel()]
+
+
+def evaluate_strategies(fields: dict, indicators: dict, strategies: list, row: int = -1) -> np.ndarray:
+    """
+    在同一组指标上一次性计算多组阈值的选股结果
+    阈值按策略堆叠为 (策略 × 1) 的数组与当日的股票向量广播比较，与阈值无关的条件只计算一次，
+    耗时基本不随策略数量增加
+    :param fields: 原始字段矩阵
+    :param indicators: compute_indicators 的结果
+    :param strategies: StrategyParams 列表
+    :param row: 评估的日期行，默认为最后一个交易日
+    :return: (策略 × 股票) 布尔矩阵
+    """
+    n_dates = fields["close"].shape[0]
+    row = row % n_dates
+
+    def param(name):
+        return np.array([getattr(s, name) for s in strategies], dtype=np.float64)[:, None]
+
+    close = fields["close"][row]
+    open_ = fields["open"][row]
+    yesterday_close = fields["yesterday_close"][row]
+    volume = fields["volume"][row]
+    previous_volume = fields["volume"][row - 1] if row > 0 else np.full_like(volume, np.nan)
+    turnover_ratio = fields["turnover_ratio"][row]
+    ma = {w: indicators[f"ma{w}"] for w in MA_WINDOWS}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        windows = np.array([s.zhanhe_window for s in strategies])
+        counts = _zhanhe_counts(indicators["zhanhe"], row, param("zhanhe_max")[:, 0], windows)
+        # 不足一个完整窗口时与 rolling_count 一致，条件不成立
+        selected = (counts >= param("zhanhe_days")) & (windows <= row + 1)[:, None]
+
+        selected &= (close - yesterday_close) / yesterday_close > param("rise_min")
+        selected &= volume > previous_volume * param("volume_ratio")
+        selected &= (turnover_ratio >= param("turnover_min")) & (turnover_ratio <= param("turnover_max"))
+
+        # 与阈值无关的条件
+        above2 = (close > ma[5][row]) & (close > ma[10][row])
+        below2 = (open_ < ma[5][row]) | (open_ < ma[10][row])
+        above3 = above2 & (close > ma[20][row])
+        below3 = below2 | (open_ < ma[20][row])
+        above4 = above3 & (close > ma[30][row])
+        below4 = below3 | (open_ < ma[30][row])
+        break_ma = (above2 & below2) | (above3 & below3) | (above4 & below4)
+        if row > 0:
+            golden_cross = (ma[60][row] > ma[120][row]) & (ma[60][row - 1] <= ma[120][row - 1])
+        else:
+            golden_cross = np.zeros_like(close, dtype=bool)
+
+    selected &= break_ma | ~param("require_break_ma").astype(bool)
+    selected &= golden_cross | ~param("require_golden_cross").astype(bool)
+    return selected
+
+
+def screen_hits(matrix: MarketMatrix):
+    """
+    执行选股并只保留命中的单元格
+    :param matrix: MarketMatrix
+    :return: (date_pos, symbol_pos, values)，按 (日期, 股票) 顺序；values 为指标列与条件列在命中位置的取值
+    """
+    indicators, conditions, selected = screen_matrix(matrix)
+    date_pos, symbol_pos = np.nonzero(selected)
+    values = {name: indicators[name][date_pos, symbol_pos] for name in INDICATOR_COLUMNS}
+    values.update({name: conditions[name][date_pos, symbol_pos] for name in CONDITION_COLUMNS})
+    return date_pos, symbol_pos, values
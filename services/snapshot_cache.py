@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
+
+import config
+from helpers.market_time import in_trading_session, is_final, market_now, next_session_start
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EMPTY_BODY = b"[]"
+# worker 在盘中快照目录中一并写入的 /stocks/today 响应体，API 进程直接读取，无需 pandas
+LIVE_BODY_FILE = "body.json"
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    rows: int
+    fetched_at: float  # time.time() of the fetch
+    expires_at: float  # time.time() after which the entry is stale; inf once the day's data is final
+
+
+def serialize_records(df: "pd.DataFrame") -> bytes:
+    """Serializes a day of stock data to the JSON body of /stocks/today (a list of records)."""
+    from helpers.data_cleaner import restore_precision
+
+    if df.empty:
+        return EMPTY_BODY
+    return restore_precision(df).to_json(orient="records", force_ascii=False, date_format="iso").encode("utf-8")
+
+
+class SnapshotCache:
+    """
+    Process-wide cache of one day's market data, stored as ready-to-send JSON bytes and keyed by trade date.
+
+    Entries fetched during a trading session expire after `ttl` seconds, entries fetched
+    between sessions at the next session start, and entries fetched once the day's
+    data is final never expire. Concurrent misses for the same key
+    share a single in-flight fetch, which runs in a worker thread so the event loop
+    is never blocked.
+    """
+
+    def __init__(self, loader: Optional[Callable[[bool], "pd.DataFrame"]] = None, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        """
+        :param loader: Called in a worker thread as loader(refresh) and returns the day's DataFrame;
+                       refresh=True asks it to bypass local snapshots. Defaults to the worker's live
+                       snapshot, then the latest stored day (fetch_stock_data when SCHEDULER_IN_API).
+        :param ttl: Seconds an intraday entry stays valid, defaults to CACHE_CONFIG['today_ttl'].
+        :param max_entries: Trade dates kept, defaults to CACHE_CONFIG['max_entries'].
+        """
+        self.loader = loader or _fetch_today
+        self.ttl = config.CACHE_CONFIG["today_ttl"] if ttl is None else ttl
+        self.max_entries = max_entries or config.CACHE_CONFIG["max_entries"]
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+        self.fetch_seconds = 0.0
+        self.last_fetch_seconds = None
+
+    def _fresh(self, entry: Optional[CacheEntry]) -> bool:
+        return entry is not None and time.time() < entry.expires_at
+
+    def _expires_at(self, key: date) -> float:
+        now = market_now()
+        if is_final(key, now):
+            return math.inf
+        if in_trading_session(now):
+            return time.time() + self.ttl
+        return next_session_start(now).timestamp()
+
+    async def get(self, trade_date: Optional[date] = None) -> bytes:
+        """
+        Returns the JSON body for `trade_date`, fetching it at most once across concurrent callers.
+
+        :param trade_date: Cache key, defaults to today in the exchange time zone.
+        """
+        key = trade_date or market_now().date()
+        entry = self._entries.get(key)
+        if self._fresh(entry):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.body
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a client disconnecting must not cancel the fetch the other waiters share
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: date) -> bytes:
+        expires_at = self._expires_at(key)
+        started = time.perf_counter()
+        try:
+            df = await asyncio.to_thread(self.loader, expires_at != math.inf)
+            body = await asyncio.to_thread(serialize_records, df)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to load market data for {key}: {e}")
+            return EMPTY_BODY
+        finally:
+            self.fetches += 1
+            self.last_fetch_seconds = time.perf_counter() - started
+            self.fetch_seconds += self.last_fetch_seconds
+
+        if df.empty:
+            # 获取失败不缓存，下一个请求重新获取
+            self.errors += 1
+            return EMPTY_BODY
+        self._entries[key] = CacheEntry(body, len(df), time.time(), expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"Cached {len(df)} rows ({len(body)} bytes) for {key} in {self.last_fetch_seconds:.3f}s")
+        return body
+
+    def prime_from_live(self, trade_date: Optional[date] = None) -> Optional[dict]:
+        """
+        Fills the entry of `trade_date` from the body the worker wrote with its latest
+        intraday poll, without fetching or parsing anything. The entry expires after
+        `ttl` like any intraday entry.
+
+        :param trade_date: Defaults to today in the exchange time zone.
+        :return: Rows and bytes of the primed entry, None if there is no recent live body.
+        """
+        key = trade_date or market_now().date()
+        live = read_live_body(key, max_age=2 * config.SCHEDULER_CONFIG["intraday_interval"])
+        if live is None:
+            return None
+        body, rows = live
+        self._entries[key] = CacheEntry(body, rows, time.time(), min(self._expires_at(key), time.time() + self.ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return {"rows": rows, "bytes": len(body)}
+
+    def invalidate(self, trade_date: Optional[date] = None):
+        """Drops one trade date, or every entry."""
+        if trade_date is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(trade_date, None)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+            "last_fetch_seconds": None if self.last_fetch_seconds is None else round(self.last_fetch_seconds, 4),
+            "avg_fetch_seconds": round(self.fetch_seconds / self.fetches, 4) if self.fetches else None,
+            "entries": [
+                {"trade_date": str(k), "rows": e.rows, "bytes": len(e.body), "final": e.expires_at == math.inf,
+                 "age_seconds": round(time.time() - e.fetched_at, 1)}
+                for k, e in self._entries.items()
+            ],
+        }
+
+
+def _live_dir(trade_date: date, base_dir: Optional[str] = None) -> Path:
+    # 与 helpers.snapshot_store.snapshot_path 的目录结构一致
+    return Path(base_dir or config.STORAGE_CONFIG["live_snapshot_dir"]) / trade_date.strftime("%Y%m%d")
+
+
+def _live_generation(path: Path) -> Path:
+    # 快照文件位于 CURRENT 指向的代目录 (helpers.snapshot_store)，早期版本直接写在日期目录中
+    pointer = path / "CURRENT"
+    return path / pointer.read_text(encoding="utf-8").strip() if pointer.exists() else path
+
+
+def write_live_body(df: "pd.DataFrame", trade_date: date, base_dir: Optional[str] = None):
+    """Writes the /stocks/today body of the worker's latest poll next to its live snapshot (atomically)."""
+    path = _live_dir(trade_date, base_dir)
+    tmp = path / f"{LIVE_BODY_FILE}.tmp-{os.getpid()}"
+    tmp.write_bytes(serialize_records(df))
+    os.replace(tmp, path / LIVE_BODY_FILE)
+
+
+def read_live_body(trade_date: date, max_age: float, base_dir: Optional[str] = None) -> Optional[tuple]:
+    """
+    :return: (body, rows) of the live snapshot of `trade_date` if the body was written at most `max_age` seconds ago.
+    """
+    path = _live_dir(trade_date, base_dir)
+    try:
+        if time.time() - (path / LIVE_BODY_FILE).stat().st_mtime > max_age:
+            return None
+        body = (path / LIVE_BODY_FILE).read_bytes()
+        rows = json.loads((_live_generation(path) / "meta.json").read_text(encoding="utf-8"))["rows"]
+        return body, rows
+    except (OSError, ValueError, KeyError) as e:
+        # 读取时恰好被 worker 替换
+        logger.debug(f"Live body of {trade_date} not readable: {e}")
+        return None
+
+
+def load_stored_day(trade_date: date) -> "pd.DataFrame":
+    """
+    Loads a day the worker has stored: its closing snapshot if this host has one,
+    otherwise its stock_data rows. Nothing is fetched from AkShare.
+
+    :return: DataFrame in the layout of load_snapshot, empty when the day is not stored yet.
+    """
+    import pandas as pd
+    from sqlalchemy import select
+
+    from database.database_utils import db_session_scope
+    from helpers.data_cleaner import CLEAN_SCHEMA, clean_stock_data
+    from helpers.snapshot_store import load_snapshot
+    from models.stock_model import StockData
+
+    snapshot = load_snapshot(trade_date)
+    if snapshot is not None:
+        return snapshot
+    stmt = select(*[getattr(StockData, c) for c in CLEAN_SCHEMA]).where(StockData.trade_date == trade_date)
+    with db_session_scope() as db:
+        df = pd.read_sql(stmt, db.connection())
+    if df.empty:
+        return df
+    df = clean_stock_data(df)
+    df["trade_date"] = trade_date.strftime("%Y-%m-%d")
+    return df
+
+
+def _fetch_today(refresh: bool) -> "pd.DataFrame":
+    if refresh:
+        # 盘中优先读取 worker 共享的最新一次轮询，避免每个 API 进程各自请求 AkShare
+        from helpers.snapshot_store import load_live_snapshot
+
+        live = load_live_snapshot(market_now().date(), max_age=2 * config.SCHEDULER_CONFIG["intraday_interval"])
+        if live is not None:
+            return live
+    if config.SCHEDULER_CONFIG["run_in_api"]:
+        # 定时任务在本进程中运行时，本进程就是采集进程
+        from services.data_collector import fetch_stock_data
+
+        return fetch_stock_data(refresh=refresh)
+
+    # 否则只读取 worker 已保存的最近一个完整交易日；尚未保存时返回空结果，且不缓存
+    from services.trading_calendar import trading_calendar
+
+    latest = trading_calendar.prev_trading_day(market_now().date(), inclusive=not refresh)
+    if latest is None:
+        import pandas as pd
+
+        logger.warning("The trading calendar is empty, no stored market data to serve yet.")
+        return pd.DataFrame()
+    return load_stored_day(latest)
+
+
+# 进程内共享的 /stocks/today 缓存
+today_cache = SnapshotCache()
@@ -1,96 +1,190 @@
 import pandas as pd
 import numpy as np
-from models.stock_model import StockData
-from database import SessionLocal
+from sqlalchemy import func
+from models.stock_model import StockData, StockIndicator
+from database.database_utils import db_session_scope
+from services.screening_engine import (
+    CONDITION_COLUMNS,
+    INDICATOR_COLUMNS,
+    compute_indicators,
+    evaluate_strategies,
+    pivot_fields,
+    screen_matrix,
+)
+from services.indicator_state import REBUILD_DAYS, IndicatorState
+from services.history_cube import open_history_cube
+from services.history_loader import load_history, window_start_date
+from services.screen_results import screened_stocks_statement
+import logging
 
-def calculate_moving_averages(df):
+logger = logging.getLogger(__name__)
+
+def compute_indicators_for_date(db, trade_date):
     """
-    计算常用移动平均线
-    :param df: 包含股票数据的 DataFrame
-    :return: 添加了移动平均线的 DataFrame
+    根据前120个交易日的历史数据计算指定交易日的指标与选股条件
+    :param db: 数据库会话
+    :param trade_date: 交易日期
+    :return: 当日各股票的数据行，附带指标列和条件列
     """
-    df['ma5'] = df['close'].rolling(window=5).mean()
-    df['ma10'] = df['close'].rolling(window=10).mean()
-    df['ma20'] = df['close'].rolling(window=20).mean()
-    df['ma30'] = df['close'].rolling(window=30).mean()
-    df['ma60'] = df['close'].rolling(window=60).mean()
-    df['ma120'] = df['close'].rolling(window=120).mean()
-    return df
-
-def calculate_convergence(df):
+    state = IndicatorState.from_history(load_history(db, trade_date))
+    if state.latest is None or state.last_trade_date != pd.Timestamp(trade_date).date():
+        return pd.DataFrame()
+    return state.latest
+
+
+def materialize_indicators(db, trade_date):
     """
-    计算均线粘合度
-    :param df: 包含移动平均线的 DataFrame
-    :return: 添加了粘合度指标的 DataFrame
+    计算并写入指定交易日的 stock_indicators，已有记录会被替换
+    在 save_stock_data 的同一事务中调用
+    :param db: 数据库会话
+    :param trade_date: 交易日期
+    :return: 写入的记录数
     """
-    # 计算最大值和最小值
-    df['max_ma'] = df[['ma5', 'ma10', 'ma20', 'ma30', 'ma60']].max(axis=1)
-    df['min_ma'] = df[['ma5', 'ma10', 'ma20', 'ma30', 'ma60']].min(axis=1)
-    
-    # 计算粘合度
-    df['zhanhe'] = (df['max_ma'] / df['min_ma'] - 1) * 100
-    
-    return df
-
-def screen_stocks(df):
+    return _write_indicators(db, trade_date, compute_indicators_for_date(db, trade_date))
+
+
+def _write_indicators(db, trade_date, latest):
+    """用一个交易日的指标行替换 stock_indicators 中该日的记录"""
+    db.query(StockIndicator).filter(StockIndicator.trade_date == trade_date).delete(synchronize_session=False)
+    if latest.empty:
+        return 0
+
+    frame = latest[["symbol", "trade_date", *INDICATOR_COLUMNS, *CONDITION_COLUMNS]].copy()
+    frame["trade_date"] = pd.to_datetime(frame["trade_date"]).dt.date
+    frame["selected"] = np.logical_and.reduce([frame[c].to_numpy() for c in CONDITION_COLUMNS])
+    # NaN 不能写入数据库，转为 NULL
+    frame = frame.astype(object).where(frame.notna(), None)
+    db.bulk_insert_mappings(StockIndicator.__mapper__, frame.to_dict(orient="records"))
+    logger.info(f"Materialized {len(frame)} indicator rows for {trade_date}.")
+    return len(frame)
+
+
+def rematerialize_indicators(db, changed_dates):
     """
-    根据TDX公式筛选符合条件的股票
-    :param df: 包含股票数据的 DataFrame
-    :return: 符合条件的股票 DataFrame
+    数据被修改后重新计算受影响交易日的指标
+    某日的收盘价会影响其后 REBUILD_DAYS 个交易日内的均线与条件，这些日期一并重算
+    整个区间的历史只读取一次，按日推进滚动状态，结果与逐日调用 materialize_indicators 相同
+    :param db: 数据库会话
+    :param changed_dates: 数据有变化的交易日期
+    :return: 重新计算的交易日期列表（按时间顺序）
     """
-    # 计算移动平均线
-    df = calculate_moving_averages(df)
-    
-    # 计算粘合度
-    df = calculate_convergence(df)
-    
-    # 均线粘合条件：近15天中至少有10天粘合度 < 3%，并且当前也满足该条件
-    df['zhanhe_less_3'] = (df['zhanhe'] < 3).rolling(15).sum() >= 10
-    
-    # 放量大涨条件：涨幅 > 5% 且 成交量 > 昨日成交量 × 1.5 倍
-    df['rise_5'] = (df['close'] - df['yesterday_close']) / df['yesterday_close'] > 0.05
-    df['vol_up'] = df['volume'] > df['volume'].shift(1) * 1.5
-    
-    # 阳线上穿多根均线条件
-    up2 = (df['close'] > df['ma5']) & (df['close'] > df['ma10']) & ((df['open'] < df['ma5']) | (df['open'] < df['ma10']))
-    up3 = (df['close'] > df['ma5']) & (df['close'] > df['ma10']) & (df['close'] > df['ma20']) & ((df['open'] < df['ma5']) | (df['open'] < df['ma10']) | (df['open'] < df['ma20']))
-    up4 = (df['close'] > df['ma5']) & (df['close'] > df['ma10']) & (df['close'] > df['ma20']) & (df['close'] > df['ma30']) & ((df['open'] < df['ma5']) | (df['open'] < df['ma10']) | (df['open'] < df['ma20']) | (df['open'] < df['ma30']))
-    df['break_ma'] = up2 | up3 | up4
-    
-    # 换手率倍增条件：当前换手率是前一日的 2~5 倍
-    df['turnover_ratio_condition'] = (df['turnover_ratio'] >= 2) & (df['turnover_ratio'] <= 5)
-    
-    # 长期均线金叉条件：MA60 上穿 MA120
-    df['golden_cross'] = (df['ma60'] > df['ma120']) & (df['ma60'].shift(1) <= df['ma120'].shift(1))
-    
-    # 综合选股条件
-    selected_stocks = df[
-        df['zhanhe_less_3'] &
-        df['rise_5'] &
-        df['vol_up'] &
-        df['break_ma'] &
-        df['turnover_ratio_condition'] &
-        df['golden_cross']
+    changed = {pd.Timestamp(d).date() for d in changed_dates}
+    if not changed:
+        return []
+    stored = [
+        d for (d,) in db.query(StockData.trade_date)
+        .filter(StockData.trade_date >= min(changed))
+        .distinct()
+        .order_by(StockData.trade_date)
     ]
-    
-    return selected_stocks
+
+    refresh = []
+    since_change = REBUILD_DAYS
+    for d in stored:
+        since_change = 0 if d in changed else since_change + 1
+        if since_change < REBUILD_DAYS:
+            refresh.append(d)
+    if not refresh:
+        return []
+
+    history = load_history(db, refresh[-1], start_date=window_start_date(db, refresh[0]))
+    for state in IndicatorState.replay(history, dates=refresh):
+        _write_indicators(db, state.last_trade_date, state.latest)
+    return refresh
+
+
+def verify_materialized_indicators(trade_date=None):
+    """
+    用历史数据重新计算并与 stock_indicators 中的记录逐位比较
+    :param trade_date: 可选，默认为最新的交易日
+    :return: True if identical
+    """
+    with db_session_scope() as db:
+        trade_date = trade_date or db.query(func.max(StockIndicator.trade_date)).scalar()
+        if trade_date is None:
+            return True
+        expected = compute_indicators_for_date(db, trade_date).set_index("symbol").sort_index()
+        stored = pd.read_sql(
+            db.query(StockIndicator).filter(StockIndicator.trade_date == trade_date).statement, db.connection()
+        ).set_index("symbol").sort_index()
+
+    identical = expected.index.equals(stored.index) and all(
+        np.array_equal(
+            expected[c].to_numpy(dtype=np.float64), stored[c].to_numpy(dtype=np.float64, na_value=np.nan), equal_nan=True
+        )
+        for c in INDICATOR_COLUMNS + CONDITION_COLUMNS
+    )
+    if not identical:
+        logger.error(f"Materialized indicators for {trade_date} differ from a recomputation.")
+    return identical
+
+
+def screen_cube_window(end_date=None, days=REBUILD_DAYS, cube=None):
+    """
+    直接在本地历史数据立方体上筛选指定交易日的股票，不访问数据库
+    :param end_date: 交易日期，默认为立方体中最新的交易日
+    :param days: 读取的交易日数量
+    :param cube: 可选，已打开的 HistoryCube
+    :return: 当日命中的股票 (symbol, trade_date, 指标列, 条件列)，立方体不存在时返回空 DataFrame
+    """
+    cube = cube or open_history_cube()
+    if cube is None or not cube.dates:
+        logger.warning("History cube is not available.")
+        return pd.DataFrame()
+    cube.refresh()
+
+    matrix = cube.matrix(end_date, days)
+    indicators, conditions, selected = screen_matrix(matrix)
+    hits = np.flatnonzero(selected[-1])
+    result = pd.DataFrame({"symbol": matrix.symbols[hits], "trade_date": matrix.dates[-1]})
+    for name in INDICATOR_COLUMNS:
+        result[name] = indicators[name][-1, hits]
+    for name in CONDITION_COLUMNS:
+        result[name] = conditions[name][-1, hits]
+    return result
+
+
+def screen_strategies(strategies, trade_date=None):
+    """
+    一次读取历史、一次计算均线，在同一次向量化计算中评估多组选股阈值
+    :param strategies: StrategyParams 列表
+    :param trade_date: 交易日期，默认为最新的交易日
+    :return: (交易日期, 每个策略命中的股票代码列表)，没有数据时交易日期为 None
+    """
+    with db_session_scope() as db:
+        trade_date = trade_date or db.query(func.max(StockData.trade_date)).scalar()
+        if trade_date is None or not strategies:
+            return trade_date, [[] for _ in strategies]
+        days = max(REBUILD_DAYS, max(s.lookback for s in strategies) + 1)
+        history = load_history(db, trade_date, days)
+
+    if history.empty:
+        return trade_date, [[] for _ in strategies]
+    matrix = pivot_fields(history)
+    if matrix.dates[-1] != np.datetime64(trade_date, "D"):
+        logger.warning(f"No stock data stored for {trade_date}.")
+        return trade_date, [[] for _ in strategies]
+
+    indicators = compute_indicators(matrix.fields["close"])
+    selected = evaluate_strategies(matrix.fields, indicators, strategies)
+    logger.debug(f"Evaluated {len(strategies)} strategies on {matrix.shape[1]} symbols for {trade_date}.")
+    return trade_date, [matrix.symbols[hits].tolist() for hits in selected]
+
 
 def get_screened_stocks():
     """
-    获取并筛选符合条件的股票
+    获取最新交易日符合条件的股票
+    指标已在入库时写入 stock_indicators，这里只执行按 (trade_date, selected) 索引的过滤
     :return: 符合条件的股票 DataFrame
     """
-    db = SessionLocal()
     try:
-        # 查询最新股票数据
-        df = pd.read_sql(db.query(StockData).statement, db.bind)
-        
-        # 筛选符合条件的股票
-        selected_stocks = screen_stocks(df)
-        
-        return selected_stocks
+        with db_session_scope() as db:
+            latest_date = db.query(func.max(StockIndicator.trade_date)).scalar()
+            if latest_date is None:
+                logger.warning("No materialized indicators found.")
+                return pd.DataFrame()
+
+            return pd.read_sql(screened_stocks_statement(latest_date), db.connection())
     except Exception as e:
-        print(f"Error getting screened stocks: {e}")
+        logger.error(f"Error getting screened stocks: {e}")
         return pd.DataFrame()
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import func
+
+import config
+from database.database_utils import db_session_scope
+from models.stock_model import TradingCalendar
+
+logger = logging.getLogger(__name__)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    # 其它类型 (numpy.datetime64 等) 交给 pandas，API 进程只传入 date
+    import pandas as pd
+
+    return pd.Timestamp(value).date()
+
+
+class TradingCalendarService:
+    """
+    The trading_calendar table as a sorted in-memory list of dates.
+
+    The whole table (a few thousand rows) is loaded on first use and every lookup is
+    a bisect over that list. sync_trading_calendar calls `invalidate()` in the process
+    that changed the table; every other process notices the change on its own, since
+    the row count and first / last date are re-read every `check_interval` seconds (on
+    every lookup while the table is empty) and the list is reloaded when they differ.
+    If the table is empty it is seeded once from AkShare, unless `seed` is off (API
+    processes next to a worker leave that to the worker).
+    """
+
+    def __init__(self, seed: bool = True, check_interval: Optional[float] = None):
+        """
+        :param seed: Fill an empty table from AkShare.
+        :param check_interval: Seconds between checks for changes made by other processes,
+                               defaults to CACHE_CONFIG['calendar_check_interval'].
+        """
+        self._dates = None
+        self._check_after = 0.0
+        self._seeded = False
+        self._lock = threading.Lock()
+        self.seed = seed
+        self.check_interval = config.CACHE_CONFIG["calendar_check_interval"] if check_interval is None else check_interval
+
+    @property
+    def dates(self) -> list:
+        """All trading dates, ascending."""
+        if self._dates is None or time.monotonic() >= self._check_after:
+            with self._lock:
+                if self._dates is None or time.monotonic() >= self._check_after:
+                    self._refresh()
+        return self._dates
+
+    def _refresh(self):
+        if self._dates is None or self._changed():
+            self._dates = self._load()
+        # 日历为空时每次查询都检查 (只是一条计数查询)，worker 同步后立即生效
+        self._check_after = time.monotonic() + (self.check_interval if self._dates else 0)
+
+    def _changed(self) -> bool:
+        """Whether the table differs from the loaded dates in row count, first or last date."""
+        try:
+            with db_session_scope() as db:
+                count, first, last = db.query(
+                    func.count(TradingCalendar.trade_date),
+                    func.min(TradingCalendar.trade_date),
+                    func.max(TradingCalendar.trade_date),
+                ).one()
+        except Exception as e:
+            # 检查失败时继续使用已加载的日历
+            logger.error(f"Failed to check the trading calendar for changes: {e}")
+            return False
+        stored = (count, first and _as_date(first), last and _as_date(last))
+        loaded = (len(self._dates), self._dates[0], self._dates[-1]) if self._dates else (0, None, None)
+        if stored != loaded:
+            logger.info("The trading calendar table has changed, reloading it.")
+        return stored != loaded
+
+    def _load(self) -> list:
+        with db_session_scope() as db:
+            dates = [d for (d,) in db.query(TradingCalendar.trade_date).order_by(TradingCalendar.trade_date)]
+        if not dates and self.seed and not self._seeded:
+            self._seeded = True
+            dates = _seed_from_akshare()
+        logger.info(f"Loaded {len(dates)} trading dates" + (f" ({dates[0]} - {dates[-1]})." if dates else "."))
+        return dates
+
+    def invalidate(self):
+        """Drops the loaded dates; the next lookup reloads them from the database."""
+        with self._lock:
+            self._dates = None
+
+    def is_trading_day(self, day) -> bool:
+        """
+        :param day: date, datetime or ISO date string.
+        """
+        dates = self.dates
+        day = _as_date(day)
+        i = bisect_left(dates, day)
+        return i < len(dates) and dates[i] == day
+
+    def prev_trading_day(self, day, inclusive: bool = False) -> Optional[date]:
+        """
+        :param inclusive: Return `day` itself when it is a trading day.
+        :return: The last trading day before `day`, or None if the calendar starts later.
+        """
+        dates = self.dates
+        day = _as_date(day)
+        i = (bisect_right(dates, day) if inclusive else bisect_left(dates, day)) - 1
+        return dates[i] if i >= 0 else None
+
+    def next_trading_day(self, day, inclusive: bool = False) -> Optional[date]:
+        """
+        :param inclusive: Return `day` itself when it is a trading day.
+        :return: The first trading day after `day`, or None if the calendar ends earlier.
+        """
+        dates = self.dates
+        day = _as_date(day)
+        i = bisect_left(dates, day) if inclusive else bisect_right(dates, day)
+        return dates[i] if i < len(dates) else None
+
+    def trading_days_between(self, start, end) -> list:
+        """:return: Trading days in [start, end], ascending."""
+        dates = self.dates
+        return dates[bisect_left(dates, _as_date(start)):bisect_right(dates, _as_date(end))]
+
+    def nth_trading_day_before(self, day, n: int) -> Optional[date]:
+        """
+        Counts `n` trading days back from the last trading day on or before `day`
+        (n=0 is that day itself), e.g. the first day of an n+1 trading-day window ending at `day`.
+
+        :return: The trading day, or None if the calendar does not reach back that far.
+        """
+        dates = self.dates
+        i = bisect_right(dates, _as_date(day)) - 1 - n
+        return dates[i] if i >= 0 else None
+
+    def is_holiday(self, day) -> bool:
+        """Whether `day` is known to be closed: inside the calendar's range but not a trading day."""
+        return self.covers(day) and not self.is_trading_day(day)
+
+    def covers(self, day) -> bool:
+        """Whether `day` lies within the loaded calendar's first and last date."""
+        dates = self.dates
+        return bool(dates) and dates[0] <= _as_date(day) <= dates[-1]
+
+
+def _seed_from_akshare() -> list:
+    """Fills an empty trading_calendar table from AkShare; returns the dates, or [] if the fetch fails."""
+    try:
+        import akshare as ak
+
+        dates = sorted({_as_date(d) for d in ak.tool_trade_date_hist_sina()["trade_date"]})
+    except Exception as e:
+        logger.error(f"Failed to fetch the trading calendar from AkShare: {e}")
+        return []
+    with db_session_scope() as db:
+        db.add_all(TradingCalendar(trade_date=d) for d in dates)
+    logger.info(f"Seeded the trading calendar with {len(dates)} dates from AkShare.")
+    return dates
+
+
+# 进程内共享的交易日历
+trading_calendar = TradingCalendarService()
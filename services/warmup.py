@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StepResult:
+    name: str
+    status: str = "pending"  # pending, running, ok, failed, timeout, skipped
+    seconds: Optional[float] = None
+    detail: dict = field(default_factory=dict)
+
+
+async def _warm_calendar() -> dict:
+    from services.trading_calendar import trading_calendar
+
+    dates = await asyncio.to_thread(lambda: trading_calendar.dates)
+    return {"dates": len(dates), "last": str(dates[-1]) if dates else None}
+
+
+async def _warm_snapshot() -> dict:
+    from services.snapshot_cache import today_cache
+
+    if config.SCHEDULER_CONFIG["run_in_api"]:
+        body = await today_cache.get()
+        return {"bytes": len(body)}
+    # 定时任务在 worker 中运行时只读取它写入的盘中快照，API 进程不请求 AkShare、不导入 pandas
+    primed = await asyncio.to_thread(today_cache.prime_from_live)
+    return primed or {"skipped": "no recent live snapshot"}
+
+
+def _materialize_and_screen() -> dict:
+    from sqlalchemy import func
+
+    from database.database_utils import db_session_scope
+    from models.stock_model import StockData, StockIndicator
+    from services.stock_analyzer import get_screened_stocks, rematerialize_indicators
+
+    with db_session_scope() as db:
+        latest = db.query(func.max(StockData.trade_date)).scalar()
+        materialized = db.query(func.max(StockIndicator.trade_date)).scalar()
+        # 最新交易日的指标缺失时 (例如迁移后首次启动) 在这里补算，而不是留给第一个请求
+        refreshed = rematerialize_indicators(db, [latest]) if latest and latest != materialized else []
+    screened = get_screened_stocks()
+    return {"trade_date": str(latest) if latest else None, "rematerialized": len(refreshed), "hits": len(screened)}
+
+
+async def _warm_screen() -> dict:
+    if config.SCHEDULER_CONFIG["run_in_api"]:
+        return await asyncio.to_thread(_materialize_and_screen)
+    # 补算指标是 worker 的工作；这里只执行一次 /stocks/screened 的查询，预热异步连接池及索引页
+    from database.async_db import async_session
+    from services.screen_results import get_screened_stocks_async
+
+    async with async_session() as db:
+        screened = await get_screened_stocks_async(db)
+    return {"hits": len(screened)}
+
+
+# 可在 WARMUP_CONFIG['steps'] 中选择的预热步骤
+WARMUP_STEPS = {
+    "calendar": _warm_calendar,
+    "snapshot": _warm_snapshot,
+    "screen": _warm_screen,
+}
+
+
+class Warmup:
+    """
+    Runs the configured warmup steps in order at start-up and tracks readiness.
+
+    The instance is ready once every step has finished, whether it succeeded or
+    not; a failed or timed-out step is reported in `status()` so the first requests
+    simply pay the cold cost of that step instead of the instance never becoming ready.
+    """
+
+    def __init__(self, steps=None, step_timeout: Optional[float] = None):
+        """
+        :param steps: Step names from WARMUP_STEPS, defaults to WARMUP_CONFIG['steps'].
+        :param step_timeout: Seconds each step may take, defaults to WARMUP_CONFIG['step_timeout'].
+        """
+        names = config.WARMUP_CONFIG["steps"] if steps is None else steps
+        unknown = [n for n in names if n not in WARMUP_STEPS]
+        if unknown:
+            raise ValueError(f"Unknown warmup steps: {unknown}")
+        self.step_timeout = step_timeout or config.WARMUP_CONFIG["step_timeout"]
+        self.results = [StepResult(n) for n in names]
+        self.ready = False
+        self.seconds = None
+
+    async def run(self):
+        started = time.perf_counter()
+        for result in self.results:
+            result.status = "running"
+            step_started = time.perf_counter()
+            try:
+                result.detail = await asyncio.wait_for(WARMUP_STEPS[result.name](), timeout=self.step_timeout)
+                result.status = "ok"
+            except asyncio.TimeoutError:
+                result.status = "timeout"
+                logger.warning(f"Warmup step {result.name} timed out after {self.step_timeout}s.")
+            except Exception as e:
+                result.status = "failed"
+                result.detail = {"error": str(e)}
+                logger.error(f"Warmup step {result.name} failed: {e}")
+            result.seconds = round(time.perf_counter() - step_started, 4)
+            logger.info(f"Warmup step {result.name}: {result.status} in {result.seconds}s {result.detail}")
+        self.seconds = round(time.perf_counter() - started, 4)
+        self.ready = True
+        logger.info(f"Warmup finished in {self.seconds}s.")
+
+    def mark_ready(self):
+        """Skips warmup (WARMUP_CONFIG['enabled'] is false)."""
+        for result in self.results:
+            result.status = "skipped"
+        self.ready = True
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "seconds": self.seconds,
+            "steps": [asdict(r) for r in self.results],
+        }
+
+
+# 进程内的预热状态，/health/ready 据此返回
+warmup = Warmup()
@@ -0,0 +1,41 @@
+"""
+Collector / analyzer process: runs the scheduled jobs (daily collection, intraday polling)
+without serving HTTP, so they never compete with request handling in the API processes.
+
+Results reach the API processes through the database (stock_data, stock_indicators,
+stream_events) and the snapshot files (daily and live). Several workers can be started
+for failover: a MySQL advisory lock lets only one of them run the jobs at a time.
+
+    python worker.py
+"""
+import logging
+import signal
+import threading
+
+from app_logger import setup_logging
+
+setup_logging(log_level=logging.DEBUG, console=True)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    from database import init_db
+    from services.event_relay import DbEventPublisher
+    from services.scheduler_service import SchedulerService
+
+    init_db()
+    scheduler_service = SchedulerService(publisher=DbEventPublisher(), share_live_snapshot=True)
+    scheduler_service.start_when_leader()
+
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stopped.set())
+    logger.info("Worker started, waiting for scheduled jobs.")
+    stopped.wait()
+
+    logger.info("Shutting down the worker...")
+    scheduler_service.stop_scheduler()
+
+
+if __name__ == "__main__":
+    main()